@@ -0,0 +1,337 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+from cache_backend import make_backend
+from metrics import record_cache
+
+# Cache settings (override with environment variables)
+CACHE_ENABLED = os.getenv("NYAYA_ANSWER_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("NYAYA_ANSWER_CACHE_PATH", os.path.join(".nyaya_cache", "answers.json"))
+CACHE_TTL = float(os.getenv("NYAYA_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("NYAYA_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Calibrated on data/cache_pairs.jsonl (see `python answer_cache.py eval`)
+SIMILARITY_THRESHOLD = float(os.getenv("NYAYA_ANSWER_CACHE_THRESHOLD", "0.7"))
+CACHE_PAIRS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache_pairs.jsonl")
+
+# Repository analyses, keyed on the commit they describe (exact matches only)
+ANALYSIS_CACHE_ENABLED = os.getenv("NYAYA_ANALYSIS_CACHE", "1") != "0"
+ANALYSIS_CACHE_PATH = os.getenv("NYAYA_ANALYSIS_CACHE_PATH", os.path.join(".nyaya_cache", "analyses.json"))
+ANALYSIS_CACHE_TTL = float(os.getenv("NYAYA_ANALYSIS_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Words that don't change what a legal question is asking. Pronouns and
+# party or direction words ("my", "me", "from", "against", ...) are kept:
+# "can my employer sue me" is not "can I sue my employer".
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on",
+    "and", "or", "do", "does", "did", "can", "could", "should", "would",
+    "please", "what", "how", "tell", "about", "it", "this", "that", "as", "at",
+    "india", "indian",
+}
+
+EMBEDDING_DIM = 1 << 18
+
+# A near-duplicate must agree exactly on its numbers (sections, years), its
+# negations and the order of its parties; the embedding only judges the topic.
+# Two questions a word apart can have opposite answers: "if the first wife has
+# (not) given consent", "Section 438/439", "can my employer sue me / can I sue
+# my employer".
+NEGATIONS = {"not", "no", "without", "never", "nor", "non", "neither"}
+FIRST_PERSON = {"i", "me", "we", "us", "myself"}
+# Possessives ("my", "his", ...) are left out: "my FIR" names no party
+PARTIES = {
+    "you", "he", "him", "she", "her", "they", "them",
+    "husband", "wife", "son", "daughter", "father", "mother", "parent", "parents", "child", "children",
+    "employer", "employee", "landlord", "tenant", "buyer", "seller", "man", "woman", "men", "women",
+    "accused", "victim", "police",
+}
+
+# Words that frame how a question asks rather than what it asks about, and
+# the direction words the signature already checks; left out of embeddings
+# so "how to file FIR" and "FIR filing process" embed alike
+FRAMING = {
+    "process", "procedure", "steps", "step", "way", "ways", "method", "explain", "get", "do",
+    "to", "for", "from", "with", "by", "under", "if", "when", "i", "me", "my",
+}
+
+
+def normalize_question(question):
+    """Normalize a question so trivially different phrasings share a key"""
+    words = re.findall(r"[a-z0-9]+", question.lower())
+    return " ".join(w for w in words if w not in STOPWORDS)
+
+
+def question_signature(question):
+    """What a near-duplicate must share exactly: numbers, negations, and the
+    order of the parties when more than one is named"""
+    words = re.findall(r"[a-z0-9]+", question.lower().replace("n't", " not").replace("cannot", "can not"))
+    parties = []
+    for word in words:
+        party = "i" if word in FIRST_PERSON else word if word in PARTIES else None
+        if party and (not parties or parties[-1] != party):
+            parties.append(party)
+    return (tuple(sorted(word for word in words if any(c.isdigit() for c in word))),
+            tuple(sorted(word for word in words if word in NEGATIONS)),
+            tuple(parties) if len(set(parties)) > 1 else ())
+
+
+# Weight of each kind of feature (calibrated with `python answer_cache.py eval`)
+FEATURE_WEIGHTS = {"w": 2.0, "c": 1.0}
+
+
+def _stem(word):
+    # Crude stemming so "filing"/"file" and "rights"/"right" line up
+    for suffix in ("ing", "ed", "es", "s", "e"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def local_embedding(text):
+    """Embed text as a sparse, L2-normalised vector of hashed word and
+    character-trigram features. Runs locally with no API call."""
+    stems = [_stem(word) for word in normalize_question(text).split() if word not in FRAMING]
+    grams = []
+    for stem in stems:
+        grams += [f"w:{stem}"] + [f"c:{stem[i:i + 3]}" for i in range(max(1, len(stem) - 2))]
+    features = {}
+    for gram in grams:
+        index = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), "little") % EMBEDDING_DIM
+        features[index] = features.get(index, 0.0) + FEATURE_WEIGHTS[gram[0]]
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {k: v / norm for k, v in features.items()}
+
+
+def _as_sparse(vector):
+    if isinstance(vector, dict):
+        return vector
+    return {i: v for i, v in enumerate(vector) if v}
+
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two L2-normalised sparse vectors"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def question_similarity(a, b, embed=local_embedding):
+    """Similarity of two questions as the semantic tier judges it: 0.0 unless
+    their signatures match"""
+    if question_signature(a) != question_signature(b):
+        return 0.0
+    return cosine_similarity(_as_sparse(embed(a)), _as_sparse(embed(b)))
+
+
+class AnswerCache:
+    """Three-tier answer cache: exact question, normalized question and
+    nearest-neighbour embedding match, with TTL and LRU eviction. A
+    near-duplicate must also match the question's signature (numbers,
+    negations, parties) exactly. Entries live
+    in a cache backend (see cache_backend.py): by default in this process with
+    a JSON snapshot that survives restarts, or in a SQLite file shared by every
+    worker. The normalized and embedding tiers search a local index of the
+    stored entries, kept up to date with what other workers store. With
+    `embed=None` only exact and normalized matches are served."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 threshold=SIMILARITY_THRESHOLD, embed=local_embedding, name="answer", backend=None):
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.embed = embed
+        self.backend = backend or make_backend(name, max_entries, ttl, path)
+        self.stats = {"exact_hits": 0, "normalized_hits": 0, "semantic_hits": 0, "misses": 0}
+        # Reentrant: hits are counted both inside and outside index lookups
+        self._lock = threading.RLock()
+        # Index of the backend's entries: normalized key -> exact key, and exact
+        # key -> (namespace, signature, vector); entries evicted since are dropped when found missing
+        self._normalized = {}
+        self._vectors = {}
+        self._indexed = 0.0
+
+    @staticmethod
+    def _exact_key(namespace, question):
+        return f"{namespace}\x00{question.strip()}"
+
+    @staticmethod
+    def _normalized_key(namespace, question):
+        return f"{namespace}\x00{normalize_question(question)}"
+
+    def get(self, question, namespace=""):
+        """Return a cached answer for the question, or None on a miss"""
+        entry = self.backend.get(self._exact_key(namespace, question))
+        if entry is not None:
+            return self._hit(entry, "exact_hits")
+
+        with self._lock:
+            self._update_index()
+            key = self._normalized.get(self._normalized_key(namespace, question))
+            if key is not None:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return self._hit(entry, "normalized_hits")
+
+            if self.embed is not None and self.threshold <= 1.0:
+                vector = _as_sparse(self.embed(question))
+                signature = question_signature(question)
+                best_key, best_score = None, self.threshold
+                for candidate, (candidate_namespace, candidate_signature, candidate_vector) in self._vectors.items():
+                    if candidate_namespace != namespace or candidate_signature != signature:
+                        continue
+                    score = cosine_similarity(vector, candidate_vector)
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    entry = self._lookup(best_key)
+                    if entry is not None:
+                        return self._hit(entry, "semantic_hits")
+
+            self.stats["misses"] += 1
+        record_cache(self.name, "misses")
+        return None
+
+    def put(self, question, answer, namespace=""):
+        """Store an answer"""
+        self.backend.set(self._exact_key(namespace, question), self._entry(question, answer, namespace))
+
+    def get_or_compute(self, question, compute, namespace=""):
+        """The answer stored for exactly this question, or compute()'s answer,
+        stored. Only one caller computes a question at a time: across workers
+        too with a shared backend."""
+        def entry():
+            answer = compute()
+            return self._entry(question, answer, namespace) if answer is not None else None
+
+        entry = self.backend.get_or_compute(self._exact_key(namespace, question), entry)
+        return entry["answer"] if entry is not None else None
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self.backend.clear()
+            self._normalized.clear()
+            self._vectors.clear()
+
+    def summary(self):
+        """Hit/miss counts and hit rate for display"""
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["normalized_hits"] + self.stats["semantic_hits"]
+            total = hits + self.stats["misses"]
+            return dict(self.stats, hits=hits, entries=self.backend.count(), backend=self.backend.name,
+                        hit_rate=hits / total if total else 0.0)
+
+    def _entry(self, question, answer, namespace):
+        return {
+            "namespace": namespace,
+            "question": question.strip(),
+            "answer": answer,
+            "created": time.time(),
+            "vector": _as_sparse(self.embed(question)) if self.embed is not None else {},
+        }
+
+    def _hit(self, entry, tier):
+        with self._lock:
+            self.stats[tier] += 1
+        record_cache(self.name, tier)
+        return entry["answer"]
+
+    def _lookup(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            # Evicted or expired since it was indexed
+            self._vectors.pop(key, None)
+        return entry
+
+    def _update_index(self):
+        # Entries another worker (or this one) stored since the last update;
+        # the whole index is rebuilt once evicted keys could dominate it
+        if len(self._vectors) > 2 * self.max_entries:
+            self._normalized.clear()
+            self._vectors.clear()
+            self._indexed = 0.0
+        for key, entry, stored in self.backend.items(self._indexed):
+            self._normalized[self._normalized_key(entry["namespace"], entry["question"])] = key
+            # JSON stores the vector's indexes as strings
+            self._vectors[key] = (entry["namespace"], question_signature(entry["question"]),
+                                  {int(k): v for k, v in entry["vector"].items()})
+            self._indexed = stored
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Get the process-wide answer cache, or None when caching is disabled"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
+
+
+_analysis_cache = None
+
+
+def get_analysis_cache():
+    """Get the process-wide repository analysis cache, or None when disabled"""
+    global _analysis_cache
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _analysis_cache is None:
+            _analysis_cache = AnswerCache(path=ANALYSIS_CACHE_PATH, ttl=ANALYSIS_CACHE_TTL, embed=None,
+                                          name="analysis")
+        return _analysis_cache
+
+
+def evaluate_pairs(path=CACHE_PAIRS_PATH, threshold=SIMILARITY_THRESHOLD):
+    """Score labelled question pairs ({"a", "b", "same"} per JSONL line);
+    returns (score, accepted, pair) for each"""
+    results = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                pair = json.loads(line)
+                score = question_similarity(pair["a"], pair["b"])
+                results.append((score, score >= threshold, pair))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the semantic answer cache against labelled question pairs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    evaluate = commands.add_parser("eval", help="score paraphrase and non-paraphrase pairs")
+    evaluate.add_argument("path", nargs="?", default=CACHE_PAIRS_PATH)
+    evaluate.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == "eval":
+        results = evaluate_pairs(args.path, args.threshold)
+        for score, accepted, pair in sorted(results, key=lambda result: -result[0]):
+            verdict = "ok" if accepted == pair["same"] else "WRONG HIT" if accepted else "miss"
+            print(f"{score:.3f}  {verdict:9}  {pair['a']!r} / {pair['b']!r}")
+        wrong = sum(accepted and not pair["same"] for _, accepted, pair in results)
+        missed = sum(pair["same"] and not accepted for _, accepted, pair in results)
+        paraphrases = sum(pair["same"] for _, _, pair in results)
+        print(f"{len(results)} pairs at threshold {args.threshold}: {paraphrases - missed}/{paraphrases} "
+              f"paraphrases hit, {wrong} wrong hits")
+        # Serving another question's answer is the failure that matters
+        if wrong:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
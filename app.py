@@ -1,12 +1,26 @@
 import streamlit as st
-import openai
+import html
 import os
-from datetime import datetime
+import re
+import time
 import json
-from dotenv import load_dotenv
+from answer_cache import get_answer_cache
+from citations import annotate_html
+from conversation_store import get_conversation_store
+import engine_client
+from history import new_summary_state
+from intent_router import get_intent_router
+from key_validation import KEY_VALIDATION_MODE, get_key_validator, is_auth_error
+import metrics
+from resilience import is_unavailable
+from session_memory import Message, compact_messages, get_session_memory
+from startup import load_env
 
-# Load environment variables from .env file if present
-load_dotenv()
+# Load environment variables from .env file if present (once per process)
+load_env()
+
+# Serve Prometheus metrics from this process when NYAYA_METRICS_PORT is set
+metrics.start_metrics_server()
 
 # Page configuration
 st.set_page_config(
@@ -45,6 +59,14 @@ st.markdown("""
         text-align: left;
         max-width: 80%;
     }
+    .citation {
+        color: #1E3A8A;
+        text-decoration: underline dotted;
+    }
+    .citation-invalid {
+        color: #B91C1C;
+        text-decoration: underline wavy;
+    }
     .chat-timestamp {
         font-size: 0.8em;
         color: #888;
@@ -66,127 +88,194 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# NyayaBot system prompt
-NYAYABOT_SYSTEM_PROMPT = """You are "NyayaBot," an expert AI legal assistant specializing in Indian Judiciary Law. Respond to users' legal queries with the accuracy, clarity, and professionalism of a seasoned Indian lawyer. Provide concise, reliable, and up-to-date information on Indian laws, court procedures, and legal rights.
+GREETING = "Hello! I am NyayaBot, an expert AI legal assistant specializing in Indian Judiciary Law. How can I help you today?"
 
-Your knowledge covers:
-1. Indian Legal System - Constitution, judiciary structure, landmark cases
-2. Criminal Laws - IPC, CrPC, Evidence Act, FIR procedures
-3. Civil Laws - CPC, Contract Act, Property laws, tenancy rights
-4. Family Laws - Marriage, divorce, maintenance across different personal laws
-5. Consumer Protection - Rights, complaint procedures, remedies
-6. Constitutional Rights - Fundamental rights, remedies, enforcement
+# Messages shown before "Show earlier messages" is needed (override with NYAYA_CHAT_PAGE_SIZE)
+HISTORY_PAGE_SIZE = int(os.getenv("NYAYA_CHAT_PAGE_SIZE", "20"))
 
-Always follow these guidelines:
-1. Begin with a clear, direct answer to the legal question
-2. Provide relevant legal context and background
-3. Explain applicable laws, statutes, or precedents
-4. Use plain language with necessary legal terms explained
-5. Include citations to relevant statutes or case law when appropriate
-6. Suggest potential next steps or resources
+# Conversations are saved message by message (conversation_store.py) and
+# resumed from the ?c=<id> URL parameter. The session holds only a window of
+# the conversation: st.session_state.messages starts at message number
+# history_offset, and older messages are read back from the store on demand.
+def new_conversation():
+    st.session_state.conversation_id = None
+    st.session_state.messages = [Message("assistant", GREETING)]
+    st.session_state.history_offset = 0
+    st.session_state.history_summary = new_summary_state()
+    st.session_state.history_visible = HISTORY_PAGE_SIZE
+    # Pre-rendered HTML per message, parallel to st.session_state.messages
+    st.session_state.rendered_messages = []
+    st.query_params.pop("c", None)
 
-Always end your response with this disclaimer: "Please note that this information is provided for educational purposes only and does not constitute legal advice. For specific legal concerns, please consult with a qualified legal professional who can provide personalized guidance based on your particular situation."
-
-For complex matters, use this enhanced disclaimer: "This matter involves complex legal considerations that may require professional legal representation. The information provided is general in nature, and I strongly recommend consulting with a qualified advocate who specializes in this area of law for personalized advice."
-"""
+def resume_conversation(store, conversation_id):
+    saved = store.summary(conversation_id)
+    # The last page, plus any older messages the rolling summary doesn't cover yet
+    limit = max(HISTORY_PAGE_SIZE, store.count(conversation_id) - saved["covered"])
+    messages, offset = store.tail(conversation_id, limit)
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages = compact_messages(messages)
+    st.session_state.history_offset = offset
+    st.session_state.history_summary = {"summary": saved["summary"], "covered": saved["covered"] - offset}
+    st.session_state.history_visible = HISTORY_PAGE_SIZE
+    st.session_state.rendered_messages = []
 
 # Initialize session state variables
 if 'messages' not in st.session_state:
-    st.session_state.messages = [
-        {"role": "assistant", "content": "Hello! I am NyayaBot, an expert AI legal assistant specializing in Indian Judiciary Law. How can I help you today?", "timestamp": datetime.now().strftime("%H:%M")}
-    ]
+    resume_id = st.query_params.get("c")
+    store = get_conversation_store() if resume_id else None
+    if store is not None and store.exists(resume_id):
+        resume_conversation(store, resume_id)
+    else:
+        new_conversation()
 
 if 'api_key' not in st.session_state:
     st.session_state.api_key = os.environ.get("OPENAI_API_KEY", "")
 
+# A key already checked by another session (e.g. the server's OPENAI_API_KEY),
+# or any key in optimistic mode, is usable without pressing "Validate Key"
 if 'api_key_valid' not in st.session_state:
-    st.session_state.api_key_valid = False
+    st.session_state.api_key_valid = get_key_validator().trusted(st.session_state.api_key)
+
+if 'pending_question' not in st.session_state:
+    st.session_state.pending_question = None
 
-# Function to validate OpenAI API key
+if 'stream_responses' not in st.session_state:
+    st.session_state.stream_responses = True
+
+# Count this session's messages against the process's memory budget. An idle
+# session's messages may have been released; they are reloaded from the store.
+session_memory = get_session_memory()
+if 'memory_record' not in st.session_state:
+    st.session_state.memory_record = session_memory.register()
+if session_memory.checkin(st.session_state.memory_record) and st.session_state.conversation_id:
+    resume_conversation(get_conversation_store(), st.session_state.conversation_id)
+
+def track_session_memory():
+    session_memory.track(st.session_state.memory_record, st.session_state.conversation_id,
+                         st.session_state.messages, st.session_state.rendered_messages)
+
+track_session_memory()
+
+# Function to validate OpenAI API key (results are cached per key across sessions)
 def validate_api_key(api_key):
-    if not api_key or len(api_key.strip()) < 10:
-        return False
-    
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        # Make a minimal API call to validate the key
-        models = client.models.list(limit=1)
-        return True
-    except Exception as e:
-        st.error(f"API key validation error: {str(e)}")
-        return False
+    valid, error = get_key_validator().validate(api_key)
+    if error:
+        st.error(f"API key validation error: {error}")
+    return valid
+
+# A failed completion with a rejected key revokes it for every session
+def handle_response_error(e, api_key):
+    if is_auth_error(e):
+        get_key_validator().invalidate(api_key)
+        st.session_state.api_key_valid = False
+        st.error("OpenAI rejected the API key. Enter a valid key or continue in demo mode.")
+    else:
+        st.error(f"Error generating response: {str(e)}")
 
 # Function to generate response from OpenAI
 def generate_response(messages, api_key):
     try:
-        # Prepare conversation history for API
-        conversation = [{"role": "system", "content": NYAYABOT_SYSTEM_PROMPT}]
-        
-        # Add user messages and assistant responses
-        for msg in messages:
-            if msg["role"] in ["user", "assistant"]:
-                conversation.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Create OpenAI client with the provided API key
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Call the OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=conversation,
-            temperature=0.7,
-        )
-        
-        return response.choices[0].message.content
+        # Recent turns verbatim, older turns as the session's rolling summary
+        answer = engine_client.chat_answer(messages, st.session_state.history_summary, api_key)
     except Exception as e:
-        st.error(f"Error generating response: {str(e)}")
+        if is_unavailable(e):
+            return offline_response(messages)
+        handle_response_error(e, api_key)
         return f"I apologize, but I encountered an error while processing your request. Please check your API key or try again later.\n\nError details: {str(e)}"
+    # An optimistically accepted key is confirmed by the engine once OpenAI accepts a request with it
+    return answer
+
+# Function to stream response tokens from OpenAI as they are generated
+def stream_response(messages, api_key):
+    try:
+        yield from engine_client.stream_chat(messages, st.session_state.history_summary, api_key)
+    except Exception as e:
+        if is_unavailable(e):
+            yield offline_response(messages)
+            return
+        handle_response_error(e, api_key)
+        yield f"\n\nI apologize, but I encountered an error while processing your request. Please check your API key or try again later.\n\nError details: {str(e)}"
 
-# Function to simulate response for demo purposes when no API key is provided
+# Function to simulate response for demo purposes when no API key is provided.
+# Topics and canned answers are loaded from data/intents.json.
 def simulate_response(query):
-    query = query.lower()
-    
-    if "fir" in query or "police complaint" in query:
-        return """An FIR (First Information Report) can be filed at any police station by visiting in person, submitting a written complaint, or in some cases, filing online through state police portals.
+    return get_intent_router().respond(query.lower())
 
-The process typically involves:
-1. Approaching the police station with jurisdiction over the area where the crime occurred
-2. Providing details of the incident to the officer in charge
-3. The officer will record your statement and register the FIR under Section 154 of the Criminal Procedure Code, 1973
-4. You should receive a free copy of the FIR
+# While OpenAI's circuit breaker is open (see resilience.py), answer from the
+# same canned topics instead of showing an error
+def offline_response(messages):
+    return ("⚠️ NyayaBot can't reach its AI service right now, so this answer comes from its offline topics.\n\n"
+            + simulate_response(messages[-1]["content"]))
 
-If the police refuse to register your FIR, you have legal remedies including:
-- Approaching a senior police officer
-- Filing a complaint directly to the Judicial Magistrate under Section 156(3) CrPC
-- Filing a writ petition in the High Court
+# Render a chat bubble. Content is escaped (answers and questions are untrusted
+# text); **bold** and line breaks are the only formatting kept. Statute
+# citations in finished answers are linked, or flagged when the section
+# doesn't exist (see citations.py).
+def message_html(role, content, timestamp=None, cursor=False):
+    body = annotate_html(content) if role == "assistant" and not cursor else html.escape(content)
+    body = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", body)
+    body = body.replace("\n", "<br>")
+    css_class = "chat-message-user" if role == "user" else "chat-message-bot"
+    footer = "▌" if cursor else ""
+    if timestamp:
+        footer += f"<div class='chat-timestamp'>{html.escape(timestamp)}</div>"
+    return f"<div class='{css_class}'>{body}{footer}</div>"
 
-Please note that this information is provided for educational purposes only and does not constitute legal advice. For specific legal concerns, please consult with a qualified legal professional who can provide personalized guidance based on your particular situation."""
-    
-    elif "landlord" in query or "tenant" in query or "rent" in query or "evict" in query:
-        return """In India, landlord-tenant relationships are primarily governed by state-specific Rent Control Acts. A landlord cannot legally evict a tenant without proper notice and following due process under the applicable Rent Control Act.
-
-A landlord must typically provide a valid reason for eviction as specified in the relevant Act, such as:
-- Non-payment of rent
-- Subletting without permission
-- Using the premises for purposes other than those agreed upon
-- Causing damage to the property
-- The landlord requiring the premises for personal use
-
-Even with valid grounds, the landlord must:
-1. Serve a legal notice specifying the reason for eviction
-2. File an eviction petition in the Rent Controller's court
-3. Obtain a court order before attempting to evict you
-
-This matter involves complex legal considerations that may require professional legal representation. The information provided is general in nature, and I strongly recommend consulting with a qualified advocate who specializes in this area of law for personalized advice."""
-    
-    else:
-        return f"""Thank you for your question about "{query}". To provide you with accurate information, I would need to understand more specific details about your legal concern.
+# HTML for the most recent messages; each message is rendered once and cached
+def history_html(messages, visible):
+    cache = st.session_state.rendered_messages
+    if len(cache) > len(messages):
+        cache.clear()
+    for message in messages[len(cache):]:
+        cache.append(message_html(message["role"], message["content"], message["timestamp"]))
+    return "".join(cache[-visible:])
 
-Indian law covers various domains including constitutional law, criminal law, civil law, family law, property law, and more. Each area has specific statutes, procedures, and case precedents.
+# Add a message to the session and the store. A conversation is created in the
+# store on its first question, not on every page load.
+def add_message(message):
+    st.session_state.messages.append(message)
+    store = get_conversation_store()
+    if store is None:
+        return
+    if st.session_state.conversation_id is None:
+        st.session_state.conversation_id = store.create()
+        st.query_params["c"] = st.session_state.conversation_id
+        unsaved = st.session_state.messages
+    else:
+        unsaved = [message]
+    for msg in unsaved:
+        store.append(st.session_state.conversation_id, msg)
 
-Please feel free to ask more specific questions about your legal concern, and I'll do my best to provide relevant information.
+# Save the rolling summary, then let go of messages that are both off screen
+# and folded into it; they stay in the store
+def save_summary_and_trim():
+    conversation_id = st.session_state.conversation_id
+    if conversation_id is None:
+        return
+    summary = st.session_state.history_summary
+    offset = st.session_state.history_offset
+    get_conversation_store().save_summary(
+        conversation_id, {"summary": summary["summary"], "covered": summary["covered"] + offset})
+    drop = min(summary["covered"], len(st.session_state.messages) - st.session_state.history_visible)
+    if drop > 0:
+        del st.session_state.messages[:drop]
+        del st.session_state.rendered_messages[:drop]
+        st.session_state.history_offset += drop
+        summary["covered"] -= drop
 
-Please note that this information is provided for educational purposes only and does not constitute legal advice. For specific legal concerns, please consult with a qualified legal professional who can provide personalized guidance based on your particular situation."""
+def show_earlier_messages():
+    st.session_state.history_visible += HISTORY_PAGE_SIZE
+    missing = st.session_state.history_visible - len(st.session_state.messages)
+    offset = st.session_state.history_offset
+    if missing > 0 and offset > 0:
+        older = compact_messages(
+            get_conversation_store().messages(st.session_state.conversation_id, offset - missing, offset))
+        st.session_state.messages[:0] = older
+        st.session_state.rendered_messages[:0] = [
+            message_html(msg["role"], msg["content"], msg["timestamp"]) for msg in older
+        ]
+        st.session_state.history_offset -= len(older)
+        st.session_state.history_summary["covered"] += len(older)
 
 # Sidebar for API key configuration
 with st.sidebar:
@@ -202,6 +291,11 @@ with st.sidebar:
                            type="password",
                            help="Your API key is stored in this session only and not saved on any server.")
     
+    # In optimistic mode a newly entered key is used right away
+    if KEY_VALIDATION_MODE == "optimistic" and api_key and api_key != st.session_state.api_key:
+        st.session_state.api_key = api_key
+        st.session_state.api_key_valid = get_key_validator().trusted(api_key)
+    
     col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("Validate Key"):
@@ -222,6 +316,42 @@ with st.sidebar:
     if not api_key:
         st.warning("No API key provided. The app will run in demo mode with simulated responses.")
     
+    st.checkbox("Stream responses", key="stream_responses",
+                help="Show the answer word by word as NyayaBot writes it.")
+    
+    # Conversation controls: start over, or download the saved transcript
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.button("New conversation", on_click=new_conversation)
+    with col2:
+        if st.session_state.conversation_id:
+            conversation_id = st.session_state.conversation_id
+            # Written from the store row by row, only when the button is clicked
+            st.download_button("Export", data=lambda: get_conversation_store().export_file(conversation_id),
+                               file_name=f"nyaya-{conversation_id}.md", mime="text/markdown", on_click="ignore")
+    
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        cache_stats = answer_cache.summary()
+        st.caption(f"💾 Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                   f"({cache_stats['hit_rate']:.0%} hit rate)")
+    
+    # Admin panel: per-stage latency, token usage and the last turn's trace
+    if metrics.METRICS_PANEL:
+        with st.expander("📊 Metrics"):
+            stats = metrics.summary()
+            st.caption(f"Tokens: {stats['tokens'].get('prompt', 0)} prompt / "
+                       f"{stats['tokens'].get('completion', 0)} completion · errors: {stats['errors']} · "
+                       f"routed fast/large: {stats['routes'].get('fast', 0)}/{stats['routes'].get('large', 0)}")
+            sessions = session_memory.summary()
+            st.caption(f"Sessions: {sessions['resident']} resident / {sessions['spilled']} spilled · "
+                       f"{sessions['total_bytes'] / 1024:.0f} KiB held, largest {sessions['max_bytes'] / 1024:.0f} KiB")
+            if stats["stages"]:
+                st.dataframe(stats["stages"], hide_index=True)
+            if stats["last_trace"]:
+                st.markdown("**Last turn**")
+                st.dataframe(stats["last_trace"], hide_index=True)
+    
     st.markdown("---")
     
     st.markdown("### About")
@@ -249,50 +379,69 @@ st.markdown("<h1 class='main-header'>Chat with <span>Nyaya</span><span class='go
 st.markdown("Ask any question about Indian law and legal procedures")
 
 # Display chat messages
+# Only the most recent page is rendered, as a single markdown element; older
+# messages stay behind "Show earlier messages"
 chat_container = st.container()
-with chat_container:
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            st.markdown(f"<div class='chat-message-user'>{message['content']}<div class='chat-timestamp'>{message['timestamp']}</div></div>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<div class='chat-message-bot'>{message['content']}<div class='chat-timestamp'>{message['timestamp']}</div></div>", unsafe_allow_html=True)
+with chat_container, metrics.span("render_history"):
+    hidden = st.session_state.history_offset + len(st.session_state.messages) - st.session_state.history_visible
+    if hidden > 0:
+        st.button(f"Show earlier messages ({hidden} hidden)", on_click=show_earlier_messages)
+    st.markdown(history_html(st.session_state.messages, st.session_state.history_visible), unsafe_allow_html=True)
+
+# Queue the question and clear the input box before the next run renders it
+def submit_question():
+    question = st.session_state.user_question
+    if question:
+        add_message(Message("user", question))
+        st.session_state.pending_question = question
+        st.session_state.user_question = ""
 
 # Input area for user questions
 st.markdown("---")
 with st.container():
     col1, col2 = st.columns([6, 1])
     with col1:
-        user_input = st.text_input("Your legal question:", key="user_question", placeholder="e.g., How do I file an FIR in India?")
+        st.text_input("Your legal question:", key="user_question", placeholder="e.g., How do I file an FIR in India?")
     with col2:
-        send_button = st.button("Send", use_container_width=True)
+        st.button("Send", use_container_width=True, on_click=submit_question)
 
-# Process user input
-if send_button and user_input:
-    # Add user message to chat
-    timestamp = datetime.now().strftime("%H:%M")
-    st.session_state.messages.append({"role": "user", "content": user_input, "timestamp": timestamp})
-    
-    # Display user message immediately
-    st.markdown(f"<div class='chat-message-user'>{user_input}<div class='chat-timestamp'>{timestamp}</div></div>", unsafe_allow_html=True)
+# Process the queued question inside the chat container, below the history
+if st.session_state.pending_question:
+    user_input = st.session_state.pending_question
+    st.session_state.pending_question = None
     
-    # Show loading spinner while generating response
-    with st.spinner("NyayaBot is thinking..."):
+    # The session is never released while it answers, however long that takes
+    with chat_container, metrics.trace(), session_memory.busy(st.session_state.memory_record):
         # Generate response based on whether API key is valid
         if st.session_state.api_key and st.session_state.api_key_valid:
-            response = generate_response(st.session_state.messages, st.session_state.api_key)
+            if st.session_state.stream_responses:
+                # Render tokens into the bot bubble as they arrive
+                placeholder = st.empty()
+                response = ""
+                render_seconds = 0.0
+                for token in stream_response(st.session_state.messages, st.session_state.api_key):
+                    response += token
+                    render_started = time.perf_counter()
+                    placeholder.markdown(message_html("assistant", response, cursor=True), unsafe_allow_html=True)
+                    render_seconds += time.perf_counter() - render_started
+                metrics.observe("render_stream", render_seconds)
+            else:
+                placeholder = st.empty()
+                with st.spinner("NyayaBot is thinking..."):
+                    response = generate_response(st.session_state.messages, st.session_state.api_key)
         else:
+            placeholder = st.empty()
             response = simulate_response(user_input)
-    
-    # Add assistant response to chat
-    timestamp = datetime.now().strftime("%H:%M")
-    st.session_state.messages.append({"role": "assistant", "content": response, "timestamp": timestamp})
-    
-    # Display assistant response
-    st.markdown(f"<div class='chat-message-bot'>{response}<div class='chat-timestamp'>{timestamp}</div></div>", unsafe_allow_html=True)
-    
-    # Clear the input box
-    st.session_state.user_question = ""
-    st.experimental_rerun()
+        
+        # Add assistant response to chat
+        message = Message("assistant", response)
+        add_message(message)
+        
+        # Display the final assistant response in place of the streaming bubble
+        with metrics.span("render"):
+            placeholder.markdown(message_html("assistant", response, message.timestamp), unsafe_allow_html=True)
+        save_summary_and_trim()
+        track_session_memory()
 
 # Legal disclaimer at the bottom
 st.markdown("---")
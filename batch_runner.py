@@ -0,0 +1,243 @@
+"""Headless batch runner for bulk legal Q&A.
+
+Reads questions from JSONL (one {"id": ..., "question": ...} per line; `id`
+defaults to the line number), answers them concurrently with the same prompt
+as the Streamlit app, and appends one result per line to the output JSONL:
+
+    python batch_runner.py questions.jsonl answers.jsonl --concurrency 16 --rpm 500 --tpm 300000
+
+The output file doubles as the checkpoint: rerunning the same command skips
+questions that already have an answer and retries ones that failed, so an
+interrupted run resumes where it stopped. When an id appears more than once,
+the last line is the current result.
+
+With --route, each question goes to the fast or the large model as chosen by
+model_router.py, and the summary breaks latency and tokens down per tier.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from clients import aclose_async_clients, get_async_openai_client, openai_timeout
+from history import count_tokens
+from model_router import route
+from nyaya_engine import LEGAL_MAX_TOKENS, LEGAL_MODEL, LEGAL_TEMPERATURE, build_legal_messages
+from resilience import acall
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute (0 = unlimited)"""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens):
+        """Wait until one request and `tokens` tokens are available, then take them"""
+        # A single request larger than the whole budget still has to run eventually
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                request_ok = not self.rpm or self._requests >= 1
+                tokens_ok = not self.tpm or self._tokens >= tokens
+                if request_ok and tokens_ok:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+                waits = [0.01]
+                if not request_ok:
+                    waits.append((1 - self._requests) * 60 / self.rpm)
+                if not tokens_ok:
+                    waits.append((tokens - self._tokens) * 60 / self.tpm)
+                await asyncio.sleep(max(waits))
+
+    def settle(self, reserved, used):
+        """Return unused reserved tokens (or charge the overshoot) once usage is known"""
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + reserved - used)
+
+
+def read_questions(path):
+    """Yield {"id", "question"} items from a JSONL file"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            yield {"id": item.get("id", line_no), "question": item["question"]}
+
+
+def load_completed(path):
+    """Ids that already have a successful answer in the output file"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if result.get("error"):
+                completed.discard(str(result["id"]))
+            else:
+                completed.add(str(result["id"]))
+    return completed
+
+
+async def answer_question(client, limiter, item, model, max_tokens, temperature, routed=False):
+    """Answer one question; returns the result record written to the output file.
+    With `routed`, `model` is the large model and simple questions go to the fast one."""
+    messages = build_legal_messages(item["question"])
+    reserved = sum(count_tokens(msg["content"]) + 4 for msg in messages) + max_tokens
+    result = {"id": item["id"], "question": item["question"], "model": model, "answer": None,
+              "error": None, "latency_s": None, "prompt_tokens": None, "completion_tokens": None,
+              "total_tokens": None}
+    if routed:
+        decision = route(item["question"], "batch", model)
+        model = result["model"] = decision["model"]
+        result["tier"], result["route_score"] = decision["tier"], decision["score"]
+
+    await limiter.acquire(reserved)
+    started = time.perf_counter()
+    try:
+        # Retried within a deadline; while OpenAI's circuit breaker is open,
+        # questions fail at once and are retried by the next run
+        response = await acall("openai", lambda timeout: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=openai_timeout(timeout),
+        ))
+        result["answer"] = response.choices[0].message.content
+        if response.usage is not None:
+            result["prompt_tokens"] = response.usage.prompt_tokens
+            result["completion_tokens"] = response.usage.completion_tokens
+            result["total_tokens"] = response.usage.total_tokens
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency_s"] = round(time.perf_counter() - started, 3)
+    limiter.settle(reserved, result["total_tokens"] if result["total_tokens"] is not None else reserved)
+    return result
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else None
+
+
+def summarize_results(results, elapsed):
+    """Aggregate latency and token statistics for a run"""
+    latencies = sorted(r["latency_s"] for r in results if not r["error"])
+
+    summary = {
+        "processed": len(results),
+        "succeeded": len(latencies),
+        "failed": sum(1 for r in results if r["error"]),
+        "elapsed_s": round(elapsed, 2),
+        "questions_per_s": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_p50_s": _percentile(latencies, 50),
+        "latency_p95_s": _percentile(latencies, 95),
+        "latency_p99_s": _percentile(latencies, 99),
+        "prompt_tokens": sum(r["prompt_tokens"] or 0 for r in results),
+        "completion_tokens": sum(r["completion_tokens"] or 0 for r in results),
+    }
+    tiers = {}
+    for r in results:
+        if "tier" in r:
+            tiers.setdefault(r["tier"], []).append(r)
+    if tiers:
+        summary["tiers"] = {
+            tier: {
+                "questions": len(routed),
+                "model": routed[0]["model"],
+                "latency_p50_s": _percentile(sorted(r["latency_s"] for r in routed if not r["error"]), 50),
+                "total_tokens": sum(r["total_tokens"] or 0 for r in routed),
+            }
+            for tier, routed in sorted(tiers.items())
+        }
+    return summary
+
+
+async def run_batch(input_path, output_path, api_key, concurrency=8, rpm=0, tpm=0,
+                    model=LEGAL_MODEL, max_tokens=LEGAL_MAX_TOKENS, temperature=LEGAL_TEMPERATURE,
+                    routed=False):
+    """Answer every pending question in input_path, appending results to output_path"""
+    completed = load_completed(output_path)
+    items = [item for item in read_questions(input_path) if str(item["id"]) not in completed]
+    print(f"{len(completed)} already answered, {len(items)} to go", file=sys.stderr)
+
+    client = get_async_openai_client(api_key)
+    limiter = RateLimiter(rpm, tpm)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    started = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def run_one(item):
+            async with semaphore:
+                result = await answer_question(client, limiter, item, model, max_tokens, temperature, routed)
+            # Each finished answer is flushed immediately so it survives an interruption
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            results.append(result)
+            if len(results) % 50 == 0 or len(results) == len(items):
+                print(f"{len(results)}/{len(items)} done", file=sys.stderr)
+
+        try:
+            await asyncio.gather(*(run_one(item) for item in items))
+        finally:
+            await aclose_async_clients()
+
+    return summarize_results(results, time.perf_counter() - started)
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Answer legal questions from a JSONL file in bulk")
+    parser.add_argument("input", help="JSONL file with one {\"id\", \"question\"} per line")
+    parser.add_argument("output", help="JSONL file to append answers to (also the resume checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute limit (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute limit (0 = unlimited)")
+    parser.add_argument("--model", default=LEGAL_MODEL)
+    parser.add_argument("--route", action="store_true",
+                        help="send simple questions to the fast model (see model_router.py); --model is the large one")
+    parser.add_argument("--max-tokens", type=int, default=LEGAL_MAX_TOKENS)
+    parser.add_argument("--temperature", type=float, default=LEGAL_TEMPERATURE)
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY"))
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("OpenAI API key not found. Pass --api-key or set OPENAI_API_KEY.")
+
+    summary = asyncio.run(run_batch(args.input, args.output, args.api_key, args.concurrency, args.rpm,
+                                    args.tpm, args.model, args.max_tokens, args.temperature, args.route))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Local stand-ins for the OpenAI and GitHub APIs used by the apps.
+
+The OpenAI server answers chat completions (plain and streaming) after a
+configurable time to first token, then emits tokens at a fixed rate; it also
+answers the models listing used for key validation and rejects keys that
+start with "sk-invalid" the way OpenAI does. The GitHub server
+implements the endpoints behind search_github_repos, get_repo_info,
+get_repo_readme and get_branch_sha with ETag revalidation and rate-limit
+headers.
+
+Both count the requests they serve so a benchmark can report upstream calls.
+Run them standalone to point a manual app session at them:
+
+    python -m bench.mock_servers --openai-port 8765 --github-port 8766
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 GITHUB_API_URL=http://127.0.0.1:8766 streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ("the court held that an FIR must be registered under section 154 when information "
+         "discloses a cognizable offence and the police may not refuse it").split()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OpenAIHandler(_Handler):
+    def _rejected_key(self):
+        # Keys starting with "sk-invalid" get OpenAI's 401 response
+        if "sk-invalid" not in self.headers.get("Authorization", ""):
+            return False
+        self._send_json({"error": {"message": "Incorrect API key provided", "type": "invalid_request_error",
+                                   "code": "invalid_api_key"}}, status=401)
+        return True
+
+    def do_GET(self):
+        self.server.count()
+        if self._rejected_key():
+            return
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [
+                {"id": model, "object": "model", "created": 0, "owned_by": "mock"}
+                for model in ("gpt-4o", "gpt-4", "gpt-4o-mini")
+            ]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        self.server.count()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._rejected_key():
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+
+        config = self.server.config
+        n_tokens = min(config["completion_tokens"], body.get("max_tokens") or config["completion_tokens"])
+        tokens = [WORDS[i % len(WORDS)] + " " for i in range(n_tokens)]
+        prompt_tokens = sum(len(str(msg.get("content", ""))) // 4 + 4 for msg in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens}
+        delay = 1 / config["tokens_per_second"] if config["tokens_per_second"] else 0
+
+        time.sleep(config["latency"])
+        if not body.get("stream"):
+            time.sleep(delay * n_tokens)
+            self._send_json({
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for token in tokens:
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0,
+                     "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(delay)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0,
+                     "model": body.get("model"), "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def _repository(index, owner="nyaya-bench"):
+    name = f"legal-tool-{index}"
+    return {
+        "id": 1000 + index,
+        "name": name,
+        "full_name": f"{owner}/{name}",
+        "owner": {"login": owner},
+        "html_url": f"https://github.com/{owner}/{name}",
+        "description": f"Benchmark repository {index} for legal document analysis",
+        "language": ("Python", "JavaScript", "Java")[index % 3],
+        "stargazers_count": 500 - index * 7,
+        "forks_count": 40 + index,
+        "open_issues_count": index % 5,
+        "default_branch": "main",
+        "updated_at": f"2024-01-{index % 28 + 1:02d}T00:00:00Z",
+        "pushed_at": f"2024-01-{index % 28 + 1:02d}T00:00:00Z",
+    }
+
+
+class GitHubHandler(_Handler):
+    def do_GET(self):
+        self.server.count()
+        config = self.server.config
+        time.sleep(config["latency"])
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+
+        if url.path == "/search/repositories":
+            per_page = int(params.get("per_page", ["30"])[0])
+            page = int(params.get("page", ["1"])[0])
+            start = (page - 1) * per_page
+            items = [_repository(i) for i in range(start, min(start + per_page, config["repositories"]))]
+            self._send_cacheable({"total_count": config["repositories"], "incomplete_results": False,
+                                  "items": items})
+            return
+
+        match = re.fullmatch(r"/repos/([^/]+)/([^/]+)(/readme|/commits/[^/]+)?", url.path)
+        if not match:
+            self._send_json({"message": "Not Found"}, status=404)
+            return
+        owner, name, sub = match.groups()
+        if sub and sub.startswith("/commits/"):
+            # Branches never move, so every repository stays at one commit
+            sha = hashlib.sha1(f"{owner}/{name}".encode()).hexdigest()
+            raw = "sha" in self.headers.get("Accept", "")
+            self._send_cacheable(sha if raw else {"sha": sha}, raw=raw)
+        elif sub:
+            text = f"# {name}\n\n" + ("Contract review and case law search for Indian courts. " * 40 + "\n\n") * 4
+            self._send_cacheable(text, raw="raw" in self.headers.get("Accept", ""))
+        else:
+            index = int(name.rsplit("-", 1)[-1]) if name.rsplit("-", 1)[-1].isdigit() else 0
+            self._send_cacheable(dict(_repository(index, owner), name=name, full_name=f"{owner}/{name}"))
+
+    def _send_cacheable(self, data, raw=False):
+        body = data.encode() if raw else json.dumps(data).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        headers = {"ETag": etag, "X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "4999",
+                   "X-RateLimit-Reset": str(int(time.time()) + 3600)}
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if raw:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(data, headers=headers)
+
+
+class MockServer(ThreadingHTTPServer):
+    """An HTTP server on a background thread that counts the requests it serves"""
+
+    daemon_threads = True
+
+    def __init__(self, handler, port=0, **config):
+        super().__init__(("127.0.0.1", port), handler)
+        self.config = config
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self):
+        with self._count_lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_openai(port=0, latency=0.2, tokens_per_second=50.0, completion_tokens=60):
+    """Start the mock OpenAI server; its base URL is server.url + "/v1" """
+    return MockServer(OpenAIHandler, port, latency=latency, tokens_per_second=tokens_per_second,
+                      completion_tokens=completion_tokens).start()
+
+
+def start_github(port=0, latency=0.05, repositories=30):
+    """Start the mock GitHub REST server; its base URL is server.url"""
+    return MockServer(GitHubHandler, port, latency=latency, repositories=repositories).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the mock OpenAI and GitHub servers")
+    parser.add_argument("--openai-port", type=int, default=8765)
+    parser.add_argument("--github-port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.2, help="OpenAI time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="OpenAI tokens per second (0 = instant)")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--github-latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    openai_server = start_openai(args.openai_port, args.latency, args.token_rate, args.completion_tokens)
+    github_server = start_github(args.github_port, args.github_latency)
+    print(f"OPENAI_BASE_URL={openai_server.url}/v1")
+    print(f"GITHUB_API_URL={github_server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
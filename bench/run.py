@@ -0,0 +1,351 @@
+"""Offline benchmark of the Streamlit apps.
+
+Starts the mock OpenAI and GitHub servers from bench/mock_servers.py, points
+the apps at them (OPENAI_BASE_URL, GITHUB_API_URL), drives every app through
+Streamlit's AppTest and writes JSON with p50/p95/p99 latency, script runs per
+interaction, throughput and upstream requests per scenario:
+
+    python -m bench.run --iterations 20 --output bench-before.json
+    python -m bench.run --iterations 20 --output bench-after.json
+    python -m bench.run --compare bench-before.json bench-after.json
+
+An interaction is one user action that makes Streamlit run the script
+(loading the page, typing into a box, clicking a button). Its latency is the
+wall time until the script has finished, including any extra runs it
+triggers; "reruns" counts those script runs. The answer and analysis caches
+are disabled and the GitHub cache revalidates every request, so each
+iteration reaches the mock upstreams; pass --answer-cache to measure with
+them enabled.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bench.mock_servers import start_github, start_openai
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "How do I file an FIR if the police refuse to register it?",
+    "What are my rights as a tenant facing eviction?",
+    "How can I apply for anticipatory bail?",
+    "What is the procedure for mutual consent divorce?",
+    "How do I file a consumer complaint for a defective product?",
+]
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else None
+
+
+def latency_stats(latencies, reruns, errors=0):
+    """Summary of one interaction's samples (latencies in seconds)"""
+    latency_ms = [value * 1000 for value in latencies]
+    return {
+        "n": len(latency_ms),
+        "p50_ms": round(_percentile(latency_ms, 50), 2),
+        "p95_ms": round(_percentile(latency_ms, 95), 2),
+        "p99_ms": round(_percentile(latency_ms, 99), 2),
+        "mean_ms": round(sum(latency_ms) / len(latency_ms), 2),
+        "reruns_per_interaction": round(sum(reruns) / len(reruns), 2),
+        "errors": errors,
+    }
+
+
+class Recorder:
+    """Times interactions and counts the script runs each one triggers"""
+
+    def __init__(self):
+        self.samples = {}
+        self.script_runs = 0
+        self.elapsed = 0.0
+
+    def measure(self, name, at):
+        runs_before = self.script_runs
+        started = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - started
+        self.elapsed += elapsed
+        sample = self.samples.setdefault(name, {"latency": [], "reruns": [], "errors": 0})
+        sample["latency"].append(elapsed)
+        sample["reruns"].append(self.script_runs - runs_before)
+        if at.exception:
+            sample["errors"] += 1
+        return at
+
+    def summary(self):
+        interactions = {name: latency_stats(sample["latency"], sample["reruns"], sample["errors"])
+                        for name, sample in self.samples.items()}
+        count = sum(len(sample["latency"]) for sample in self.samples.values())
+        return {
+            "interactions": interactions,
+            "interactions_total": count,
+            "throughput_per_s": round(count / self.elapsed, 2) if self.elapsed else None,
+        }
+
+
+def _install_run_counter(recorder):
+    """Make every AppTest script runner report SCRIPT_STARTED to the recorder"""
+    from streamlit.runtime.scriptrunner import ScriptRunnerEvent
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    class CountingScriptRunner(LocalScriptRunner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.on_event.connect(self._count_run, weak=False)
+
+        def _count_run(self, sender, event, **kwargs):
+            if event == ScriptRunnerEvent.SCRIPT_STARTED:
+                recorder.script_runs += 1
+
+    app_test.LocalScriptRunner = CountingScriptRunner
+
+
+def _app(name, timeout, secrets=None):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, name), default_timeout=timeout)
+    for key, value in (secrets or {}).items():
+        at.secrets[key] = value
+    return at
+
+
+def _button(at, label):
+    return next(button for button in at.button if button.label == label)
+
+
+def chat_scenario(recorder, i, timeout, api_key):
+    """app.py: validate the key, ask a streamed and a non-streamed question"""
+    at = _app("app.py", timeout)
+    recorder.measure("load", at)
+    _button(at, "Validate Key").click()
+    recorder.measure("validate_key", at)
+    at.text_input(key="user_question").input(QUESTIONS[i % len(QUESTIONS)] + f" ({i})")
+    recorder.measure("type_question", at)
+    _button(at, "Send").click()
+    recorder.measure("ask_stream", at)
+    at.checkbox(key="stream_responses").uncheck()
+    recorder.measure("toggle_stream", at)
+    at.text_input(key="user_question").input(f"And what happens next? ({i})")
+    recorder.measure("type_question", at)
+    _button(at, "Send").click()
+    recorder.measure("ask", at)
+
+
+def demo_scenario(recorder, i, timeout, api_key):
+    """app.py without an API key: canned demo-mode answers"""
+    at = _app("app.py", timeout)
+    at.session_state.api_key = ""
+    recorder.measure("load", at)
+    at.text_input(key="user_question").input(QUESTIONS[i % len(QUESTIONS)])
+    recorder.measure("type_question", at)
+    _button(at, "Send").click()
+    recorder.measure("ask", at)
+
+
+def legal_scenario(recorder, i, timeout, api_key):
+    """nyaya_ai_agent_app.py: the legal assistant view"""
+    at = _app("nyaya_ai_agent_app.py", timeout, {"OPENAI_API_KEY": api_key, "GITHUB_TOKEN": ""})
+    recorder.measure("load", at)
+    at.text_input[0].input(QUESTIONS[i % len(QUESTIONS)] + f" ({i})")
+    recorder.measure("ask", at)
+
+
+def search_scenario(recorder, i, timeout, api_key):
+    """nyaya_ai_agent_app.py: search repositories, page and re-sort, then analyze every result"""
+    at = _app("nyaya_ai_agent_app.py", timeout, {"OPENAI_API_KEY": api_key, "GITHUB_TOKEN": ""})
+    recorder.measure("load", at)
+    at.sidebar.radio[0].set_value("Search Legal Tech Repositories")
+    recorder.measure("open_search", at)
+    at.text_input[0].input(f"contract analysis {i}")
+    recorder.measure("type_query", at)
+    _button(at, "Search").click()
+    recorder.measure("search", at)
+    _button(at, "Next ▶").click()
+    recorder.measure("next_page", at)
+    at.selectbox[0].set_value("forks")
+    recorder.measure("change_sort", at)
+    _button(at, "Analyze all results").click()
+    recorder.measure("analyze_all", at)
+
+
+def analyze_scenario(recorder, i, timeout, api_key):
+    """nyaya_ai_agent_app.py: analyze one repository by URL"""
+    at = _app("nyaya_ai_agent_app.py", timeout, {"OPENAI_API_KEY": api_key, "GITHUB_TOKEN": ""})
+    recorder.measure("load", at)
+    at.sidebar.radio[0].set_value("Analyze Repository")
+    recorder.measure("open_analyze", at)
+    at.text_input[0].input(f"https://github.com/nyaya-bench/legal-tool-{i % 30}")
+    recorder.measure("type_url", at)
+    _button(at, "Analyze").click()
+    recorder.measure("analyze", at)
+
+
+def agent1_scenario(recorder, i, timeout, api_key):
+    """nyaya_ai_agent1_app.py: the single-question app"""
+    at = _app("nyaya_ai_agent1_app.py", timeout)
+    recorder.measure("load", at)
+    at.text_input[0].input(QUESTIONS[i % len(QUESTIONS)] + f" ({i})")
+    recorder.measure("ask", at)
+
+
+SCENARIOS = {
+    "chat": chat_scenario,
+    "demo": demo_scenario,
+    "legal": legal_scenario,
+    "search": search_scenario,
+    "analyze": analyze_scenario,
+    "agent1": agent1_scenario,
+}
+
+
+def _git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_benchmark(scenarios, iterations=10, warmup=1, latency=0.2, token_rate=50.0, completion_tokens=60,
+                  github_latency=0.05, answer_cache=False, timeout=120):
+    """Run the scenarios against fresh mock servers and return the results"""
+    openai_server = start_openai(latency=latency, tokens_per_second=token_rate,
+                                 completion_tokens=completion_tokens)
+    github_server = start_github(latency=github_latency)
+    api_key = "sk-bench-0000000000000000"
+
+    # The apps read these when their modules are first imported. Everything
+    # they write (conversations, caches, the repository catalogue) goes to a
+    # scratch directory, not the working tree's .nyaya_cache
+    scratch = tempfile.mkdtemp(prefix="nyaya-bench-")
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{openai_server.url}/v1",
+        "OPENAI_API_KEY": api_key,
+        "GITHUB_API_URL": github_server.url,
+        "NYAYA_GITHUB_CACHE_FRESH_SECONDS": "0",
+        "NYAYA_CONVERSATIONS_PATH": os.path.join(scratch, "conversations.db"),
+        "NYAYA_ANSWER_CACHE_PATH": os.path.join(scratch, "answers.json"),
+        "NYAYA_ANALYSIS_CACHE_PATH": os.path.join(scratch, "analyses.json"),
+        "NYAYA_CACHE_DB": os.path.join(scratch, "cache.db"),
+        "NYAYA_CATALOG_PATH": os.path.join(scratch, "catalog.db"),
+    })
+    os.environ.pop("NYAYA_SERVICE_URL", None)
+    if not answer_cache:
+        os.environ["NYAYA_ANSWER_CACHE"] = "0"
+        os.environ["NYAYA_ANALYSIS_CACHE"] = "0"
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    commit, dirty = _git_revision()
+    results = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": __import__("streamlit").__version__,
+            "config": {"iterations": iterations, "warmup": warmup, "openai_latency_s": latency,
+                       "openai_tokens_per_s": token_rate, "completion_tokens": completion_tokens,
+                       "github_latency_s": github_latency, "answer_cache": answer_cache},
+        },
+        "scenarios": {},
+    }
+
+    try:
+        for name in scenarios:
+            scenario = SCENARIOS[name]
+            for i in range(warmup):
+                scenario(Recorder(), i, timeout, api_key)
+
+            recorder = Recorder()
+            _install_run_counter(recorder)
+            openai_before, github_before = openai_server.requests, github_server.requests
+            for i in range(warmup, warmup + iterations):
+                scenario(recorder, i, timeout, api_key)
+
+            summary = recorder.summary()
+            summary["upstream_per_iteration"] = {
+                "openai_requests": round((openai_server.requests - openai_before) / iterations, 2),
+                "github_requests": round((github_server.requests - github_before) / iterations, 2),
+            }
+            results["scenarios"][name] = summary
+            print(f"{name}: {summary['interactions_total']} interactions, "
+                  f"{summary['throughput_per_s']} per second", file=sys.stderr)
+    finally:
+        openai_server.stop()
+        github_server.stop()
+    return results
+
+
+def compare(before_path, after_path):
+    """Print p50/p95/p99 and rerun changes between two result files"""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+
+    width = 2 + max((len(f"{scenario}/{name}") for scenario, result in after["scenarios"].items()
+                     for name in result["interactions"]), default=12)
+    print(f"{before['meta']['commit'] or '?'} -> {after['meta']['commit'] or '?'}")
+    print(f"{'interaction':<{width}}{'p50 ms':>22}{'p95 ms':>22}{'p99 ms':>22}{'reruns':>14}")
+    for scenario, result in after["scenarios"].items():
+        for name, stats in result["interactions"].items():
+            old = before["scenarios"].get(scenario, {}).get("interactions", {}).get(name)
+            columns = []
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if old:
+                    change = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                    columns.append(f"{old[key]:.0f} -> {stats[key]:.0f} ({change:+.0f}%)")
+                else:
+                    columns.append(f"{stats[key]:.0f}")
+            reruns = stats["reruns_per_interaction"]
+            columns.append(f"{old['reruns_per_interaction']} -> {reruns}" if old else f"{reruns}")
+            print(f"{scenario + '/' + name:<{width}}{columns[0]:>22}{columns[1]:>22}{columns[2]:>22}{columns[3]:>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Streamlit apps against mock upstreams")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured iterations per scenario")
+    parser.add_argument("--latency", type=float, default=0.2, help="OpenAI time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="OpenAI tokens per second (0 = instant)")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--github-latency", type=float, default=0.05)
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer and analysis caches enabled")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per script run")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_benchmark(args.scenario or list(SCENARIOS), args.iterations, args.warmup, args.latency,
+                            args.token_rate, args.completion_tokens, args.github_latency,
+                            args.answer_cache, args.timeout)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Cold and warm start measurement for the Streamlit apps.
+
+Each sample runs in a fresh interpreter: it imports Streamlit's AppTest, then
+times the first script run of an app in a new process (cold: every module
+the app needs is imported) and of a second session in the same process
+(warm: modules are cached, as for every later visitor to a running server).
+It also records which heavy SDKs the first page load pulled in and the
+slowest top-level imports:
+
+    python -m bench.startup --samples 5 --output startup.json
+    python -m bench.run --compare startup-before.json startup-after.json
+
+No network access is needed: first paint makes no API calls.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from bench.run import REPO_ROOT, _git_revision, latency_stats
+
+APPS = ["app.py", "nyaya_ai_agent_app.py", "nyaya_ai_agent1_app.py"]
+HEAVY_MODULES = ["openai", "httpx", "requests", "tiktoken", "dotenv"]
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _child(app):
+    """Measure one cold and one warm first paint in this (fresh) process"""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_loaded = time.perf_counter()
+
+    path = os.path.join(REPO_ROOT, app)
+    cold = AppTest.from_file(path, default_timeout=60)
+    cold_started = time.perf_counter()
+    cold.run()
+    cold_elapsed = time.perf_counter() - cold_started
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    warm = AppTest.from_file(path, default_timeout=60)
+    warm_started = time.perf_counter()
+    warm.run()
+    warm_elapsed = time.perf_counter() - warm_started
+
+    print(json.dumps({
+        "streamlit_import_s": streamlit_loaded - started,
+        "cold_s": cold_elapsed,
+        "warm_s": warm_elapsed,
+        "errors": int(bool(cold.exception)) + int(bool(warm.exception)),
+        "modules_loaded": loaded,
+    }))
+
+
+def _top_imports(stderr, limit=8):
+    """Slowest top-level imports (cumulative ms) from -X importtime output"""
+    totals = {}
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(3)) <= 1:
+            totals[match.group(4)] = totals.get(match.group(4), 0) + int(match.group(2)) / 1000
+    slowest = sorted(totals.items(), key=lambda item: -item[1])[:limit]
+    return {name: round(ms, 1) for name, ms in slowest}
+
+
+def measure(apps, samples=5):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env.setdefault("OPENAI_API_KEY", "sk-bench-0000000000000000")
+    env.pop("NYAYA_SERVICE_URL", None)
+
+    commit, dirty = _git_revision()
+    results = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "config": {"samples": samples},
+        },
+        "scenarios": {},
+    }
+
+    for app in apps:
+        runs, imports = [], {}
+        for _ in range(samples):
+            child = subprocess.run([sys.executable, "-X", "importtime", "-m", "bench.startup", "--child", app],
+                                   cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+            runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+            imports = _top_imports(child.stderr)
+
+        errors = sum(run["errors"] for run in runs)
+        results["scenarios"][f"startup:{app}"] = {
+            "interactions": {
+                "cold_first_paint": latency_stats([run["cold_s"] for run in runs], [1] * len(runs), errors),
+                "warm_first_paint": latency_stats([run["warm_s"] for run in runs], [1] * len(runs)),
+                "streamlit_import": latency_stats([run["streamlit_import_s"] for run in runs], [0] * len(runs)),
+            },
+            "modules_loaded": runs[-1]["modules_loaded"],
+            "top_imports_ms": imports,
+        }
+        cold = results["scenarios"][f"startup:{app}"]["interactions"]["cold_first_paint"]
+        print(f"{app}: cold first paint p50 {cold['p50_ms']} ms, loads {runs[-1]['modules_loaded']}",
+              file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold and warm start of the Streamlit apps")
+    parser.add_argument("--app", action="append", choices=APPS, help="app to measure (repeatable; default: all)")
+    parser.add_argument("--samples", type=int, default=5, help="fresh processes per app")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.child)
+        return
+
+    output = json.dumps(measure(args.app or APPS, args.samples), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Pluggable key-value backends for the answer, GitHub and key caches.
+
+Every cache stores its entries in a backend, one namespace per cache:
+
+- "memory" (the default): an LRU dict in this process, optionally snapshotted
+  to a JSON file so it survives restarts. Each worker process has its own.
+- "sqlite": one SQLite file in WAL mode shared by every worker process on the
+  host, so an answer, GitHub response or key check made by one worker is
+  reused by all of them and survives restarts.
+
+Both bound each namespace to `max_entries` (least recently used first out),
+expire entries after their TTL and offer get_or_compute(), which runs the
+computation once per key at a time: across threads in both backends, and
+across processes with "sqlite", where a lease row makes other workers wait for
+the first one's result instead of repeating the upstream call. Values must be
+JSON-serializable and not None.
+
+    NYAYA_CACHE_BACKEND=sqlite streamlit run nyaya_ai_agent_app.py --server.port 8501
+    NYAYA_CACHE_BACKEND=sqlite streamlit run nyaya_ai_agent_app.py --server.port 8502
+    python cache_backend.py stats
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from single_flight import SingleFlight
+
+# Cache backend settings (override with environment variables)
+CACHE_BACKEND = os.getenv("NYAYA_CACHE_BACKEND", "memory")
+CACHE_DB_PATH = os.getenv("NYAYA_CACHE_DB", os.path.join(".nyaya_cache", "cache.db"))
+# How long a worker computing a value holds its lease; a crashed worker's lease is taken over after this
+CACHE_LEASE_SECONDS = float(os.getenv("NYAYA_CACHE_LEASE_SECONDS", "120"))
+# How often a worker waiting on another's lease checks for the value
+LEASE_POLL_SECONDS = 0.05
+# Reads refresh an entry's LRU position at most this often, so hits rarely write
+TOUCH_INTERVAL = 30.0
+# Seconds between JSON snapshots of a changed memory backend (also written at exit)
+SNAPSHOT_SECONDS = float(os.getenv("NYAYA_CACHE_SNAPSHOT_SECONDS", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    stored REAL NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (namespace, accessed);
+CREATE INDEX IF NOT EXISTS entries_stored ON entries (namespace, stored);
+CREATE TABLE IF NOT EXISTS leases (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+
+def _expiry(ttl, value, now):
+    """Absolute expiry for a value, None for never, or False when it must not be stored"""
+    if callable(ttl):
+        ttl = ttl(value)
+    if ttl is False:
+        return False
+    return now + ttl if ttl is not None else None
+
+
+class MemoryBackend:
+    """LRU dict of one namespace in this process. With a `path`, the namespace
+    is snapshotted to that JSON file SNAPSHOT_SECONDS after a change and at
+    exit, and reloaded on start."""
+
+    name = "memory"
+
+    def __init__(self, namespace, max_entries=1000, ttl=None, path=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        # key -> [value, stored, expires], in least- to most-recently used order
+        self._entries = OrderedDict()
+        self._flights = SingleFlight()
+        self._timer = None
+        self._snapshot_lock = threading.Lock()
+        self._load()
+        if path:
+            atexit.register(self.flush)
+
+    def get(self, key):
+        """The value stored under key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] is not None and entry[2] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Store a value; `ttl` is seconds (None: the backend's TTL), or a
+        function of the value returning seconds, None for no expiry or False
+        to not store it"""
+        now = time.time()
+        expires = _expiry(self.ttl if ttl is None else ttl, value, now)
+        if expires is False:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = [value, now, expires]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._changed()
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._changed()
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """The stored value, or compute() stored under key; concurrent callers share one computation"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def run():
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                if value is not None:
+                    self.set(key, value, ttl)
+            return value
+
+        return self._flights.do(key, run)
+
+    def items(self, since=0.0):
+        """(key, value, stored) of live entries stored after `since`, oldest first"""
+        now = time.time()
+        with self._lock:
+            entries = [(key, entry[0], entry[1]) for key, entry in self._entries.items()
+                       if entry[1] > since and (entry[2] is None or entry[2] > now)]
+        return sorted(entries, key=lambda item: item[2])
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._changed()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+            entries = [(key, list(entry)) for key, entry in stored["entries"]]
+        except (OSError, ValueError, TypeError, KeyError):
+            # Unreadable or from an older version: start empty
+            return
+        now = time.time()
+        for key, entry in entries:
+            if entry[2] is None or entry[2] > now:
+                self._entries[key] = entry
+
+    def _changed(self):
+        # Called with the lock held: schedule one snapshot for the changes of the next few seconds
+        if self.path and self._timer is None:
+            self._timer = threading.Timer(SNAPSHOT_SECONDS, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the snapshot now if anything changed since the last one"""
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            entries = list(self._entries.items())
+        directory = os.path.dirname(self.path) or "."
+        with self._snapshot_lock:
+            os.makedirs(directory, exist_ok=True)
+            # A temporary file of this process's own, swapped in, so neither
+            # readers nor other processes sharing the path see a partial file
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp",
+                                             delete=False) as f:
+                json.dump({"entries": entries}, f)
+            try:
+                os.replace(f.name, self.path)
+            except OSError:
+                os.unlink(f.name)
+                raise
+
+
+class SQLiteBackend:
+    """One namespace of a SQLite file shared by every process on the host.
+
+    Connections are per thread and the file is in WAL mode, as in
+    conversation_store.py, so reads never wait for writes. Eviction is by
+    last access, which reads only refresh every TOUCH_INTERVAL seconds.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, namespace, max_entries=1000, ttl=None, path=CACHE_DB_PATH, timeout=10.0):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._flights = SingleFlight()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute("PRAGMA journal_mode=WAL")
+            # A cache can lose its last writes to a power cut
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        """The value stored under key, or None if missing or expired"""
+        db = self._connection()
+        row = db.execute("SELECT value, expires, accessed FROM entries WHERE namespace = ? AND key = ?",
+                         (self.namespace, key)).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            return None
+        if now - accessed > TOUCH_INTERVAL:
+            with db:
+                db.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                           (now, self.namespace, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """Store a value; `ttl` is seconds (None: the backend's TTL), or a
+        function of the value returning seconds, None for no expiry or False
+        to not store it"""
+        now = time.time()
+        expires = _expiry(self.ttl if ttl is None else ttl, value, now)
+        if expires is False:
+            return
+        db = self._connection()
+        with db:
+            db.execute("INSERT OR REPLACE INTO entries (namespace, key, value, stored, expires, accessed) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (self.namespace, key, json.dumps(value), now, expires, now))
+            excess = db.execute("SELECT count(*) FROM entries WHERE namespace = ?",
+                                (self.namespace,)).fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute("DELETE FROM entries WHERE namespace = ? AND (expires <= ? OR key IN "
+                           "(SELECT key FROM entries WHERE namespace = ? ORDER BY accessed LIMIT ?))",
+                           (self.namespace, now, self.namespace, excess))
+
+    def delete(self, key):
+        with self._connection() as db:
+            db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """The stored value, or compute() stored under key. Threads of this
+        process share one computation; other processes wait for it on a lease."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self._flights.do(key, lambda: self._compute_once(key, compute, ttl))
+
+    def _compute_once(self, key, compute, ttl):
+        owner = uuid.uuid4().hex
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+            if self._acquire(key, owner):
+                break
+            time.sleep(LEASE_POLL_SECONDS)
+        try:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            with self._connection() as db:
+                db.execute("DELETE FROM leases WHERE namespace = ? AND key = ? AND owner = ?",
+                           (self.namespace, key, owner))
+
+    def _acquire(self, key, owner):
+        now = time.time()
+        with self._connection() as db:
+            # An expired lease belonged to a worker that died or hung
+            db.execute("DELETE FROM leases WHERE namespace = ? AND key = ? AND expires <= ?",
+                       (self.namespace, key, now))
+            return db.execute("INSERT OR IGNORE INTO leases (namespace, key, owner, expires) VALUES (?, ?, ?, ?)",
+                              (self.namespace, key, owner, now + CACHE_LEASE_SECONDS)).rowcount == 1
+
+    def items(self, since=0.0):
+        """(key, value, stored) of live entries stored after `since`, oldest first"""
+        rows = self._connection().execute(
+            "SELECT key, value, stored FROM entries WHERE namespace = ? AND stored > ? "
+            "AND (expires IS NULL OR expires > ?) ORDER BY stored", (self.namespace, since, time.time()))
+        return [(key, json.loads(value), stored) for key, value, stored in rows]
+
+    def count(self):
+        return self._connection().execute("SELECT count(*) FROM entries WHERE namespace = ?",
+                                          (self.namespace,)).fetchone()[0]
+
+    def clear(self):
+        with self._connection() as db:
+            db.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+
+
+def make_backend(namespace, max_entries=1000, ttl=None, path=None):
+    """A backend for one cache's namespace, of the kind set by NYAYA_CACHE_BACKEND.
+    `path` is the JSON snapshot of the memory backend; "sqlite" always uses NYAYA_CACHE_DB."""
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(namespace, max_entries, ttl)
+    if CACHE_BACKEND != "memory":
+        raise ValueError(f"Unknown NYAYA_CACHE_BACKEND {CACHE_BACKEND!r}; use 'memory' or 'sqlite'")
+    return MemoryBackend(namespace, max_entries, ttl, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the shared SQLite cache")
+    parser.add_argument("--path", default=CACHE_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="entries per namespace")
+    clear = commands.add_parser("clear", help="drop every entry of a namespace")
+    clear.add_argument("namespace")
+
+    args = parser.parse_args(argv)
+    if args.command == "stats":
+        db = SQLiteBackend("", path=args.path)._connection()
+        rows = db.execute("SELECT namespace, count(*), sum(length(value)) FROM entries GROUP BY namespace")
+        for namespace, entries, size in rows:
+            print(f"{namespace:12} {entries:>7} entries  {size / 1024:>9.1f} KiB")
+    elif args.command == "clear":
+        SQLiteBackend(args.namespace, path=args.path).clear()
+
+
+if __name__ == "__main__":
+    main()
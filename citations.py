@@ -0,0 +1,270 @@
+"""Citation extraction and validation for model answers.
+
+References such as "Section 154 of the Code of Criminal Procedure",
+"Sections 437 and 439 CrPC", "u/s 498A IPC", "302 IPC" or "Article 21" are
+found with one compiled pattern, their act names and abbreviations resolved
+(IPC, BNS, CrPC, BNSS, Evidence Act, BSA, ...) and each section looked up in a
+set of valid (act, section) pairs built from data/citations.json plus the
+statute corpus in data/statutes. Rendered answers link valid sections (with
+the section title as a tooltip where the corpus has it) and flag sections
+that don't exist:
+
+    python citations.py check "Section 156(3) CrPC and Section 999 IPC"
+    python citations.py bench --chars 20000
+
+data/citations.json lists each act with its abbreviations and names, the
+number of its last section, and sections inserted later with letter suffixes
+(120B, 498A, ...). Stored answers are never changed; only their rendering is.
+"""
+import argparse
+import glob
+import html
+import json
+import os
+import re
+import sys
+import threading
+import time
+from urllib.parse import quote_plus
+
+from metrics import span
+from statute_index import STATUTE_CORPUS_DIR
+
+# Citation settings (override with environment variables)
+CITATIONS_ENABLED = os.getenv("NYAYA_CITATIONS", "1") != "0"
+CITATION_TABLE_PATH = os.getenv("NYAYA_CITATION_TABLE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "citations.json"))
+# Where valid citations link to; {query} is e.g. "Section 154 Code of Criminal Procedure, 1973"
+CITATION_LINK = os.getenv("NYAYA_CITATION_LINK", "https://indiankanoon.org/search/?formInput={query}")
+
+# A section or article number: 154, 498A, 156(3), 41A(1)(b). Letter suffixes
+# are upper case, so "302 and" isn't read as section "302A".
+NUMBER = r"\d{1,3}(?!\d)(?-i:[A-Z]{0,2})(?:\(\w{1,4}\))*"
+NUMBERS = rf"{NUMBER}(?:\s*(?:,|&|and|or|to|-|–)\s*{NUMBER})*"
+NUMBER_TOKEN = re.compile(r"(\d{1,3})([A-Z]{0,2})((?:\(\w{1,4}\))*)")
+UNIT = r"sections?|secs?\.|ss?\.|u/s\.?|articles?|arts?\."
+YEAR = re.compile(r",?\s*\d{4}$")
+MARKUP_CACHE_SIZE = 10000
+# "Article 3 of the Treaty" is not the Constitution
+OTHER_INSTRUMENT = re.compile(r"\s*of\s+(?:the\s+)?[A-Z]")
+
+
+def _alias_key(alias):
+    return re.sub(r"[\s.]", "", YEAR.sub("", alias.strip()).lower())
+
+
+def _alias_pattern(alias):
+    return "".join(r"\.?" if char == "." else r"\s+" if char == " " else re.escape(char) for char in alias)
+
+
+class CitationTable:
+    """Valid sections per act and the pattern that finds references to them"""
+
+    def __init__(self, acts, corpus_dir=STATUTE_CORPUS_DIR):
+        self.acts = {act["key"]: act for act in acts}
+        self._aliases = {}
+        for act in acts:
+            for alias in act.get("abbreviations", []) + act.get("names", []) + [act["name"], act["key"]]:
+                self._aliases[_alias_key(alias)] = act["key"]
+
+        # (act key, section) pairs, so checking a reference is one set lookup
+        self.valid = set()
+        for act in acts:
+            self.valid.update((act["key"], str(number)) for number in range(1, act["sections"] + 1))
+            self.valid.update((act["key"], section) for section in act.get("inserted", []))
+        self.titles = {}
+        for path in sorted(glob.glob(os.path.join(corpus_dir, "*.jsonl"))):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    key = self.resolve(record.get("short", "")) or self.resolve(record.get("act", ""))
+                    if key is not None:
+                        self.valid.add((key, record["section"]))
+                        self.titles[(key, record["section"])] = record["title"]
+
+        def alternatives(aliases):
+            patterns = sorted({_alias_pattern(alias) for alias in aliases}, key=len, reverse=True)
+            return rf"(?:{'|'.join(patterns)})(?:,?\s*\d{{4}})?(?!\w)"
+
+        all_aliases = [alias for act in acts for alias in act.get("abbreviations", []) + act.get("names", [])]
+        names = alternatives(all_aliases)
+        abbreviations = alternatives([alias for act in acts for alias in act.get("abbreviations", [])])
+        # Every reference starts with a digit, a unit or an act name; checking
+        # that first character before trying the alternatives more than halves
+        # the time spent on text without citations
+        first = re.escape("".join(sorted({char for alias in all_aliases + ["s", "u", "a"]
+                                          for char in (alias[0].lower(), alias[0].upper())})))
+        # Rendered links per (format, act, section, text): answers cite the same sections over and over
+        self._markup = {}
+        self.pattern = re.compile(
+            rf"(?=[\d{first}])(?:"
+            # Section 154 of the CrPC / Sections 437 and 439, CrPC / Article 21
+            rf"\b(?P<unit>{UNIT})\s*(?P<numbers>{NUMBERS})(?:\s*,?\s*(?:(?:of|under|in)\s+)?(?:the\s+)?(?P<act>{names}))?"
+            # IPC Section 302 / CrPC s. 154
+            rf"|\b(?P<act2>{names})\s*,?\s*(?P<unit2>{UNIT})\s*(?P<numbers2>{NUMBERS})"
+            # 302 IPC / 498A and 406 IPC
+            rf"|\b(?P<numbers3>{NUMBERS})\s+(?P<act3>{abbreviations}))",
+            re.IGNORECASE,
+        )
+
+    def resolve(self, alias):
+        """The act key for an act name or abbreviation, or None"""
+        return self._aliases.get(_alias_key(alias)) if alias else None
+
+    def extract(self, text):
+        """Citations in text, in order: one dict per section number with its
+        position, act, section, status ("verified" when the statute corpus has
+        the section, "valid", or "invalid") and, when known, title"""
+        citations = []
+        for match in self.pattern.finditer(text):
+            if match.group("numbers") is not None:
+                group, unit, act_text = "numbers", match.group("unit"), match.group("act")
+            elif match.group("numbers2") is not None:
+                group, unit, act_text = "numbers2", match.group("unit2"), match.group("act2")
+            else:
+                group, unit, act_text = "numbers3", "", match.group("act3")
+            key = self.resolve(act_text)
+            if key is None:
+                # A bare "Article 21" means the Constitution; a bare "Section 10" means nothing
+                if not unit.lower().startswith("art") or OTHER_INSTRUMENT.match(text, match.end()):
+                    continue
+                key = "Constitution"
+            act = self.acts[key]
+            offset = match.start(group)
+            for token in NUMBER_TOKEN.finditer(match.group(group)):
+                section = str(int(token.group(1))) + token.group(2)
+                title = self.titles.get((key, section))
+                status = "verified" if title else "valid" if (key, section) in self.valid else "invalid"
+                citations.append({
+                    "start": offset + token.start(), "end": offset + token.end(), "reference_end": match.end(),
+                    "act": key, "section": section, "subsection": token.group(3), "status": status, "title": title,
+                })
+        return citations
+
+    def describe(self, citation):
+        """Tooltip text for a citation"""
+        act = self.acts[citation["act"]]
+        text = f"{act.get('unit', 'Section')} {citation['section']}, {act['name']}"
+        if citation["status"] == "invalid":
+            return f"No {text}"
+        if citation["title"]:
+            text += f": {citation['title']}"
+        if act.get("replaced_by"):
+            text += f" (replaced by the {self.acts[act['replaced_by']]['name']} from 1 July 2024)"
+        return text
+
+    def link(self, citation):
+        act = self.acts[citation["act"]]
+        return CITATION_LINK.format(query=quote_plus(f"{act.get('unit', 'Section')} {citation['section']} {act['name']}"))
+
+    def _annotate(self, text, markup_format, escape, linked, flagged, note):
+        pieces, position, invalid = [], 0, []
+        citations = self.extract(text)
+        for i, citation in enumerate(citations):
+            pieces.append(escape(text[position:citation["start"]]))
+            token = text[citation["start"]:citation["end"]]
+            key = (markup_format, citation["act"], citation["section"], token)
+            markup = self._markup.get(key)
+            if markup is None:
+                if len(self._markup) >= MARKUP_CACHE_SIZE:
+                    self._markup.clear()
+                markup = self._markup[key] = (flagged if citation["status"] == "invalid" else linked)(citation, token)
+            pieces.append(markup)
+            if citation["status"] == "invalid":
+                invalid.append(self.describe(citation))
+            position = citation["end"]
+            # Invalid sections are explained once, after the reference they are part of
+            last_of_reference = i + 1 == len(citations) or citations[i + 1]["reference_end"] != citation["reference_end"]
+            if invalid and last_of_reference:
+                pieces.append(escape(text[position:citation["reference_end"]]))
+                pieces.append(note(invalid))
+                position, invalid = citation["reference_end"], []
+        pieces.append(escape(text[position:]))
+        return "".join(pieces)
+
+    def annotate_markdown(self, text):
+        """Markdown with valid citations linked and invalid ones flagged"""
+        def linked(citation, token):
+            return f"[{token}]({self.link(citation)} \"{self.describe(citation).replace(chr(34), chr(39))}\")"
+
+        return self._annotate(text, "markdown", lambda piece: piece, linked, lambda citation, token: token,
+                              lambda notes: f" ⚠️ *({'; '.join(notes)})*")
+
+    def annotate_html(self, text):
+        """Escaped HTML of text with valid citations linked and invalid ones flagged"""
+        def linked(citation, token):
+            return (f"<a class='citation' href='{html.escape(self.link(citation))}' target='_blank' "
+                    f"title='{html.escape(self.describe(citation))}'>{html.escape(token)}</a>")
+
+        def flagged(citation, token):
+            return f"<span class='citation-invalid' title='{html.escape(self.describe(citation))}'>{html.escape(token)}</span>"
+
+        return self._annotate(text, "html", html.escape, linked, flagged, lambda notes: " ⚠️")
+
+
+def load_citation_table(path=CITATION_TABLE_PATH, corpus_dir=STATUTE_CORPUS_DIR):
+    with open(path, encoding="utf-8") as f:
+        return CitationTable(json.load(f)["acts"], corpus_dir)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_citation_table():
+    """Get the process-wide citation table, loading it on first use"""
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = load_citation_table()
+        return _table
+
+
+def annotate_markdown(text):
+    """Markdown answer with its citations linked or flagged (unchanged when NYAYA_CITATIONS=0)"""
+    if not CITATIONS_ENABLED:
+        return text
+    with span("citations"):
+        return get_citation_table().annotate_markdown(text)
+
+
+def annotate_html(text):
+    """Escaped HTML of an answer with its citations linked or flagged"""
+    if not CITATIONS_ENABLED:
+        return html.escape(text)
+    with span("citations"):
+        return get_citation_table().annotate_html(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find and check statute citations in text")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check = commands.add_parser("check", help="list the citations in a text (or stdin)")
+    check.add_argument("text", nargs="?")
+
+    bench = commands.add_parser("bench", help="time annotation of a long synthetic answer")
+    bench.add_argument("--chars", type=int, default=20000)
+    bench.add_argument("--repeat", type=int, default=50)
+
+    args = parser.parse_args(argv)
+    table = get_citation_table()
+    if args.command == "check":
+        text = args.text if args.text is not None else sys.stdin.read()
+        for citation in table.extract(text):
+            print(f"{citation['status']:8}  {text[citation['start']:citation['end']]:8}  {table.describe(citation)}")
+    elif args.command == "bench":
+        paragraph = ("An FIR is registered under Section 154 of the Code of Criminal Procedure, 1973, and a Magistrate "
+                     "may order investigation under Section 156(3) CrPC. Offences under Sections 498A and 406 IPC are "
+                     "cognizable; bail is governed by 437 and 439 CrPC, and Article 21 protects personal liberty. ")
+        text = (paragraph * (args.chars // len(paragraph) + 1))[:args.chars]
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            table.annotate_html(text)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        print(f"{len(table.extract(text))} citations in {len(text)} chars: {elapsed * 1000:.2f} ms per annotation")
+
+
+if __name__ == "__main__":
+    main()
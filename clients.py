@@ -0,0 +1,173 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+from resilience import DEADLINE_SECONDS, RETRY_STATUSES, RetryableResponse, call
+
+# Connection pool and timeout settings (override with environment variables)
+HTTP_POOL_SIZE = int(os.getenv("NYAYA_HTTP_POOL_SIZE", "20"))
+HTTP_TIMEOUT = float(os.getenv("NYAYA_HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("NYAYA_HTTP_CONNECT_TIMEOUT", "10"))
+MAX_OPENAI_CLIENTS = int(os.getenv("NYAYA_MAX_OPENAI_CLIENTS", "32"))
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+
+# The OpenAI SDK and requests take most of a cold start to import, so they are
+# imported on first use; demo-mode sessions never load them.
+#
+# Retries are left to resilience.py, which bounds them with a deadline and a
+# circuit breaker, so the OpenAI clients don't retry on their own.
+
+# Process-wide registries. Modules are imported once per process, so these
+# survive Streamlit reruns and are shared by every session on the server.
+_lock = threading.Lock()
+_openai_clients = OrderedDict()
+_async_openai_clients = OrderedDict()
+# Evicted async clients -> the task that closes them
+_closing_async_clients = {}
+_http_session = None
+
+
+def get_openai_client(api_key):
+    """Get a shared OpenAI client for an API key, creating it on first use"""
+    import openai
+
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is not None:
+            _openai_clients.move_to_end(api_key)
+            return client
+
+        limits, timeout = _http_settings()
+        client = openai.OpenAI(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=0,
+            http_client=openai.DefaultHttpxClient(limits=limits, timeout=timeout),
+        )
+        _openai_clients[api_key] = client
+
+        # Keep the registry bounded when many users bring their own keys. An
+        # evicted client may still be mid-request on another thread, so it is
+        # only dropped; its pool is released once the last user lets it go.
+        while len(_openai_clients) > MAX_OPENAI_CLIENTS:
+            _openai_clients.popitem(last=False)
+        return client
+
+
+def get_async_openai_client(api_key):
+    """Get a shared async OpenAI client for an API key.
+
+    Async connection pools belong to the event loop that first uses them, so
+    call this from a coroutine on a single long-lived loop (the batch runner
+    or the service).
+    """
+    import openai
+
+    with _lock:
+        client = _async_openai_clients.get(api_key)
+        if client is not None:
+            _async_openai_clients.move_to_end(api_key)
+            return client
+
+        limits, timeout = _http_settings()
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout),
+        )
+        _async_openai_clients[api_key] = client
+
+        # The service sees every key callers send, rejected ones included
+        while len(_async_openai_clients) > MAX_OPENAI_CLIENTS:
+            _, evicted = _async_openai_clients.popitem(last=False)
+            _closing_async_clients[evicted] = asyncio.get_running_loop().create_task(_close_evicted(evicted))
+        return client
+
+
+async def _close_evicted(client):
+    # A request may still be using the client; every call made with it is
+    # over by its deadline, so its pool is closed after that
+    await asyncio.sleep(DEADLINE_SECONDS)
+    with _lock:
+        _closing_async_clients.pop(client, None)
+    await client.close()
+
+
+def _http_settings():
+    import openai
+
+    # DEFAULT_CONNECTION_LIMITS is an httpx.Limits; reuse its type so we
+    # don't depend on httpx directly
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+    )
+    return limits, openai_timeout(HTTP_TIMEOUT)
+
+
+def openai_timeout(seconds):
+    """OpenAI request timeout for an attempt with `seconds` left before its deadline"""
+    import openai
+
+    return openai.Timeout(min(HTTP_TIMEOUT, seconds), connect=min(HTTP_CONNECT_TIMEOUT, seconds))
+
+
+def get_http_session():
+    """Get the shared keep-alive requests session (GitHub API, NyayaBot service)"""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def github_get(path, **kwargs):
+    """GET a GitHub API path through the shared session, retrying connection
+    errors and 429/5xx responses within a deadline (see resilience.py)"""
+    def attempt(timeout):
+        response = get_http_session().get(
+            f"{GITHUB_API_URL}{path}", timeout=(min(HTTP_CONNECT_TIMEOUT, timeout), min(HTTP_TIMEOUT, timeout)),
+            **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            raise RetryableResponse(response)
+        return response
+
+    try:
+        return call("github", attempt)
+    except RetryableResponse as e:
+        # Out of retries: the caller handles the error response as before
+        return e.response
+
+
+def close_clients():
+    """Close all pooled clients (used on shutdown and in tests)"""
+    global _http_session
+    with _lock:
+        while _openai_clients:
+            _, client = _openai_clients.popitem()
+            client.close()
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
+
+async def aclose_async_clients():
+    """Close pooled async OpenAI clients from the loop that used them"""
+    with _lock:
+        clients = list(_async_openai_clients.values()) + list(_closing_async_clients)
+        closing = list(_closing_async_clients.values())
+        _async_openai_clients.clear()
+        _closing_async_clients.clear()
+    for task in closing:
+        task.cancel()
+    for client in clients:
+        await client.close()
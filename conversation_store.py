@@ -0,0 +1,230 @@
+"""Persistent, append-only store for NyayaBot conversations.
+
+Conversations live in a local SQLite database in WAL mode, so every session
+on the server appends to it concurrently while others read. Each message is
+written as it is added, sessions resume from the conversation id in the URL
+by loading only the most recent messages, older ones are fetched a page at a
+time, and exports stream row by row:
+
+    python conversation_store.py list
+    python conversation_store.py export <conversation id> -o transcript.md
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import queue
+import secrets
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Store settings (override with environment variables)
+STORE_ENABLED = os.getenv("NYAYA_CONVERSATIONS", "1") != "0"
+STORE_PATH = os.getenv("NYAYA_CONVERSATIONS_PATH", os.path.join(".nyaya_cache", "conversations.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    covered INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+def _message(row):
+    role, content, timestamp = row[:3]
+    message = {"role": role, "content": content, "timestamp": timestamp}
+    if len(row) > 3:
+        message["created"] = row[3]
+    return message
+
+
+class ConversationStore:
+    """Conversations and their messages in one SQLite file.
+
+    Messages are numbered from 0 within a conversation and never rewritten.
+    Connections are pooled, as in repo_catalog.py, rather than kept per
+    thread (Streamlit runs every rerun on a new thread); WAL lets readers run
+    alongside the single writer, and writers wait up to `timeout` seconds for
+    each other.
+    """
+
+    def __init__(self, path=STORE_PATH, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._idle = queue.SimpleQueue()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db, db:
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Borrow an idle connection, or open one if every connection is in use"""
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            db = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps commits durable across crashes of the app at NORMAL;
+            # only a power loss can drop the last few messages
+            db.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield db
+        finally:
+            self._idle.put(db)
+
+    def create(self):
+        """Start a conversation and return its id"""
+        conversation_id = secrets.token_urlsafe(12)
+        now = time.time()
+        with self._connection() as db, db:
+            db.execute("INSERT INTO conversations (id, created, updated) VALUES (?, ?, ?)",
+                       (conversation_id, now, now))
+        return conversation_id
+
+    def exists(self, conversation_id):
+        with self._connection() as db:
+            row = db.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def append(self, conversation_id, message):
+        """Write one message at the end of a conversation; returns its number"""
+        now = time.time()
+        with self._connection() as db, db:
+            # The update takes the write lock, so the number read back is ours
+            updated = db.execute("UPDATE conversations SET messages = messages + 1, updated = ? WHERE id = ?",
+                                 (now, conversation_id))
+            if not updated.rowcount:
+                raise KeyError(conversation_id)
+            seq = db.execute("SELECT messages FROM conversations WHERE id = ?", (conversation_id,)).fetchone()[0] - 1
+            db.execute("INSERT INTO messages (conversation_id, seq, role, content, timestamp, created) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (conversation_id, seq, message["role"], message["content"], message.get("timestamp"), now))
+        return seq
+
+    def count(self, conversation_id):
+        with self._connection() as db:
+            row = db.execute("SELECT messages FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else 0
+
+    def messages(self, conversation_id, start, stop):
+        """Messages numbered start..stop-1, oldest first, with when they were written as "created" """
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT role, content, timestamp, created FROM messages WHERE conversation_id = ? AND seq >= ? "
+                "AND seq < ? ORDER BY seq", (conversation_id, max(start, 0), stop))
+            return [_message(row) for row in rows]
+
+    def tail(self, conversation_id, limit):
+        """The last `limit` messages and the number of the first one returned"""
+        total = self.count(conversation_id)
+        start = max(total - limit, 0)
+        return self.messages(conversation_id, start, total), start
+
+    def summary(self, conversation_id):
+        """The saved rolling summary state (see history.new_summary_state)"""
+        with self._connection() as db:
+            row = db.execute("SELECT summary, covered FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return {"summary": row[0], "covered": row[1]} if row else {"summary": "", "covered": 0}
+
+    def save_summary(self, conversation_id, summary_state):
+        with self._connection() as db, db:
+            db.execute("UPDATE conversations SET summary = ?, covered = ? WHERE id = ?",
+                       (summary_state["summary"], summary_state["covered"], conversation_id))
+
+    def conversations(self, limit=50):
+        """Most recently updated conversations: (id, updated, message count)"""
+        with self._connection() as db:
+            return db.execute(
+                "SELECT id, updated, messages FROM conversations ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+
+    def export(self, conversation_id, f, fmt="markdown"):
+        """Write a transcript to the text file `f` one message at a time"""
+        if fmt == "markdown":
+            f.write(f"# NyayaBot conversation {conversation_id}\n\n")
+        with self._connection() as db:
+            rows = db.execute("SELECT role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY seq",
+                              (conversation_id,))
+            for row in rows:
+                message = _message(row)
+                if fmt == "jsonl":
+                    f.write(json.dumps(message, ensure_ascii=False) + "\n")
+                else:
+                    speaker = "You" if message["role"] == "user" else "NyayaBot"
+                    stamp = f" ({message['timestamp']})" if message["timestamp"] else ""
+                    f.write(f"**{speaker}**{stamp}:\n\n{message['content']}\n\n")
+
+    def export_file(self, conversation_id, fmt="markdown"):
+        """A transcript in a temporary file, rewound and ready to read"""
+        f = tempfile.TemporaryFile()
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        self.export(conversation_id, text, fmt)
+        text.flush()
+        text.detach()
+        f.seek(0)
+        return f
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Get the process-wide conversation store, or None when it is disabled"""
+    global _store
+    if not STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List and export stored NyayaBot conversations")
+    parser.add_argument("--path", default=STORE_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listing = commands.add_parser("list", help="most recently updated conversations")
+    listing.add_argument("-n", type=int, default=20)
+
+    export = commands.add_parser("export", help="write a conversation transcript")
+    export.add_argument("conversation_id")
+    export.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export.add_argument("--format", choices=["markdown", "jsonl"], default="markdown")
+
+    args = parser.parse_args(argv)
+    store = ConversationStore(args.path)
+    if args.command == "list":
+        for conversation_id, updated, count in store.conversations(args.n):
+            print(f"{conversation_id}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(updated))}  {count} messages")
+    elif args.command == "export":
+        if not store.exists(args.conversation_id):
+            sys.exit(f"No conversation {args.conversation_id}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                store.export(args.conversation_id, f, args.format)
+        else:
+            store.export(args.conversation_id, sys.stdout, args.format)
+
+
+if __name__ == "__main__":
+    main()
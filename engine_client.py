@@ -0,0 +1,108 @@
+import json
+import os
+
+import nyaya_engine
+from clients import HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, get_http_session
+
+# Set NYAYA_SERVICE_URL to send engine calls to nyaya_service.py; otherwise the
+# engine runs inside the Streamlit process
+SERVICE_URL = os.getenv("NYAYA_SERVICE_URL", "").rstrip("/")
+SERVICE_TOKEN = os.getenv("NYAYA_SERVICE_TOKEN", "")
+
+
+class EngineError(Exception):
+    """An engine call failed (upstream error or service error); `code` is
+    "invalid_api_key" when OpenAI rejected the key and "upstream_unavailable"
+    while the service's circuit breaker for OpenAI is open"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+def _headers(api_key):
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["X-OpenAI-Key"] = api_key
+    if SERVICE_TOKEN:
+        headers["Authorization"] = f"Bearer {SERVICE_TOKEN}"
+    return headers
+
+
+def _post(path, payload, api_key, stream=False):
+    response = get_http_session().post(
+        f"{SERVICE_URL}{path}",
+        data=json.dumps(payload),
+        headers=_headers(api_key),
+        timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT),
+        stream=stream,
+    )
+    if response.status_code != 200:
+        try:
+            body = response.json()
+        except ValueError:
+            raise EngineError(response.text)
+        raise EngineError(body.get("error", response.text), body.get("code"))
+    return response
+
+
+def _read_events(response):
+    """Yield the JSON payloads of a Server-Sent Events response"""
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+
+
+def _chat_payload(messages, summary_state):
+    return {
+        "messages": [{"role": msg["role"], "content": msg["content"]} for msg in messages],
+        "summary_state": summary_state,
+    }
+
+
+def chat_answer(messages, summary_state, api_key):
+    """Answer the latest message of a chat; summary_state is updated in place"""
+    if not SERVICE_URL:
+        return nyaya_engine.chat_answer(messages, summary_state, api_key)
+    result = _post("/v1/chat", _chat_payload(messages, summary_state), api_key).json()
+    summary_state.update(result["summary_state"])
+    return result["answer"]
+
+
+def stream_chat(messages, summary_state, api_key):
+    """Yield the answer to the latest message of a chat as it is generated"""
+    if not SERVICE_URL:
+        yield from nyaya_engine.stream_chat(messages, summary_state, api_key)
+        return
+    response = _post("/v1/chat/stream", _chat_payload(messages, summary_state), api_key, stream=True)
+    for event in _read_events(response):
+        if "error" in event:
+            raise EngineError(event["error"], event.get("code"))
+        if event.get("done"):
+            summary_state.update(event["summary_state"])
+        elif "delta" in event:
+            yield event["delta"]
+
+
+def legal_answer(query, api_key):
+    """Answer a single legal question"""
+    if not SERVICE_URL:
+        return nyaya_engine.legal_answer(query, api_key)
+    return _post("/v1/legal", {"query": query}, api_key).json()["answer"]
+
+
+def cached_analysis(repo_info, commit_sha):
+    """A cached analysis of the repository at this commit, or None. Always None
+    with a remote engine, whose cache is checked by analyze_repository."""
+    if SERVICE_URL:
+        return None
+    return nyaya_engine.cached_analysis(repo_info, commit_sha)
+
+
+def analyze_repository(repo_info, readme, api_key, commit_sha=None):
+    """Legal-tech analysis of a repository (cached per commit when commit_sha is given)"""
+    if not SERVICE_URL:
+        return nyaya_engine.analyze_repository(repo_info, readme, api_key, commit_sha)
+    payload = {"repo_info": repo_info, "readme": readme, "commit_sha": commit_sha}
+    return _post("/v1/repos/analyze", payload, api_key).json()["analysis"]
@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cache_backend import make_backend
+from clients import github_get
+from metrics import record_cache, span
+from resilience import UpstreamUnavailable
+
+# GitHub cache settings (override with environment variables)
+GITHUB_CACHE_FRESH_SECONDS = float(os.getenv("NYAYA_GITHUB_CACHE_FRESH_SECONDS", "60"))
+GITHUB_CACHE_MAX_ENTRIES = int(os.getenv("NYAYA_GITHUB_CACHE_MAX_ENTRIES", "500"))
+# Below this many remaining requests, serve stale copies instead of spending quota
+GITHUB_RATE_LIMIT_RESERVE = int(os.getenv("NYAYA_GITHUB_RATE_LIMIT_RESERVE", "5"))
+
+
+def _to_response(entry, url):
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+
+    response = Response()
+    response.status_code = entry["status"]
+    response._content = base64.b64decode(entry["content"])
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = entry["encoding"]
+    response.url = url
+    return response
+
+
+def _to_entry(response, fetched):
+    # Bodies are stored base64-encoded so the entry survives a JSON backend
+    return {
+        "status": response.status_code,
+        "content": base64.b64encode(response.content).decode("ascii"),
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+        "fetched": fetched,
+    }
+
+
+class GitHubCache:
+    """HTTP cache for GitHub API GETs.
+
+    Responses are stored with their ETag/Last-Modified validators. A copy
+    younger than `fresh_seconds` is served without a request; older copies are
+    revalidated with If-None-Match/If-Modified-Since, and a 304 (which GitHub
+    does not count against the rate limit) refreshes them. When the rate limit
+    is nearly spent, or GitHub errors or is cut off by its circuit breaker, a
+    stale copy is served instead. Responses and rate-limit state live in cache
+    backends (see cache_backend.py), so with a shared backend a response
+    fetched by one worker is served to all, and a first fetch of a path is made
+    by one worker while the others wait for it.
+    """
+
+    def __init__(self, fresh_seconds=GITHUB_CACHE_FRESH_SECONDS, max_entries=GITHUB_CACHE_MAX_ENTRIES,
+                 reserve=GITHUB_RATE_LIMIT_RESERVE, fetch=github_get, backend=None, rate_limits=None):
+        self.fresh_seconds = fresh_seconds
+        self.max_entries = max_entries
+        self.reserve = reserve
+        self.fetch = fetch
+        self.stats = {"fresh_hits": 0, "revalidated": 0, "stale_served": 0, "misses": 0}
+        self.backend = backend or make_backend("github", max_entries)
+        # Latest rate-limit state per credential: {"remaining": int, "reset": epoch seconds}, kept until the reset
+        self.rate_limits = rate_limits or make_backend("github_rate_limits", 100)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _credential(headers):
+        # Rate limits are per token (or per IP when unauthenticated); don't keep tokens around
+        token = headers.get("Authorization", "")
+        return hashlib.sha256(token.encode()).hexdigest()[:16] if token else "anonymous"
+
+    @staticmethod
+    def _key(path, headers, params):
+        return json.dumps([path, sorted((params or {}).items()), headers.get("Accept", ""),
+                           GitHubCache._credential(headers)])
+
+    def _count(self, result):
+        with self._lock:
+            self.stats[result] += 1
+        record_cache("github", result)
+
+    def _rate_limited(self, credential, now):
+        limit = self.rate_limits.get(credential)
+        return limit is not None and limit["remaining"] <= self.reserve and limit["reset"] > now
+
+    def _record_rate_limit(self, credential, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            self.rate_limits.set(credential, {"remaining": int(remaining), "reset": float(reset)},
+                                 ttl=max(float(reset) - time.time(), 1.0))
+
+    def get(self, path, headers=None, params=None):
+        """GET a GitHub API path through the cache; returns a requests.Response"""
+        headers = dict(headers or {})
+        key = self._key(path, headers, params)
+        credential = self._credential(headers)
+        now = time.time()
+
+        entry = self.backend.get(key)
+        if entry is None:
+            return self._first_fetch(key, credential, path, headers, params, now)
+        if now - entry["fetched"] < self.fresh_seconds:
+            self._count("fresh_hits")
+            return _to_response(entry, path)
+        if self._rate_limited(credential, now):
+            self._count("stale_served")
+            return _to_response(entry, path)
+
+        if entry["headers"].get("ETag"):
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        import requests
+
+        try:
+            with span("github"):
+                response = self.fetch(path, headers=headers, params=params)
+        except (requests.RequestException, UpstreamUnavailable):
+            self._count("stale_served")
+            return _to_response(entry, path)
+
+        self._record_rate_limit(credential, response)
+        if response.status_code == 304:
+            self.backend.set(key, dict(entry, fetched=now))
+            self._count("revalidated")
+            return _to_response(entry, path)
+        if response.status_code >= 400:
+            # Rate limited (403/429) or a GitHub outage: stale beats an error
+            self._count("stale_served")
+            return _to_response(entry, path)
+
+        self._count("misses")
+        if response.status_code == 200:
+            self.backend.set(key, _to_entry(response, now))
+        return response
+
+    def _first_fetch(self, key, credential, path, headers, params, now):
+        """Fetch a path with no cached copy; concurrent first fetches share one request"""
+        fetched = {}
+
+        def fetch():
+            with span("github"):
+                response = self.fetch(path, headers=headers, params=params)
+            self._record_rate_limit(credential, response)
+            fetched["response"] = response
+            return _to_entry(response, now)
+
+        entry = self.backend.get_or_compute(key, fetch, ttl=lambda entry: None if entry["status"] == 200 else False)
+        if "response" in fetched:
+            self._count("misses")
+            return fetched["response"]
+        # Fetched by another thread or worker while this one waited
+        self._count("fresh_hits")
+        return _to_response(entry, path)
+
+    def summary(self):
+        """Hit counts, hit rate and the lowest known remaining quota for display"""
+        remaining = [limit["remaining"] for _, limit, _ in self.rate_limits.items()]
+        with self._lock:
+            hits = self.stats["fresh_hits"] + self.stats["revalidated"] + self.stats["stale_served"]
+            total = hits + self.stats["misses"]
+            return dict(self.stats, hits=hits, hit_rate=hits / total if total else 0.0,
+                        entries=self.backend.count(), rate_limit_remaining=min(remaining) if remaining else None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_github_cache():
+    """Get the process-wide GitHub response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GitHubCache()
+        return _cache
+
+
+def cached_github_get(path, headers=None, params=None):
+    """GET a GitHub API path through the process-wide cache"""
+    return get_github_cache().get(path, headers=headers, params=params)
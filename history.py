@@ -0,0 +1,125 @@
+import os
+
+# History window settings (override with environment variables)
+HISTORY_TOKEN_BUDGET = int(os.getenv("NYAYA_HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_KEEP_MESSAGES = int(os.getenv("NYAYA_HISTORY_KEEP_MESSAGES", "6"))
+HISTORY_SUMMARY_BATCH = int(os.getenv("NYAYA_HISTORY_SUMMARY_BATCH", "4"))
+SUMMARY_MODEL = os.getenv("NYAYA_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 300
+
+SUMMARY_PROMPT = """You maintain a running summary of a legal consultation between a user and NyayaBot, an assistant on Indian law.
+Update the existing summary with the new messages. Keep the facts of the user's situation, the legal questions asked, the statutes and sections cited, and any advice or next steps already given.
+Write at most 200 words in plain prose. Do not add new legal analysis."""
+
+_encoding = None
+
+
+def _get_encoding():
+    # Loaded on first use: importing tiktoken and its vocabulary slows cold starts
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when installed, otherwise estimate ~4 characters per token"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    """Tokens used by one chat message, including the per-message overhead"""
+    return count_tokens(message["content"]) + 4
+
+
+def new_summary_state():
+    """Per-session summary state: the summary text and how many messages it covers"""
+    return {"summary": "", "covered": 0}
+
+
+def format_transcript(messages):
+    """Render messages as a plain transcript for the summarizer"""
+    return "\n\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
+
+
+def _window_start(chat, budget, limit):
+    """Index of the oldest message in the verbatim window, newest first within the budget"""
+    start = len(chat)
+    used = 0
+    while start > 0 and len(chat) - start < limit:
+        cost = message_tokens(chat[start - 1])
+        if start < len(chat) and used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def plan_window(system_prompt, messages, summary_state, token_budget=HISTORY_TOKEN_BUDGET,
+                keep_messages=HISTORY_KEEP_MESSAGES, summary_batch=HISTORY_SUMMARY_BATCH):
+    """Decide which messages are sent verbatim and which must be folded.
+
+    Returns (chat, start, to_fold): the user/assistant messages, the index of
+    the first one sent verbatim, and the messages to add to the summary
+    before sending (empty when the summary is up to date).
+    """
+    chat = [msg for msg in messages if msg["role"] in ["user", "assistant"]]
+    budget = token_budget - count_tokens(system_prompt) - SUMMARY_MAX_TOKENS
+
+    # Never re-summarize or resend messages already covered by the summary
+    covered = min(summary_state["covered"], len(chat) - 1)
+    start = max(_window_start(chat, budget, keep_messages + summary_batch - 1), covered)
+
+    # Fold messages that fell out of the window into the summary
+    if start > summary_state["covered"]:
+        start = max(_window_start(chat, budget, keep_messages), start)
+        return chat, start, chat[summary_state["covered"]:start]
+    return chat, start, []
+
+
+def assemble_conversation(system_prompt, chat, start, summary_state):
+    """System prompt, rolling summary and the verbatim window as API messages"""
+    conversation = [{"role": "system", "content": system_prompt}]
+    if summary_state["summary"]:
+        conversation.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{summary_state['summary']}",
+        })
+    for msg in chat[start:]:
+        conversation.append({"role": msg["role"], "content": msg["content"]})
+    return conversation
+
+
+def build_conversation(system_prompt, messages, summary_state, summarize, **window):
+    """Build the API conversation within a fixed token budget.
+
+    At least the most recent `keep_messages` user/assistant messages are sent
+    verbatim (fewer if they alone exceed the budget, but always the latest
+    one). Older messages are folded into a rolling summary by calling
+    `summarize(previous_summary, new_messages)`, which only ever sees the
+    messages that left the window since the last update. To avoid a summary
+    call on every turn, the window may grow by up to `summary_batch - 1`
+    messages before it is folded back down. `summary_state` is updated in
+    place so the summary is reused on later turns.
+    """
+    chat, start, to_fold = plan_window(system_prompt, messages, summary_state, **window)
+    if to_fold:
+        summary_state["summary"] = summarize(summary_state["summary"], to_fold)
+        summary_state["covered"] = start
+    return assemble_conversation(system_prompt, chat, start, summary_state)
+
+
+async def abuild_conversation(system_prompt, messages, summary_state, summarize, **window):
+    """Async build_conversation; `summarize` is a coroutine function"""
+    chat, start, to_fold = plan_window(system_prompt, messages, summary_state, **window)
+    if to_fold:
+        summary_state["summary"] = await summarize(summary_state["summary"], to_fold)
+        summary_state["covered"] = start
+    return assemble_conversation(system_prompt, chat, start, summary_state)
@@ -0,0 +1,199 @@
+"""Offline intent router for demo mode and API-outage fallbacks.
+
+Intents and their canned answers live in data/intents.json. All patterns are
+compiled into one Aho-Corasick automaton, so routing a query is a single pass
+over its characters however many topics are configured. Matches must sit on
+word boundaries, so "rent" matches "pay rent" but not "parent".
+
+    python intent_router.py route "my landlord wants to evict me"
+    python intent_router.py bench --topics 10 100 1000
+"""
+import argparse
+import json
+import os
+import random
+import string
+import threading
+import time
+from collections import deque
+
+INTENTS_PATH = os.getenv("NYAYA_INTENTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intents.json"))
+
+
+class AhoCorasick:
+    """Multi-pattern matcher; finds every occurrence of every pattern in one pass"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # Breadth-first pass to set failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def finditer(self, text):
+        """Yield (start, end, pattern_id) for every match in text"""
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                yield index + 1 - len(patterns[pattern_id]), index + 1, pattern_id
+
+
+def _is_boundary(text, index):
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class IntentRouter:
+    """Route a query to the intent whose patterns it matches best"""
+
+    def __init__(self, intents, default_response):
+        self.intents = intents
+        self.default_response = default_response
+        patterns = []
+        self._pattern_intents = []
+        for intent_id, intent in enumerate(intents):
+            for pattern in intent["patterns"]:
+                patterns.append(pattern.lower())
+                self._pattern_intents.append(intent_id)
+        self._matcher = AhoCorasick(patterns)
+
+    @classmethod
+    def from_file(cls, path=INTENTS_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["intents"], data["default"])
+
+    def match(self, query):
+        """Return the best matching intent, or None.
+
+        Each whole-word match scores the pattern's length, so specific
+        phrases outweigh short keywords; ties go to the intent listed first.
+        """
+        text = query.lower()
+        scores = {}
+        for start, end, pattern_id in self._matcher.finditer(text):
+            if _is_boundary(text, start - 1) and _is_boundary(text, end):
+                intent_id = self._pattern_intents[pattern_id]
+                scores[intent_id] = scores.get(intent_id, 0) + end - start
+        if not scores:
+            return None
+        best = max(scores, key=lambda intent_id: (scores[intent_id], -intent_id))
+        return self.intents[best]
+
+    def respond(self, query):
+        """Canned answer for the query, or the default answer when nothing matches"""
+        intent = self.match(query)
+        if intent is not None:
+            return intent["response"]
+        return self.default_response.replace("{query}", query)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    """Get the process-wide router loaded from the intents file"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = IntentRouter.from_file()
+        return _router
+
+
+def _synthetic_intents(n_topics, patterns_per_topic, rng):
+    intents = []
+    for topic in range(n_topics):
+        patterns = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(patterns_per_topic)]
+        intents.append({"name": f"topic{topic}", "patterns": patterns, "response": f"answer {topic}"})
+    return intents
+
+
+def _naive_match(intents, query):
+    # Baseline: one substring scan per pattern per topic
+    text = query.lower()
+    for intent in intents:
+        if any(pattern in text for pattern in intent["patterns"]):
+            return intent
+    return None
+
+
+def run_benchmark(topic_counts, patterns_per_topic=5, queries=2000, seed=7):
+    """Time routing against a naive per-topic scan as the number of topics grows"""
+    rng = random.Random(seed)
+    words = ["how", "do", "i", "file", "a", "complaint", "against", "my", "landlord", "for",
+             "the", "police", "refused", "case", "court", "notice", "property", "rights"]
+    results = []
+    for n_topics in topic_counts:
+        intents = _synthetic_intents(n_topics, patterns_per_topic, rng)
+        router = IntentRouter(intents, "default")
+        texts = []
+        for _ in range(queries):
+            query = rng.choices(words, k=12)
+            if rng.random() < 0.5:
+                query.insert(rng.randrange(len(query)), rng.choice(rng.choice(intents)["patterns"]))
+            texts.append(" ".join(query))
+
+        started = time.perf_counter()
+        for text in texts:
+            router.match(text)
+        router_us = (time.perf_counter() - started) / queries * 1e6
+
+        started = time.perf_counter()
+        for text in texts:
+            _naive_match(intents, text)
+        naive_us = (time.perf_counter() - started) / queries * 1e6
+
+        results.append({"topics": n_topics, "patterns": n_topics * patterns_per_topic,
+                        "router_us_per_query": round(router_us, 2), "naive_us_per_query": round(naive_us, 2)})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route queries to canned intents and benchmark the matcher")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    route = commands.add_parser("route", help="show the intent chosen for a query")
+    route.add_argument("query")
+
+    bench = commands.add_parser("bench", help="compare against a naive scan as topics grow")
+    bench.add_argument("--topics", type=int, nargs="+", default=[10, 100, 1000])
+    bench.add_argument("--patterns", type=int, default=5, help="patterns per topic")
+    bench.add_argument("--queries", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+    if args.command == "route":
+        intent = get_intent_router().match(args.query)
+        print(intent["name"] if intent else "(default)")
+    elif args.command == "bench":
+        print(json.dumps(run_benchmark(args.topics, args.patterns, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sys
+import threading
+
+from cache_backend import make_backend
+from clients import get_openai_client, openai_timeout
+from resilience import call
+
+# Key validation settings (override with environment variables)
+# "eager": check a key with a models listing when "Validate Key" is pressed.
+# "optimistic": accept a key at once; the first completion confirms it and an
+# authentication error revokes it.
+KEY_VALIDATION_MODE = os.getenv("NYAYA_KEY_VALIDATION_MODE", "eager")
+KEY_VALID_TTL = float(os.getenv("NYAYA_KEY_VALID_TTL", "3600"))
+KEY_INVALID_TTL = float(os.getenv("NYAYA_KEY_INVALID_TTL", "300"))
+KEY_CACHE_MAX_ENTRIES = 1000
+REJECTED = "OpenAI rejected this API key."
+
+
+def key_hash(api_key):
+    # Keys are never stored, only their hashes
+    return hashlib.sha256(api_key.strip().encode()).hexdigest()
+
+
+def is_auth_error(error):
+    """True if an exception means the OpenAI key itself was rejected"""
+    # An OpenAI exception implies the SDK is loaded; don't import it just to check
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.AuthenticationError):
+        return True
+    return getattr(error, "code", None) == "invalid_api_key"
+
+
+class KeyValidator:
+    """Process-wide cache of API key validation results, keyed by key hash.
+
+    Valid results are kept for `valid_ttl` seconds and invalid ones for
+    `invalid_ttl`, so every session on the server shares one check per key
+    (every worker, with a shared cache backend). Concurrent checks of the same
+    key share one request. Transient failures (network errors, rate limits,
+    outages) are not cached.
+    """
+
+    def __init__(self, valid_ttl=KEY_VALID_TTL, invalid_ttl=KEY_INVALID_TTL, max_entries=KEY_CACHE_MAX_ENTRIES,
+                 check=None, backend=None):
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.max_entries = max_entries
+        self.check = check or (lambda api_key: call(
+            "openai", lambda timeout: get_openai_client(api_key).models.list(timeout=openai_timeout(timeout))))
+        self.stats = {"hits": 0, "checks": 0}
+        # key hash -> [valid, error message]
+        self.backend = backend or make_backend("keys", max_entries)
+
+    def cached(self, api_key):
+        """The cached verdict for a key (True/False), or None if unknown or expired"""
+        if not api_key:
+            return None
+        result = self.backend.get(key_hash(api_key))
+        return result[0] if result is not None else None
+
+    def _ttl(self, result):
+        valid, error = result
+        if valid:
+            return self.valid_ttl
+        # Only a rejection is a verdict; a failed check is retried next time
+        return self.invalid_ttl if error == REJECTED else False
+
+    def _record(self, api_key, valid):
+        self.backend.set(key_hash(api_key), [valid, None if valid else REJECTED], ttl=self._ttl)
+
+    def validate(self, api_key):
+        """Return (valid, error message); checks with OpenAI only when nothing is cached"""
+        if not api_key or len(api_key.strip()) < 10:
+            return False, "The key is too short to be an OpenAI API key."
+        cached = self.cached(api_key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached, None if cached else REJECTED
+        valid, error = self.backend.get_or_compute(key_hash(api_key), lambda: self._check(api_key), ttl=self._ttl)
+        return valid, error
+
+    def _check(self, api_key):
+        self.stats["checks"] += 1
+        try:
+            self.check(api_key)
+        except Exception as e:
+            if is_auth_error(e):
+                return [False, REJECTED]
+            return [False, f"Could not reach OpenAI to check the key: {e}"]
+        return [True, None]
+
+    def trusted(self, api_key):
+        """Whether a session may use the key without pressing "Validate Key" """
+        if not api_key:
+            return False
+        cached = self.cached(api_key)
+        if cached is not None:
+            return cached
+        return KEY_VALIDATION_MODE == "optimistic"
+
+    def confirm(self, api_key):
+        """A completion succeeded with this key"""
+        if api_key and not self.cached(api_key):
+            self._record(api_key, True)
+
+    def invalidate(self, api_key):
+        """OpenAI rejected this key mid-session"""
+        if api_key:
+            self._record(api_key, False)
+
+
+_validator = None
+_validator_lock = threading.Lock()
+
+
+def get_key_validator():
+    """Shared validator for every session in this process"""
+    global _validator
+    with _validator_lock:
+        if _validator is None:
+            _validator = KeyValidator()
+        return _validator
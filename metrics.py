@@ -0,0 +1,294 @@
+"""Lightweight tracing and metrics for NyayaBot.
+
+Spans time each stage of a turn (statute retrieval, prompt assembly, history
+summarization, waiting for the model, generation, rendering) into a latency
+histogram; counters track tokens reported by the API, errors and cache hits.
+Everything is exported in Prometheus text format:
+
+    GET /metrics on nyaya_service.py
+    NYAYA_METRICS_PORT=9108 streamlit run app.py   (serves /metrics from the Streamlit process)
+
+Metrics are per process; with several service workers, scrape each one.
+Set NYAYA_METRICS=0 to turn everything into no-ops.
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("NYAYA_METRICS", "1") != "0"
+METRICS_PORT = int(os.getenv("NYAYA_METRICS_PORT", "0"))
+# Show the metrics panel in the Streamlit sidebars
+METRICS_PANEL = os.getenv("NYAYA_METRICS_PANEL", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def series(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q, counts):
+        """Estimate a quantile from bucket counts by linear interpolation"""
+        count = sum(counts)
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("nyaya_stage_seconds", "Time spent in each stage of a request")
+TOKENS = Counter("nyaya_tokens_total", "Tokens reported by the OpenAI API")
+ERRORS = Counter("nyaya_errors_total", "Stages that raised an exception")
+CACHE_EVENTS = Counter("nyaya_cache_events_total", "Cache lookups by cache and result")
+ROUTES = Counter("nyaya_route_total", "Questions routed to each model tier")
+RETRIES = Counter("nyaya_retries_total", "Upstream calls retried, by upstream and reason")
+HEDGES = Counter("nyaya_hedges_total", "Hedged duplicate requests sent")
+BREAKER_TRANSITIONS = Counter("nyaya_breaker_transitions_total", "Circuit breaker state changes")
+SESSIONS = Gauge("nyaya_sessions", "Chat sessions in this process, resident or spilled to the conversation store")
+SESSION_MEMORY = Gauge("nyaya_session_memory_bytes", "Memory held by chat session messages, in total and by the largest session")
+SESSION_SPILLS = Counter("nyaya_session_spills_total", "Chat sessions whose messages were released, by reason")
+_ALL = (STAGE_SECONDS, TOKENS, ERRORS, CACHE_EVENTS, ROUTES, RETRIES, HEDGES, BREAKER_TRANSITIONS, SESSIONS,
+        SESSION_MEMORY, SESSION_SPILLS)
+
+# Spans of the trace being recorded in this thread or task, if any
+_current_trace = contextvars.ContextVar("nyaya_trace", default=None)
+_last_trace = []
+
+
+@contextlib.contextmanager
+def _span(stage, labels):
+    started = time.perf_counter()
+    try:
+        yield
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        ERRORS.inc(stage=stage, error=type(e).__name__, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+
+def span(stage, **labels):
+    """Context manager timing one stage (errors inside it are counted too)"""
+    if not METRICS_ENABLED:
+        return contextlib.nullcontext()
+    return _span(stage, labels)
+
+
+def observe(stage, seconds, **labels):
+    """Record a stage timed by the caller (e.g. time to first token)"""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((stage, seconds))
+
+
+@contextlib.contextmanager
+def trace():
+    """Collect the spans of one turn; the last completed trace is kept for display"""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    spans = []
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+        _last_trace[:] = spans
+
+
+def record_usage(usage, model, operation):
+    """Count the prompt and completion tokens of a response's `usage`"""
+    if METRICS_ENABLED and usage is not None:
+        TOKENS.inc(usage.prompt_tokens or 0, model=model, operation=operation, kind="prompt")
+        TOKENS.inc(usage.completion_tokens or 0, model=model, operation=operation, kind="completion")
+
+
+def record_cache(cache, result):
+    if METRICS_ENABLED:
+        CACHE_EVENTS.inc(cache=cache, result=result)
+
+
+def render_prometheus():
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in _ALL:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """Rows for the admin panel: per-stage latency, token totals, routing, cache and error counts"""
+    stages = []
+    for labels, (counts, total, count) in sorted(STAGE_SECONDS.series().items()):
+        p50, p95 = STAGE_SECONDS.quantile(0.5, counts), STAGE_SECONDS.quantile(0.95, counts)
+        labels = dict(labels)
+        stage = labels.pop("stage")
+        if labels:
+            stage += f" ({', '.join(str(value) for value in labels.values())})"
+        stages.append({
+            "stage": stage,
+            "count": count,
+            "mean ms": round(total / count * 1000, 1),
+            "p50 ms": round(p50 * 1000, 1),
+            "p95 ms": round(p95 * 1000, 1),
+        })
+    tokens = {}
+    for labels, value in TOKENS.values().items():
+        labels = dict(labels)
+        tokens[labels["kind"]] = tokens.get(labels["kind"], 0) + value
+    routes = {}
+    for labels, value in ROUTES.values().items():
+        tier = dict(labels)["tier"]
+        routes[tier] = routes.get(tier, 0) + value
+    caches = {}
+    for labels, value in CACHE_EVENTS.values().items():
+        labels = dict(labels)
+        caches[f"{labels['cache']} {labels['result']}"] = value
+    sessions = {dict(labels)["state"]: value for labels, value in SESSIONS.values().items()}
+    sessions.update({f"{dict(labels)['stat']}_bytes": value for labels, value in SESSION_MEMORY.values().items()})
+    return {
+        "stages": stages,
+        "tokens": tokens,
+        "routes": routes,
+        "cache": caches,
+        "errors": sum(ERRORS.values().values()),
+        "sessions": sessions,
+        "last_trace": [{"stage": stage, "ms": round(seconds * 1000, 1)} for stage, seconds in list(_last_trace)],
+    }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server_lock = threading.Lock()
+_server = None
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on a background thread, once per process (no-op when port is 0)"""
+    global _server
+    if not METRICS_ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
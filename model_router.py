@@ -0,0 +1,143 @@
+"""Local complexity classifier that picks the model tier for each question.
+
+Simple questions ("what is an FIR") go to a fast, cheap model; questions
+with a personal fact pattern, several statutes, procedural strategy or
+constitutional issues go to the large model. The score is a weighted sum of
+cheap text features, so routing takes microseconds and needs no API call:
+
+    python model_router.py route "what is an FIR"
+    python model_router.py eval questions.jsonl
+
+Every decision is counted in nyaya_route_total (see metrics.py) and, with
+NYAYA_ROUTING_LOG set, appended to a JSONL file with its score and features,
+so latency and token cost per tier can be compared with answer quality.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from metrics import ROUTES, METRICS_ENABLED
+
+# Routing settings (override with environment variables)
+ROUTING_ENABLED = os.getenv("NYAYA_ROUTING", "1") != "0"
+FAST_MODEL = os.getenv("NYAYA_ROUTING_FAST_MODEL", "gpt-4o-mini")
+# Questions scoring at or above this go to the large model
+ROUTING_THRESHOLD = float(os.getenv("NYAYA_ROUTING_THRESHOLD", "0.5"))
+# Questions longer than this many words always go to the large model
+ROUTING_MAX_SIMPLE_WORDS = int(os.getenv("NYAYA_ROUTING_MAX_SIMPLE_WORDS", "40"))
+ROUTING_LOG = os.getenv("NYAYA_ROUTING_LOG", "")
+
+WORD = re.compile(r"[a-z0-9]+")
+# Definitional questions: "what is", "meaning of", "define", "full form of"
+DEFINITION = re.compile(r"^\s*(?:what\s+(?:is|are|does)|define|meaning\s+of|full\s+form|explain\s+the\s+term)\b")
+# A personal situation: the answer depends on its facts
+FACT_PATTERN = re.compile(r"\b(?:i|my|me|we|our|mine|i'm|i've)\b")
+SECTION = re.compile(r"\b(?:section|sec\.?|article|art\.?|order|rule)\s*\d+[a-z]?\b")
+AMOUNT_OR_DATE = re.compile(r"(?:₹|rs\.?|inr)\s*\d|\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b|\b(?:19|20)\d{2}\b|\blakh|\bcrore")
+# Topics that call for strategy, competing provisions or constitutional law
+COMPLEX_TERMS = frozenset("""
+    appeal revision writ quash quashing anticipatory habeas mandamus certiorari constitutional
+    unconstitutional fundamental jurisdiction precedent overrule conflict interplay versus vs
+    compare comparison liability damages compensation arbitration injunction partition succession
+    inheritance probate will insolvency bankruptcy merger tax gst nri cross border extradition
+    defamation contempt limitation condonation bail chargesheet acquittal conviction sentencing
+""".split())
+
+WEIGHTS = {
+    "words": 0.012,            # per word
+    "questions": 0.12,         # per question mark after the first
+    "fact_pattern": 0.3,
+    "sections": 0.15,          # per cited section or article
+    "amounts_or_dates": 0.1,
+    "complex_terms": 0.2,      # per distinct term
+    "follow_up": 0.15,
+    "definition": -0.35,
+}
+
+_log_lock = threading.Lock()
+
+
+def features(question, follow_up=False):
+    """Text features the complexity score is computed from"""
+    text = question.lower()
+    words = WORD.findall(text)
+    return {
+        "words": len(words),
+        "questions": max(text.count("?") - 1, 0),
+        "fact_pattern": bool(FACT_PATTERN.search(text)),
+        "sections": len(SECTION.findall(text)),
+        "amounts_or_dates": bool(AMOUNT_OR_DATE.search(text)),
+        "complex_terms": len(COMPLEX_TERMS.intersection(words)),
+        "follow_up": follow_up,
+        "definition": bool(DEFINITION.search(text)),
+    }
+
+
+def complexity(question_features):
+    """Complexity score in [0, 1] from features()"""
+    score = sum(WEIGHTS[name] * float(value) for name, value in question_features.items())
+    return min(max(score, 0.0), 1.0)
+
+
+def route(question, operation, large_model, follow_up=False):
+    """Pick the model for a question; returns {"model", "tier", "score"}.
+
+    `follow_up` marks a later turn of a conversation, whose answer also
+    depends on the earlier turns.
+    """
+    if not ROUTING_ENABLED:
+        return {"model": large_model, "tier": "large", "score": None}
+    question_features = features(question, follow_up)
+    score = complexity(question_features)
+    large = score >= ROUTING_THRESHOLD or question_features["words"] > ROUTING_MAX_SIMPLE_WORDS
+    decision = {"model": large_model if large else FAST_MODEL, "tier": "large" if large else "fast",
+                "score": round(score, 3)}
+    if METRICS_ENABLED:
+        ROUTES.inc(operation=operation, tier=decision["tier"], model=decision["model"])
+    if ROUTING_LOG:
+        _log(question, operation, question_features, decision)
+    return decision
+
+
+def _log(question, operation, question_features, decision):
+    record = dict(decision, time=round(time.time(), 3), operation=operation,
+                  question_sha=hashlib.sha256(question.strip().encode()).hexdigest()[:16],
+                  features=question_features)
+    with _log_lock, open(ROUTING_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Try the model router on questions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    single = commands.add_parser("route", help="route one question")
+    single.add_argument("question")
+
+    evaluate = commands.add_parser("eval", help="tier split of a JSONL question file (batch_runner format)")
+    evaluate.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "route":
+        decision = route(args.question, "cli", "gpt-4o")
+        print(json.dumps(dict(decision, features=features(args.question)), indent=2))
+    elif args.command == "eval":
+        tiers = {"fast": 0, "large": 0}
+        with open(args.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    tiers[route(json.loads(line)["question"], "cli", "gpt-4o")["tier"]] += 1
+        total = sum(tiers.values())
+        if not total:
+            sys.exit("No questions found")
+        print(f"{total} questions: {tiers['fast']} fast ({tiers['fast'] / total:.0%}), "
+              f"{tiers['large']} large (threshold {ROUTING_THRESHOLD})")
+
+
+if __name__ == "__main__":
+    main()
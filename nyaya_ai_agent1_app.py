@@ -1,10 +1,13 @@
 
 import streamlit as st
-import openai
 import os
+import engine_client
+from citations import annotate_markdown
+from intent_router import get_intent_router
+from resilience import is_unavailable
 
 # Set your OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+openai_api_key = os.getenv("OPENAI_API_KEY")
 
 # Page config
 st.set_page_config(page_title="Nyaya_AI_Agent – Indian Legal AI Assistant", page_icon="⚖️", layout="centered")
@@ -25,25 +28,16 @@ st.info("🛑 **Disclaimer**: Nyaya_AI_Agent provides *informational* legal resp
 # User input
 user_query = st.text_input("📩 Enter your legal question below:")
 
-# Generate legal response
+# Generate legal response (prompt and caching live in nyaya_engine.py)
 def get_legal_response(query):
-    prompt = f"""
-You are “Nyaya_AI_Agent,” an expert AI legal assistant specializing in Indian Judiciary Law.
-
-Respond to the user's question below in plain language, backed by Indian statutes or case law. Always include:
-- Relevant legal provisions or sections
-- Practical next steps (what the user can do)
-- This final disclaimer:
-
-⚠️ This response is for informational purposes only and does not constitute legal advice.
-
-User Question: {query}
-    """
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "system", "content": prompt}]
-    )
-    return response.choices[0].message["content"].strip()
+    try:
+        return engine_client.legal_answer(query, openai_api_key).strip()
+    except Exception as e:
+        if not is_unavailable(e):
+            raise
+        # OpenAI's circuit breaker is open: answer from the offline topics of data/intents.json
+        return ("⚠️ The AI service is unavailable right now; this answer comes from offline topics.\n\n"
+                + get_intent_router().respond(query.lower()))
 
 # Show result
 if user_query:
@@ -51,6 +45,6 @@ if user_query:
         legal_answer = get_legal_response(user_query)
         st.markdown(f"""### 📜 Legal Response:
 
-{legal_answer}
+{annotate_markdown(legal_answer)}
 """)
 
@@ -1,18 +1,27 @@
 import streamlit as st
-import openai
 import os
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables (fallback for local development)
-load_dotenv()
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from answer_cache import get_answer_cache
+from citations import annotate_markdown
+import engine_client
+from github_cache import cached_github_get, get_github_cache
+from intent_router import get_intent_router
+from search_cache import SEARCH_MAX_RESULTS, get_search_cache
+import metrics
+from repo_catalog import get_repo_catalog
+from resilience import is_unavailable
+from startup import get_secret, load_env
+
+# Load environment variables (fallback for local development, once per process)
+load_env()
+
+# Serve Prometheus metrics from this process when NYAYA_METRICS_PORT is set
+metrics.start_metrics_server()
 
 # Set API keys from Streamlit secrets or environment variables
-openai_api_key = st.secrets.get("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY"))
-github_token = st.secrets.get("GITHUB_TOKEN", os.getenv("GITHUB_TOKEN"))
-
-if openai_api_key:
-    openai.api_key = openai_api_key
+openai_api_key = get_secret("OPENAI_API_KEY")
+github_token = get_secret("GITHUB_TOKEN")
 
 # GitHub API functions with authentication
 def get_github_headers():
@@ -24,27 +33,24 @@ def get_github_headers():
         headers["Authorization"] = f"token {github_token}"
     return headers
 
-def search_github_repos(query, sort="stars", order="desc", per_page=5):
-    """Search for repositories on GitHub"""
+def search_github_repos(query, sort="stars", order="desc", per_page=5, start=0):
+    """Search for repositories on GitHub (results start..start+per_page-1, through the search cache)"""
     try:
-        url = f"https://api.github.com/search/repositories"
-        params = {
-            "q": query,
-            "sort": sort,
-            "order": order,
-            "per_page": per_page
-        }
-        response = requests.get(url, headers=get_github_headers(), params=params)
-        response.raise_for_status()
-        return response.json()
+        return get_search_cache().search(query, sort, order, start, per_page, headers=get_github_headers())
+    except Exception as e:
+        return {"error": str(e)}
+
+def search_catalog(query, language=None, min_stars=0, updated_since=None, sort="best match", per_page=5, start=0):
+    """Search the offline repository catalogue (see repo_catalog.py)"""
+    try:
+        return get_repo_catalog().search(query, language, min_stars, updated_since, sort, per_page, start)
     except Exception as e:
         return {"error": str(e)}
 
 def get_repo_info(owner, repo):
     """Get information about a specific repository"""
     try:
-        url = f"https://api.github.com/repos/{owner}/{repo}"
-        response = requests.get(url, headers=get_github_headers())
+        response = cached_github_get(f"/repos/{owner}/{repo}", headers=get_github_headers())
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -53,92 +59,69 @@ def get_repo_info(owner, repo):
 def get_repo_readme(owner, repo):
     """Get the README content of a repository"""
     try:
-        url = f"https://api.github.com/repos/{owner}/{repo}/readme"
         headers = get_github_headers()
         headers["Accept"] = "application/vnd.github.v3.raw"
-        response = requests.get(url, headers=headers)
+        response = cached_github_get(f"/repos/{owner}/{repo}/readme", headers=headers)
         response.raise_for_status()
         return response.text
     except Exception as e:
         return f"Error fetching README: {str(e)}"
 
-# OpenAI functions with manual guardrails
+def get_branch_sha(owner, repo, branch):
+    """Get the commit SHA at the tip of a branch, or None if it can't be fetched"""
+    try:
+        headers = get_github_headers()
+        headers["Accept"] = "application/vnd.github.sha"
+        response = cached_github_get(f"/repos/{owner}/{repo}/commits/{branch}", headers=headers)
+        response.raise_for_status()
+        return response.text.strip()
+    except Exception:
+        return None
+
+# Concurrent README fetches and analyses for "Analyze all results"
+ANALYSIS_WORKERS = int(os.getenv("NYAYA_ANALYSIS_WORKERS", "5"))
+
+# OpenAI functions with manual guardrails (prompts live in nyaya_engine.py)
 def get_legal_response(query):
     """Get legal response with manual guardrails"""
     if not openai_api_key:
         return "Error: OpenAI API key not found. Please set it in the Streamlit secrets or .env file."
 
     try:
-        system_prompt = """
-        You are Nyaya_AI_Agent, an AI legal expert on Indian law.
-
-        Answer the following legal query in a respectful, factual, and helpful manner.
-        Always include:
-        - Legal provisions or case references where applicable
-        - Clear next steps
-        - This disclaimer: ⚠️ This response is for informational purposes only and does not constitute legal advice.
-
-        Never provide specific legal advice that could be construed as practicing law.
-        Always maintain a professional tone and acknowledge limitations of AI in legal contexts.
-        """
-
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=800,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
+        return engine_client.legal_answer(query, openai_api_key)
     except Exception as e:
+        if is_unavailable(e):
+            # OpenAI's circuit breaker is open: answer from the offline topics of data/intents.json
+            return ("⚠️ The AI service is unavailable right now; this answer comes from offline topics.\n\n"
+                    + get_intent_router().respond(query.lower()))
         return f"Error generating response: {str(e)}"
 
-def analyze_repository(repo_info, readme):
+def analyze_repository(repo_info, readme, commit_sha=None):
     """Analyze repository with manual guardrails"""
     if not openai_api_key:
         return "Error: OpenAI API key not found. Please set it in the Streamlit secrets or .env file."
 
     try:
-        system_prompt = """
-        You are Nyaya_AI_Agent, an AI expert on legal technology and GitHub repositories.
-
-        Analyze the following repository from a legal tech perspective.
-        Focus on:
-        1. What legal problems this repository helps solve
-        2. Its relevance to legal professionals
-        3. Potential applications in Indian legal practice
-        4. Any legal compliance considerations
-        5. How it compares to other legal tech solutions
-
-        Maintain a professional tone and provide factual analysis based on the repository information.
-        """
-
-        user_prompt = f"""
-        Repository: {repo_info.get('full_name', 'Unknown')}
-        Description: {repo_info.get('description', 'No description')}
-        Language: {repo_info.get('language', 'Not specified')}
-        Stars: {repo_info.get('stargazers_count', 0)}
-        Forks: {repo_info.get('forks_count', 0)}
-
-        README excerpt:
-        {readme[:1000]}... (truncated)
-        """
-
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=800,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
+        return engine_client.analyze_repository(repo_info, readme, openai_api_key, commit_sha)
     except Exception as e:
         return f"Error analyzing repository: {str(e)}"
 
+def analyze_latest(repo_info):
+    """Analyze a repository's default branch, reusing the analysis while its
+    commit is unchanged (safe to run in a worker thread). Returns (analysis, readme);
+    the README is only fetched when there is no cached analysis."""
+    owner, repo = repo_info["owner"]["login"], repo_info["name"]
+    commit_sha = get_branch_sha(owner, repo, repo_info.get("default_branch") or "HEAD")
+    cached = engine_client.cached_analysis(repo_info, commit_sha)
+    if cached is not None:
+        return cached, None
+    readme = get_repo_readme(owner, repo)
+    return analyze_repository(repo_info, readme, commit_sha), readme
+
+def analyze_search_result(item):
+    """Analyze a search result (safe to run in a worker thread)"""
+    return analyze_latest(item)[0]
+
 # Streamlit page config
 st.set_page_config(page_title="Nyaya_AI_Agent – Indian Legal AI Assistant", page_icon="⚖️", layout="wide")
 
@@ -178,6 +161,36 @@ else:
         2. Add it to `.streamlit/secrets.toml` as `GITHUB_TOKEN = "your_token_here"`
         """)
 
+# Answer cache statistics
+answer_cache = get_answer_cache()
+if answer_cache is not None:
+    cache_stats = answer_cache.summary()
+    st.sidebar.caption(f"💾 Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                       f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} stored)")
+
+# GitHub cache and rate-limit statistics
+github_stats = get_github_cache().summary()
+st.sidebar.caption(f"🗂️ GitHub cache: {github_stats['hits']} hits / {github_stats['misses']} misses "
+                   f"({github_stats['hit_rate']:.0%} hit rate)")
+search_stats = get_search_cache().summary()
+st.sidebar.caption(f"🔎 Search cache: {search_stats['hits'] + search_stats['resorted']} hits / "
+                   f"{search_stats['misses']} misses, {search_stats['prefetched']} pages prefetched")
+if github_stats["rate_limit_remaining"] is not None:
+    st.sidebar.caption(f"GitHub requests remaining this hour: {github_stats['rate_limit_remaining']}")
+
+# Admin panel: per-stage latency, token usage and the last request's trace
+if metrics.METRICS_PANEL:
+    with st.sidebar.expander("📊 Metrics"):
+        stats = metrics.summary()
+        st.caption(f"Tokens: {stats['tokens'].get('prompt', 0)} prompt / "
+                   f"{stats['tokens'].get('completion', 0)} completion · errors: {stats['errors']} · "
+                   f"routed fast/large: {stats['routes'].get('fast', 0)}/{stats['routes'].get('large', 0)}")
+        if stats["stages"]:
+            st.dataframe(stats["stages"], hide_index=True)
+        if stats["last_trace"]:
+            st.markdown("**Last request**")
+            st.dataframe(stats["last_trace"], hide_index=True)
+
 # Sidebar for navigation
 st.sidebar.title("Nyaya AI Tools")
 option = st.sidebar.radio(
@@ -192,29 +205,62 @@ if option == "Legal AI Assistant":
 
     # Display result
     if user_query:
-        with st.spinner("🔍 Analyzing Indian law..."):
+        with st.spinner("🔍 Analyzing Indian law..."), metrics.trace():
             response = get_legal_response(user_query)
+            # Statute citations are linked, or flagged when the section doesn't exist
             st.markdown(f"""### 📜 Legal Response:
 
-{response}
+{annotate_markdown(response)}
 """)
 
 # Search Repositories
 elif option == "Search Legal Tech Repositories":
     st.header("Search Legal Tech GitHub Repositories")
 
+    # The offline catalogue answers as you type, with filters GitHub's search
+    # can't combine, and without spending the search quota
+    catalog = get_repo_catalog()
+    catalog_size = catalog.count()
+    use_catalog = st.toggle(f"Search the offline catalogue ({catalog_size} repositories)", value=catalog_size > 0,
+                            disabled=catalog_size == 0,
+                            help="Build it with `python repo_catalog.py sync`; it refreshes itself once a day")
+    if use_catalog:
+        catalog.refresh_in_background(get_github_headers())
+
     col1, col2, col3 = st.columns([3, 1, 1])
 
     with col1:
         search_query = st.text_input("Search query", placeholder="e.g., legal nlp contract analysis")
 
     with col2:
-        sort_by = st.selectbox("Sort by", ["stars", "forks", "updated"])
+        sort_by = st.selectbox("Sort by", (["best match"] if use_catalog else []) + ["stars", "forks", "updated"])
 
     with col3:
         per_page = st.slider("Results", 1, 10, 5)
 
-    if st.button("Search"):
+    if use_catalog:
+        col1, col2, col3 = st.columns([3, 1, 1])
+        languages = catalog.facets(search_query)
+        language = col1.selectbox("Language", [None] + [name for name, _ in languages],
+                                  format_func=lambda name: "Any language" if name is None else
+                                  f"{name} ({dict(languages)[name]})")
+        min_stars = col2.number_input("Minimum stars", min_value=0, value=0, step=10)
+        updated_within = col3.selectbox("Updated", [None, 30, 365, 3 * 365],
+                                        format_func=lambda days: "Any time" if days is None else
+                                        {30: "Past month", 365: "Past year", 3 * 365: "Past 3 years"}[days])
+        updated_since = None
+        if updated_within is not None:
+            updated_since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - updated_within * 86400))
+
+        # Paging restarts whenever the query, a filter or the sort changes
+        key = (search_query, language, min_stars, updated_since, sort_by)
+        search = st.session_state.get("catalog_search")
+        if search is None or search["key"] != key:
+            search = st.session_state.catalog_search = {"key": key, "start": 0}
+        results = search_catalog(search_query, language, min_stars, updated_since, sort_by, per_page,
+                                 search["start"])
+
+    elif st.button("Search"):
         if not search_query:
             st.error("Please enter a search query.")
         else:
@@ -222,26 +268,77 @@ elif option == "Search Legal Tech Repositories":
             if "legal" not in search_query.lower():
                 search_query = f"legal {search_query}"
 
+            # Keep the search across reruns so paging and the analyze buttons below work
+            st.session_state.search = {"query": search_query, "sort": sort_by, "start": 0}
+            st.session_state.repo_analyses = {}
+
+    # Results are read from the search cache on every run, so changing the sort,
+    # the number of results or the page rarely needs a GitHub request
+    if not use_catalog:
+        search = st.session_state.get("search")
+        if search is not None:
+            if search["sort"] != sort_by:
+                search.update(sort=sort_by, start=0)
             with st.spinner("Searching repositories..."):
-                results = search_github_repos(search_query, sort_by, "desc", per_page)
-
-                if "error" in results:
-                    st.error(f"Error: {results['error']}")
-                else:
-                    st.success(f"Found {results.get('total_count', 0)} repositories")
-
-                    for item in results.get("items", []):
-                        with st.expander(f"{item['full_name']} - ⭐ {item['stargazers_count']}"):
-                            st.markdown(f"**Description:** {item['description'] or 'No description'}")
-                            st.markdown(f"**Language:** {item['language'] or 'Not specified'}")
-                            st.markdown(f"**URL:** [{item['html_url']}]({item['html_url']})")
-
-                            if st.button(f"Analyze with Nyaya AI", key=f"analyze_{item['id']}"):
-                                with st.spinner("Analyzing repository..."):
-                                    readme = get_repo_readme(item['owner']['login'], item['name'])
-                                    analysis = analyze_repository(item, readme)
-                                    st.markdown("### Nyaya AI Analysis")
-                                    st.markdown(analysis)
+                results = search_github_repos(search["query"], sort_by, "desc", per_page, search["start"])
+
+    if search is not None:
+        analyses = st.session_state.setdefault("repo_analyses", {})
+
+        if "error" in results:
+            st.error(f"Error: {results['error']}")
+        else:
+            total = results.get("total_count", 0) if use_catalog else min(results.get("total_count", 0), SEARCH_MAX_RESULTS)
+            st.success(f"Found {results.get('total_count', 0)} repositories")
+            items = results.get("items", [])
+            if total > per_page:
+                col1, col2, col3 = st.columns([1, 2, 1])
+                if col1.button("◀ Previous", disabled=search["start"] == 0):
+                    search["start"] = max(0, search["start"] - per_page)
+                    st.rerun()
+                col2.caption(f"Showing {search['start'] + 1}–{search['start'] + len(items)} of {total}")
+                if col3.button("Next ▶", disabled=search["start"] + per_page >= total):
+                    search["start"] += per_page
+                    st.rerun()
+
+            for item in items:
+                with st.expander(f"{item['full_name']} - ⭐ {item['stargazers_count']}"):
+                    st.markdown(f"**Description:** {item['description'] or 'No description'}")
+                    st.markdown(f"**Language:** {item['language'] or 'Not specified'}")
+                    if item.get("readme_summary"):
+                        st.markdown(f"**README:** {item['readme_summary']}")
+                    st.markdown(f"**URL:** [{item['html_url']}]({item['html_url']})")
+
+                    if item["id"] not in analyses and st.button(f"Analyze with Nyaya AI", key=f"analyze_{item['id']}"):
+                        with st.spinner("Analyzing repository..."):
+                            analyses[item["id"]] = analyze_search_result(item)
+
+                    if item["id"] in analyses:
+                        st.markdown("### Nyaya AI Analysis")
+                        st.markdown(analyses[item["id"]])
+
+            if items and st.button("Analyze all results"):
+                pending = [item for item in items if item["id"] not in analyses]
+                st.subheader("Nyaya AI Batch Analysis")
+                progress = st.progress(0.0, text=f"Analyzing {len(pending)} repositories...")
+
+                # One slot per repository, in result order, filled as analyses finish
+                slots = {}
+                for item in pending:
+                    slots[item["id"]] = st.empty()
+                    slots[item["id"]].info(f"⏳ {item['full_name']} – analyzing...")
+
+                done = 0
+                with ThreadPoolExecutor(max_workers=max(1, min(ANALYSIS_WORKERS, len(pending)))) as pool:
+                    futures = {pool.submit(analyze_search_result, item): item for item in pending}
+                    for future in as_completed(futures):
+                        item = futures[future]
+                        analyses[item["id"]] = future.result()
+                        with slots[item["id"]].container():
+                            st.markdown(f"#### {item['full_name']}")
+                            st.markdown(analyses[item["id"]])
+                        done += 1
+                        progress.progress(done / len(pending), text=f"Analyzed {done} of {len(pending)} repositories")
 
 # Analyze Repository
 elif option == "Analyze Repository":
@@ -276,11 +373,10 @@ elif option == "Analyze Repository":
                         st.markdown(f"**Description:** {repo_info.get('description', 'No description')}")
                         st.markdown(f"**Language:** {repo_info.get('language', 'Not specified')}")
 
-                        # Get README
-                        readme = get_repo_readme(owner, repo)
-
-                        # Get AI analysis
-                        analysis = analyze_repository(repo_info, readme)
+                        # Get AI analysis (cached while the default branch is unchanged)
+                        analysis, readme = analyze_latest(repo_info)
+                        if readme is None:
+                            readme = get_repo_readme(owner, repo)
 
                         # Display AI analysis
                         st.subheader("Nyaya AI Analysis")
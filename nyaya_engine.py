@@ -0,0 +1,564 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from answer_cache import get_analysis_cache, get_answer_cache
+from clients import get_async_openai_client, get_openai_client, openai_timeout
+from history import (SUMMARY_MAX_TOKENS, SUMMARY_MODEL, SUMMARY_PROMPT, abuild_conversation,
+                     build_conversation, format_transcript)
+from key_validation import get_key_validator
+from metrics import observe, record_usage, span
+from model_router import route
+from readme_chunks import chunk_readme
+from resilience import acall, call, turn_deadline
+from single_flight import AsyncSingleFlight, SingleFlight, flight_key
+from statute_index import format_sections, retrieve_sections
+
+# NyayaBot engine: prompts, history handling and the OpenAI calls behind every
+# front end. The Streamlit apps reach it through engine_client.py, either
+# in-process or via the HTTP service in nyaya_service.py. Every function raises
+# on failure; callers decide how to show the error.
+#
+# Identical requests in flight at the same time (same prompt up to whitespace
+# and case, same model parameters and API key) share one upstream call: the
+# answer, or the token stream, is fanned out to every caller. Coalescing is per
+# process: across Streamlit sessions via threads, and within a service worker's
+# event loop.
+#
+# Completions go through resilience.py: retried within a deadline, hedged when
+# configured, and refused with UpstreamUnavailable while OpenAI's circuit
+# breaker is open. Streams are only retried until they start. Every upstream
+# call of one answer (summarizing older turns, the map step of an analysis,
+# the completion) shares a single deadline.
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+
+# Multi-turn chat (app.py)
+CHAT_MODEL = "gpt-4o"
+CHAT_TEMPERATURE = 0.7
+
+# Cache namespace for first-turn answers (changes to the prompt or model should bump it).
+# Answers from the fast model of model_router.py are cached under "<namespace>:<model>".
+CHAT_CACHE_NAMESPACE = "app:gpt-4o:v1"
+
+NYAYABOT_SYSTEM_PROMPT = """You are "NyayaBot," an expert AI legal assistant specializing in Indian Judiciary Law. Respond to users' legal queries with the accuracy, clarity, and professionalism of a seasoned Indian lawyer. Provide concise, reliable, and up-to-date information on Indian laws, court procedures, and legal rights.
+
+Your knowledge covers:
+1. Indian Legal System - Constitution, judiciary structure, landmark cases
+2. Criminal Laws - IPC, CrPC, Evidence Act, FIR procedures
+3. Civil Laws - CPC, Contract Act, Property laws, tenancy rights
+4. Family Laws - Marriage, divorce, maintenance across different personal laws
+5. Consumer Protection - Rights, complaint procedures, remedies
+6. Constitutional Rights - Fundamental rights, remedies, enforcement
+
+Always follow these guidelines:
+1. Begin with a clear, direct answer to the legal question
+2. Provide relevant legal context and background
+3. Explain applicable laws, statutes, or precedents
+4. Use plain language with necessary legal terms explained
+5. Include citations to relevant statutes or case law when appropriate
+6. Suggest potential next steps or resources
+
+Always end your response with this disclaimer: "Please note that this information is provided for educational purposes only and does not constitute legal advice. For specific legal concerns, please consult with a qualified legal professional who can provide personalized guidance based on your particular situation."
+
+For complex matters, use this enhanced disclaimer: "This matter involves complex legal considerations that may require professional legal representation. The information provided is general in nature, and I strongly recommend consulting with a qualified advocate who specializes in this area of law for personalized advice."
+"""
+
+# Single-question legal answers (nyaya_ai_agent_app.py, nyaya_ai_agent1_app.py, batch_runner.py)
+LEGAL_MODEL = "gpt-4"
+LEGAL_MAX_TOKENS = 800
+LEGAL_TEMPERATURE = 0.7
+
+# Cache namespace for legal answers (changes to the prompt or model should bump it)
+LEGAL_CACHE_NAMESPACE = "nyaya_ai_agent_app:gpt-4:v1"
+
+LEGAL_SYSTEM_PROMPT = """
+        You are Nyaya_AI_Agent, an AI legal expert on Indian law.
+
+        Answer the following legal query in a respectful, factual, and helpful manner.
+        Always include:
+        - Legal provisions or case references where applicable
+        - Clear next steps
+        - This disclaimer: ⚠️ This response is for informational purposes only and does not constitute legal advice.
+
+        Never provide specific legal advice that could be construed as practicing law.
+        Always maintain a professional tone and acknowledge limitations of AI in legal contexts.
+        """
+
+# Repository analysis (nyaya_ai_agent_app.py)
+ANALYSIS_MODEL = "gpt-4"
+ANALYSIS_MAX_TOKENS = 800
+ANALYSIS_TEMPERATURE = 0.7
+
+ANALYSIS_SYSTEM_PROMPT = """
+        You are Nyaya_AI_Agent, an AI expert on legal technology and GitHub repositories.
+
+        Analyze the following repository from a legal tech perspective.
+        Focus on:
+        1. What legal problems this repository helps solve
+        2. Its relevance to legal professionals
+        3. Potential applications in Indian legal practice
+        4. Any legal compliance considerations
+        5. How it compares to other legal tech solutions
+
+        Maintain a professional tone and provide factual analysis based on the repository information.
+        """
+
+# READMEs longer than one chunk (see readme_chunks.py) are summarized section
+# by section in parallel with a cheaper model (map), and the analysis is
+# written from those notes (reduce)
+ANALYSIS_MAP_MODEL = os.getenv("NYAYA_ANALYSIS_MAP_MODEL", "gpt-4o-mini")
+ANALYSIS_MAP_MAX_TOKENS = 300
+ANALYSIS_MAP_TEMPERATURE = 0.2
+ANALYSIS_MAP_WORKERS = int(os.getenv("NYAYA_ANALYSIS_MAP_WORKERS", "4"))
+
+# Cache namespace for analyses, keyed on owner/repo@commit (changes to the prompts or models should bump it)
+ANALYSIS_CACHE_NAMESPACE = "nyaya_ai_agent_app:analysis:gpt-4:v2"
+
+ANALYSIS_MAP_PROMPT = """You take notes on one part of a GitHub repository's README for a legal-tech analyst.
+In at most 120 words, note what this part says about: the problem the project solves, its features, the legal domain and jurisdictions it targets, the data it processes (especially personal or confidential data), its licence, and how it is deployed.
+Only report what the text says. If this part is only installation steps, code or boilerplate, say so in one line."""
+
+
+def build_legal_messages(query):
+    """Chat messages for a legal question, grounded in retrieved statute sections"""
+    system_prompt = LEGAL_SYSTEM_PROMPT
+    with span("retrieval"):
+        context = format_sections(retrieve_sections(query))
+    if context:
+        system_prompt = f"{system_prompt}\n{context}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
+    ]
+
+
+def build_analysis_messages(repo_info, readme, summarized=False):
+    """Chat messages for a legal-tech analysis of a repository, from its
+    README text or, with `summarized`, notes on each part of it"""
+    user_prompt = f"""
+        Repository: {repo_info.get('full_name', 'Unknown')}
+        Description: {repo_info.get('description', 'No description')}
+        Language: {repo_info.get('language', 'Not specified')}
+        Stars: {repo_info.get('stargazers_count', 0)}
+        Forks: {repo_info.get('forks_count', 0)}
+
+        {"README notes, part by part" if summarized else "README"}:
+        {readme}
+        """
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _analysis_map_request(repo_info, chunk, part, parts):
+    return {
+        "model": ANALYSIS_MAP_MODEL,
+        "messages": [
+            {"role": "system", "content": ANALYSIS_MAP_PROMPT},
+            {"role": "user", "content": f"Repository: {repo_info.get('full_name', 'Unknown')}\n"
+                                        f"README part {part} of {parts}:\n\n{chunk}"},
+        ],
+        "max_tokens": ANALYSIS_MAP_MAX_TOKENS,
+        "temperature": ANALYSIS_MAP_TEMPERATURE,
+    }
+
+
+def _analysis_request(repo_info, readme, summarized):
+    return {
+        "model": ANALYSIS_MODEL,
+        "messages": build_analysis_messages(repo_info, readme, summarized),
+        "max_tokens": ANALYSIS_MAX_TOKENS,
+        "temperature": ANALYSIS_TEMPERATURE,
+    }
+
+
+def _readme_notes(notes):
+    return "\n\n".join(f"Part {part}: {note}" for part, note in enumerate(notes, 1))
+
+
+def _analysis_key(repo_info, commit_sha):
+    return f"{repo_info.get('full_name', 'Unknown')}@{commit_sha}"
+
+
+def cached_analysis(repo_info, commit_sha):
+    """The cached analysis of a repository at a commit, or None"""
+    cache = get_analysis_cache()
+    if cache is None or not commit_sha:
+        return None
+    return cache.get(_analysis_key(repo_info, commit_sha), namespace=ANALYSIS_CACHE_NAMESPACE)
+
+
+def cacheable_question(messages):
+    """The opening question of a chat, or None once the conversation has history.
+    Only opening questions are cached; later turns depend on the conversation so far."""
+    user_turns = [msg for msg in messages if msg["role"] == "user"]
+    if len(user_turns) == 1 and messages[-1]["role"] == "user":
+        return user_turns[0]["content"]
+    return None
+
+
+def _chat_route(messages):
+    """Model for the latest message of a chat (see model_router.py)"""
+    user_turns = [msg for msg in messages if msg["role"] == "user"]
+    question = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else ""
+    return route(question, "chat", CHAT_MODEL, follow_up=len(user_turns) > 1)
+
+
+def _tier_namespace(namespace, decision, large_model):
+    # Fast-model answers never stand in for large-model ones, or vice versa
+    return namespace if decision["model"] == large_model else f"{namespace}:{decision['model']}"
+
+
+def _chat_system_prompt(messages):
+    # Ground the latest question in sections retrieved from the statute index
+    system_prompt = NYAYABOT_SYSTEM_PROMPT
+    if messages and messages[-1]["role"] == "user":
+        with span("retrieval"):
+            context = format_sections(retrieve_sections(messages[-1]["content"]))
+        if context:
+            system_prompt = f"{system_prompt}\n{context}"
+    return system_prompt
+
+
+def _latency_key(request, operation, options):
+    # Hedging compares a call with others of its operation and model; a stream
+    # returns once it starts, so its latency says nothing about completions
+    return None if options.get("stream") else f"{operation}:{request['model']}"
+
+
+def _create(api_key, request, operation, **options):
+    """A chat completion through the resilience layer (streams are never hedged).
+    OpenAI accepting the request confirms the key (see key_validation.py);
+    answers served from the cache confirm nothing."""
+    client = get_openai_client(api_key)
+    response = call("openai", lambda timeout: client.chat.completions.create(
+        **request, **options, timeout=openai_timeout(timeout)), latency_key=_latency_key(request, operation, options))
+    get_key_validator().confirm(api_key)
+    return response
+
+
+async def _acreate(api_key, request, operation, **options):
+    client = get_async_openai_client(api_key)
+    response = await acall("openai", lambda timeout: client.chat.completions.create(
+        **request, **options, timeout=openai_timeout(timeout)), latency_key=_latency_key(request, operation, options))
+    get_key_validator().confirm(api_key)
+    return response
+
+
+def _summary_messages(previous_summary, new_messages):
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{format_transcript(new_messages)}"},
+    ]
+
+
+def summarize_history(api_key, previous_summary, new_messages):
+    """Fold older turns into a conversation's rolling summary"""
+    with span("summarize", model=SUMMARY_MODEL):
+        response = _create(api_key, {
+            "model": SUMMARY_MODEL,
+            "messages": _summary_messages(previous_summary, new_messages),
+            "max_tokens": SUMMARY_MAX_TOKENS,
+            "temperature": 0.2,
+        }, "summary")
+    record_usage(response.usage, SUMMARY_MODEL, "summary")
+    return response.choices[0].message.content
+
+
+def prepare_conversation(messages, summary_state, api_key):
+    """Token-budgeted conversation for the API: recent turns verbatim, older
+    turns as a rolling summary (summary_state is updated in place)"""
+    with span("prompt_assembly"):
+        return build_conversation(
+            _chat_system_prompt(messages),
+            messages,
+            summary_state,
+            lambda previous, new: summarize_history(api_key, previous, new),
+        )
+
+
+def _chat_request(messages, summary_state, api_key, model=CHAT_MODEL):
+    return {
+        "model": model,
+        "messages": prepare_conversation(messages, summary_state, api_key),
+        "temperature": CHAT_TEMPERATURE,
+    }
+
+
+def _legal_request(query, model=LEGAL_MODEL):
+    return {
+        "model": model,
+        "messages": build_legal_messages(query),
+        "max_tokens": LEGAL_MAX_TOKENS,
+        "temperature": LEGAL_TEMPERATURE,
+    }
+
+
+def _answer_once(request, api_key, cache, question, namespace, operation):
+    """One upstream call per identical in-flight request; its answer is shared"""
+    def call():
+        with span("model", model=request["model"], operation=operation):
+            response = _create(api_key, request, operation)
+        record_usage(response.usage, request["model"], operation)
+        return response.choices[0].message.content
+
+    if cache is not None and question:
+        # With a shared cache backend, other workers asking the same question wait for this answer
+        return cache.get_or_compute(question, lambda: _flights.do(flight_key(api_key, request), call), namespace)
+    return _flights.do(flight_key(api_key, request), call)
+
+
+def _stream_once(request, api_key, cache, question, namespace, operation):
+    """One upstream stream per identical in-flight request; its chunks are shared"""
+    def call():
+        labels = {"model": request["model"], "operation": operation}
+        with span("model", **labels):
+            started = time.perf_counter()
+            stream = _create(api_key, request, operation, stream=True, stream_options={"include_usage": True})
+            answer = ""
+            for chunk in stream:
+                if chunk.usage is not None:
+                    record_usage(chunk.usage, request["model"], operation)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not answer:
+                        observe("first_token", time.perf_counter() - started, **labels)
+                    answer += chunk.choices[0].delta.content
+                    yield chunk.choices[0].delta.content
+        if cache is not None and question:
+            cache.put(question, answer, namespace=namespace)
+
+    return _flights.stream(flight_key(api_key, dict(request, stream=True)), call)
+
+
+def chat_answer(messages, summary_state, api_key):
+    """Answer the latest message of a chat"""
+    decision = _chat_route(messages)
+    namespace = _tier_namespace(CHAT_CACHE_NAMESPACE, decision, CHAT_MODEL)
+    cache = get_answer_cache()
+    question = cacheable_question(messages)
+    if cache is not None and question:
+        cached = cache.get(question, namespace=namespace)
+        if cached is not None:
+            return cached
+
+    with turn_deadline():
+        request = _chat_request(messages, summary_state, api_key, decision["model"])
+        return _answer_once(request, api_key, cache, question, namespace, "chat")
+
+
+def stream_chat(messages, summary_state, api_key):
+    """Answer the latest message of a chat, yielding text as it is generated"""
+    decision = _chat_route(messages)
+    namespace = _tier_namespace(CHAT_CACHE_NAMESPACE, decision, CHAT_MODEL)
+    cache = get_answer_cache()
+    question = cacheable_question(messages)
+    if cache is not None and question:
+        cached = cache.get(question, namespace=namespace)
+        if cached is not None:
+            yield cached
+            return
+
+    with turn_deadline():
+        request = _chat_request(messages, summary_state, api_key, decision["model"])
+        stream = _stream_once(request, api_key, cache, question, namespace, "chat")
+    yield from stream
+
+
+def legal_answer(query, api_key):
+    """Answer a single legal question"""
+    decision = route(query, "legal", LEGAL_MODEL)
+    namespace = _tier_namespace(LEGAL_CACHE_NAMESPACE, decision, LEGAL_MODEL)
+    cache = get_answer_cache()
+    if cache is not None:
+        cached = cache.get(query, namespace=namespace)
+        if cached is not None:
+            return cached
+
+    with turn_deadline():
+        return _answer_once(_legal_request(query, decision["model"]), api_key, cache, query, namespace, "legal")
+
+
+def analyze_repository(repo_info, readme, api_key, commit_sha=None):
+    """Legal-tech analysis of a repository from its metadata and README.
+    Given the default branch's commit SHA, the analysis is cached for that commit."""
+    cached = cached_analysis(repo_info, commit_sha)
+    if cached is not None:
+        return cached
+
+    with turn_deadline():
+        chunks = chunk_readme(readme)
+        if len(chunks) > 1:
+            with span("analysis_map"), ThreadPoolExecutor(max_workers=min(ANALYSIS_MAP_WORKERS, len(chunks))) as pool:
+                futures = [
+                    pool.submit(contextvars.copy_context().run, _answer_once,
+                                _analysis_map_request(repo_info, chunk, part, len(chunks)),
+                                api_key, None, None, None, "analysis_map")
+                    for part, chunk in enumerate(chunks, 1)
+                ]
+                request = _analysis_request(repo_info, _readme_notes([future.result() for future in futures]), True)
+        else:
+            request = _analysis_request(repo_info, chunks[0] if chunks else "(empty)", False)
+
+        cache = get_analysis_cache() if commit_sha else None
+        return _answer_once(request, api_key, cache, _analysis_key(repo_info, commit_sha), ANALYSIS_CACHE_NAMESPACE,
+                            "analysis")
+
+
+# Async variants for the HTTP service. Cache reads and writes can touch disk
+# (a snapshot file or SQLite) and scan the semantic index, so they run in a
+# worker thread to keep the event loop free.
+
+async def asummarize_history(api_key, previous_summary, new_messages):
+    with span("summarize", model=SUMMARY_MODEL):
+        response = await _acreate(api_key, {
+            "model": SUMMARY_MODEL,
+            "messages": _summary_messages(previous_summary, new_messages),
+            "max_tokens": SUMMARY_MAX_TOKENS,
+            "temperature": 0.2,
+        }, "summary")
+    record_usage(response.usage, SUMMARY_MODEL, "summary")
+    return response.choices[0].message.content
+
+
+async def aprepare_conversation(messages, summary_state, api_key):
+    with span("prompt_assembly"):
+        return await abuild_conversation(
+            _chat_system_prompt(messages),
+            messages,
+            summary_state,
+            lambda previous, new: asummarize_history(api_key, previous, new),
+        )
+
+
+async def _aanswer_once(request, api_key, cache, question, namespace, operation):
+    async def call():
+        with span("model", model=request["model"], operation=operation):
+            response = await _acreate(api_key, request, operation)
+        record_usage(response.usage, request["model"], operation)
+        answer = response.choices[0].message.content
+        if cache is not None and question:
+            await asyncio.to_thread(cache.put, question, answer, namespace=namespace)
+        return answer
+
+    return await _async_flights.do(flight_key(api_key, request), call)
+
+
+def _astream_once(request, api_key, cache, question, namespace, operation):
+    async def call():
+        labels = {"model": request["model"], "operation": operation}
+        with span("model", **labels):
+            started = time.perf_counter()
+            stream = await _acreate(api_key, request, operation, stream=True, stream_options={"include_usage": True})
+            answer = ""
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    record_usage(chunk.usage, request["model"], operation)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not answer:
+                        observe("first_token", time.perf_counter() - started, **labels)
+                    answer += chunk.choices[0].delta.content
+                    yield chunk.choices[0].delta.content
+        if cache is not None and question:
+            await asyncio.to_thread(cache.put, question, answer, namespace=namespace)
+
+    return _async_flights.stream(flight_key(api_key, dict(request, stream=True)), call)
+
+
+async def achat_answer(messages, summary_state, api_key):
+    decision = _chat_route(messages)
+    namespace = _tier_namespace(CHAT_CACHE_NAMESPACE, decision, CHAT_MODEL)
+    cache = get_answer_cache()
+    question = cacheable_question(messages)
+    if cache is not None and question:
+        cached = await asyncio.to_thread(cache.get, question, namespace=namespace)
+        if cached is not None:
+            return cached
+
+    with turn_deadline():
+        request = {
+            "model": decision["model"],
+            "messages": await aprepare_conversation(messages, summary_state, api_key),
+            "temperature": CHAT_TEMPERATURE,
+        }
+        return await _aanswer_once(request, api_key, cache, question, namespace, "chat")
+
+
+async def astream_chat(messages, summary_state, api_key):
+    decision = _chat_route(messages)
+    namespace = _tier_namespace(CHAT_CACHE_NAMESPACE, decision, CHAT_MODEL)
+    cache = get_answer_cache()
+    question = cacheable_question(messages)
+    if cache is not None and question:
+        cached = await asyncio.to_thread(cache.get, question, namespace=namespace)
+        if cached is not None:
+            yield cached
+            return
+
+    with turn_deadline():
+        request = {
+            "model": decision["model"],
+            "messages": await aprepare_conversation(messages, summary_state, api_key),
+            "temperature": CHAT_TEMPERATURE,
+        }
+        async for chunk in _astream_once(request, api_key, cache, question, namespace, "chat"):
+            yield chunk
+
+
+async def alegal_answer(query, api_key):
+    decision = route(query, "legal", LEGAL_MODEL)
+    namespace = _tier_namespace(LEGAL_CACHE_NAMESPACE, decision, LEGAL_MODEL)
+    cache = get_answer_cache()
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, query, namespace=namespace)
+        if cached is not None:
+            return cached
+
+    with turn_deadline():
+        return await _aanswer_once(_legal_request(query, decision["model"]), api_key, cache, query, namespace,
+                                   "legal")
+
+
+async def alegal_stream(query, api_key):
+    decision = route(query, "legal", LEGAL_MODEL)
+    namespace = _tier_namespace(LEGAL_CACHE_NAMESPACE, decision, LEGAL_MODEL)
+    cache = get_answer_cache()
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, query, namespace=namespace)
+        if cached is not None:
+            yield cached
+            return
+
+    with turn_deadline():
+        async for chunk in _astream_once(_legal_request(query, decision["model"]), api_key, cache, query, namespace,
+                                         "legal"):
+            yield chunk
+
+
+async def aanalyze_repository(repo_info, readme, api_key, commit_sha=None):
+    cached = await asyncio.to_thread(cached_analysis, repo_info, commit_sha)
+    if cached is not None:
+        return cached
+
+    with turn_deadline():
+        chunks = chunk_readme(readme)
+        if len(chunks) > 1:
+            workers = asyncio.Semaphore(ANALYSIS_MAP_WORKERS)
+
+            async def summarize(part, chunk):
+                async with workers:
+                    return await _aanswer_once(_analysis_map_request(repo_info, chunk, part, len(chunks)),
+                                               api_key, None, None, None, "analysis_map")
+
+            with span("analysis_map"):
+                notes = await asyncio.gather(*(summarize(part, chunk) for part, chunk in enumerate(chunks, 1)))
+            request = _analysis_request(repo_info, _readme_notes(notes), True)
+        else:
+            request = _analysis_request(repo_info, chunks[0] if chunks else "(empty)", False)
+
+        cache = get_analysis_cache() if commit_sha else None
+        return await _aanswer_once(request, api_key, cache, _analysis_key(repo_info, commit_sha),
+                                   ANALYSIS_CACHE_NAMESPACE, "analysis")
@@ -0,0 +1,230 @@
+"""ASGI service exposing the NyayaBot engine over HTTP.
+
+Run with several workers behind a load balancer; every worker is stateless
+(chat history and its rolling summary travel with each request):
+
+    python nyaya_service.py --port 8000 --workers 4
+    uvicorn nyaya_service:app --port 8000 --workers 4
+
+Endpoints (JSON in, JSON out; the /stream variants answer with Server-Sent
+Events carrying {"delta": ...} chunks and a final {"done": true, ...}):
+
+    GET  /healthz
+    GET  /metrics            (Prometheus text format; see metrics.py)
+    POST /v1/chat            {"messages": [...], "summary_state": {...}}
+    POST /v1/chat/stream
+    POST /v1/legal           {"query": "..."}
+    POST /v1/legal/stream
+    POST /v1/repos/analyze   {"repo_info": {...}, "readme": "...", "commit_sha": "..." (optional)}
+
+Set NYAYA_SERVICE_TOKEN to require "Authorization: Bearer <token>" on every
+/v1 request. The OpenAI key comes from the X-OpenAI-Key header (for users who
+bring their own key); the server's OPENAI_API_KEY is used in its place only
+when NYAYA_SERVICE_TOKEN is set, so an open service never spends it.
+"""
+import argparse
+import contextlib
+import json
+import os
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import nyaya_engine
+from clients import aclose_async_clients
+from history import new_summary_state
+from key_validation import is_auth_error
+from metrics import render_prometheus
+from resilience import is_unavailable
+
+load_dotenv()
+
+SERVICE_TOKEN = os.getenv("NYAYA_SERVICE_TOKEN", "")
+CHAT_ROLES = ("user", "assistant")
+
+
+class RequestError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def _read_request(request, *required):
+    """Check the service token and return (payload, OpenAI API key)"""
+    if SERVICE_TOKEN and request.headers.get("Authorization") != f"Bearer {SERVICE_TOKEN}":
+        raise RequestError(401, "Invalid or missing service token")
+    # Only callers holding the service token may spend the server's own key
+    api_key = request.headers.get("X-OpenAI-Key") or (SERVICE_TOKEN and os.getenv("OPENAI_API_KEY"))
+    if not api_key:
+        raise RequestError(401, "OpenAI API key not found. Send X-OpenAI-Key, or set OPENAI_API_KEY "
+                                "and NYAYA_SERVICE_TOKEN on the server.")
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise RequestError(400, "Request body must be JSON")
+    if not isinstance(payload, dict):
+        raise RequestError(400, "Request body must be a JSON object")
+    missing = [field for field in required if field not in payload]
+    if missing:
+        raise RequestError(400, f"Missing fields: {', '.join(missing)}")
+    return payload, api_key
+
+
+def _error_body(e):
+    # Clients use the code to tell a rejected OpenAI key, or OpenAI being
+    # unavailable (its circuit breaker is open), from other failures
+    if is_auth_error(e):
+        return {"error": str(e), "code": "invalid_api_key"}
+    if is_unavailable(e):
+        return {"error": str(e), "code": e.code}
+    return {"error": str(e)}
+
+
+def _error(e):
+    if isinstance(e, RequestError):
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    if is_unavailable(e):
+        return JSONResponse(_error_body(e), status_code=503, headers={"Retry-After": str(round(e.retry_in))})
+    return JSONResponse(_error_body(e), status_code=401 if is_auth_error(e) else 502)
+
+
+def _chat_messages(payload):
+    messages = payload["messages"]
+    if not isinstance(messages, list) or not messages:
+        raise RequestError(400, "messages must be a non-empty list")
+    for msg in messages:
+        if not isinstance(msg, dict) or msg.get("role") not in CHAT_ROLES or not isinstance(msg.get("content"), str):
+            raise RequestError(400, f"Each message needs a role ({', '.join(CHAT_ROLES)}) and string content")
+    return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+
+def _summary_state(payload):
+    summary_state = payload.get("summary_state")
+    if not summary_state:
+        return new_summary_state()
+    if isinstance(summary_state, dict):
+        summary, covered = summary_state.get("summary"), summary_state.get("covered")
+        if isinstance(summary, str) and type(covered) is int and covered >= 0:
+            return {"summary": summary, "covered": covered}
+    raise RequestError(400, 'summary_state must be {"summary": <string>, "covered": <count>}, '
+                            "as returned with the previous answer")
+
+
+def _text(payload, field):
+    value = payload[field]
+    if not isinstance(value, str) or not value.strip():
+        raise RequestError(400, f"{field} must be a non-empty string")
+    return value
+
+
+def _sse(data):
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _event_stream(chunks, final=None):
+    """Wrap an async text generator as Server-Sent Events"""
+    async def events():
+        try:
+            async for chunk in chunks:
+                yield _sse({"delta": chunk})
+        except Exception as e:
+            yield _sse(_error_body(e))
+            return
+        yield _sse(dict(final() if final else {}, done=True))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def metrics(request):
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def chat(request):
+    try:
+        payload, api_key = await _read_request(request, "messages")
+        messages = _chat_messages(payload)
+        summary_state = _summary_state(payload)
+        answer = await nyaya_engine.achat_answer(messages, summary_state, api_key)
+        return JSONResponse({"answer": answer, "summary_state": summary_state})
+    except Exception as e:
+        return _error(e)
+
+
+async def chat_stream(request):
+    try:
+        payload, api_key = await _read_request(request, "messages")
+        messages = _chat_messages(payload)
+        summary_state = _summary_state(payload)
+    except Exception as e:
+        return _error(e)
+    chunks = nyaya_engine.astream_chat(messages, summary_state, api_key)
+    return _event_stream(chunks, lambda: {"summary_state": summary_state})
+
+
+async def legal(request):
+    try:
+        payload, api_key = await _read_request(request, "query")
+        return JSONResponse({"answer": await nyaya_engine.alegal_answer(_text(payload, "query"), api_key)})
+    except Exception as e:
+        return _error(e)
+
+
+async def legal_stream(request):
+    try:
+        payload, api_key = await _read_request(request, "query")
+        query = _text(payload, "query")
+    except Exception as e:
+        return _error(e)
+    return _event_stream(nyaya_engine.alegal_stream(query, api_key))
+
+
+async def analyze(request):
+    try:
+        payload, api_key = await _read_request(request, "repo_info", "readme")
+        analysis = await nyaya_engine.aanalyze_repository(payload["repo_info"], payload["readme"], api_key,
+                                                          payload.get("commit_sha"))
+        return JSONResponse({"analysis": analysis})
+    except Exception as e:
+        return _error(e)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await aclose_async_clients()
+
+
+app = Starlette(
+    routes=[
+        Route("/healthz", healthz),
+        Route("/metrics", metrics),
+        Route("/v1/chat", chat, methods=["POST"]),
+        Route("/v1/chat/stream", chat_stream, methods=["POST"]),
+        Route("/v1/legal", legal, methods=["POST"]),
+        Route("/v1/legal/stream", legal_stream, methods=["POST"]),
+        Route("/v1/repos/analyze", analyze, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the NyayaBot engine over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+    uvicorn.run("nyaya_service:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import re
+
+from history import count_tokens
+
+# README chunking settings (override with environment variables)
+README_CHUNK_TOKENS = int(os.getenv("NYAYA_README_CHUNK_TOKENS", "1500"))
+README_MAX_CHUNKS = int(os.getenv("NYAYA_README_MAX_CHUNKS", "12"))
+
+HEADING = re.compile(r"^#{1,6}\s", re.MULTILINE)
+# Badges, images and HTML comments say nothing about what a project does
+NOISE = re.compile(r"^\s*(?:\[!\[.*|!\[.*|<img\b.*|<!--.*?-->)\s*$", re.MULTILINE)
+BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def clean_readme(text):
+    """Drop badge and image lines and collapse runs of blank lines"""
+    return BLANK_LINES.sub("\n\n", NOISE.sub("", text)).strip()
+
+
+def split_sections(text):
+    """Split markdown at its headings; each section keeps its heading"""
+    starts = [match.start() for match in HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = [text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(text)])]
+    return [section for section in sections if section]
+
+
+def _split_long(section, chunk_tokens):
+    """Split a section over the budget at paragraph breaks (hard-cut paragraphs that are still too long)"""
+    pieces = []
+    for paragraph in section.split("\n\n"):
+        while count_tokens(paragraph) > chunk_tokens:
+            cut = len(paragraph) * chunk_tokens // count_tokens(paragraph)
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:]
+        pieces.append(paragraph)
+    return pieces
+
+
+def chunk_readme(text, chunk_tokens=README_CHUNK_TOKENS, max_chunks=README_MAX_CHUNKS):
+    """Split a README into chunks of at most `chunk_tokens`, along section
+    boundaries where possible.
+
+    Adjacent small sections are packed together so a README with many short
+    sections doesn't become many tiny requests. At most `max_chunks` chunks
+    are returned (the start of a README is where projects describe
+    themselves, so the tail is dropped).
+    """
+    chunks = []
+    current, used = [], 0
+    for section in split_sections(clean_readme(text)):
+        for piece in _split_long(section, chunk_tokens) if count_tokens(section) > chunk_tokens else [section]:
+            cost = count_tokens(piece)
+            if current and used + cost > chunk_tokens:
+                chunks.append("\n\n".join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += cost
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks[:max_chunks]
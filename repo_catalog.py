@@ -0,0 +1,405 @@
+"""Offline catalogue of legal-tech repositories with instant local search.
+
+A crawl harvests repository metadata for a set of seed searches from the
+GitHub search API, plus a short extract of each README, into a SQLite
+database with an FTS5 full-text index. The "Search Legal Tech Repositories"
+view then searches that index (full text over name, description, topics and
+README, with language, stars and last-update filters) in milliseconds,
+without spending GitHub's search quota:
+
+    python repo_catalog.py sync              # first run: everything; later: repos pushed since the last sync
+    python repo_catalog.py sync --full       # refetch everything and drop repos no longer found
+    python repo_catalog.py search "contract analysis" --language Python
+    python repo_catalog.py stats
+
+Incremental syncs only ask GitHub for repositories pushed since the last
+sync (a day of overlap absorbs clock skew), and READMEs are only fetched for
+repositories that are new or were pushed. The app also runs an incremental
+sync in the background once the catalogue is older than
+NYAYA_CATALOG_REFRESH_HOURS. Star counts of repositories that weren't pushed
+are refreshed by the next --full sync.
+"""
+import argparse
+import contextlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from clients import github_get
+from readme_chunks import clean_readme
+
+# Catalogue settings (override with environment variables)
+CATALOG_PATH = os.getenv("NYAYA_CATALOG_PATH", os.path.join(".nyaya_cache", "catalog.db"))
+# Seed searches the crawl harvests (each yields at most GitHub's 1000 results)
+CATALOG_QUERIES = [query.strip() for query in os.getenv(
+    "NYAYA_CATALOG_QUERIES",
+    "legal tech;legaltech;law nlp;legal nlp;contract analysis;court judgments;case law;indian law;"
+    "legal documents;legal ai;topic:legal-tech;topic:legaltech;topic:law",
+).split(";") if query.strip()]
+# Start an incremental sync in the background once the last one is this old (0 = never)
+CATALOG_REFRESH_HOURS = float(os.getenv("NYAYA_CATALOG_REFRESH_HOURS", "24"))
+CATALOG_SUMMARY_CHARS = int(os.getenv("NYAYA_CATALOG_SUMMARY_CHARS", "500"))
+CATALOG_README_WORKERS = int(os.getenv("NYAYA_CATALOG_README_WORKERS", "4"))
+# Longest wait for the search quota to reset before a sync gives up (seconds)
+CATALOG_MAX_WAIT = float(os.getenv("NYAYA_CATALOG_MAX_WAIT", "70"))
+
+PAGE_SIZE = 100
+MAX_PAGES = 10
+SORTS = {"best match": None, "stars": "r.stars DESC", "forks": "r.forks DESC", "updated": "r.updated DESC"}
+# Fields of a GitHub search result the app uses; the rest isn't stored
+ITEM_FIELDS = ("id", "name", "full_name", "html_url", "description", "language", "stargazers_count",
+               "forks_count", "open_issues_count", "topics", "default_branch", "pushed_at", "updated_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repos (
+    id INTEGER PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    language TEXT,
+    stars INTEGER NOT NULL,
+    forks INTEGER NOT NULL,
+    updated TEXT NOT NULL,
+    readme_summary TEXT NOT NULL DEFAULT '',
+    item TEXT NOT NULL,
+    synced REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repos_stars ON repos (stars);
+CREATE INDEX IF NOT EXISTS repos_language ON repos (language, stars);
+CREATE INDEX IF NOT EXISTS repos_updated ON repos (updated);
+CREATE VIRTUAL TABLE IF NOT EXISTS repos_fts USING fts5(
+    full_name, description, topics, readme_summary, tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+WORD = re.compile(r"\w+")
+MARKDOWN_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+
+
+def compact_item(item):
+    """The fields of a GitHub search result the app needs"""
+    compact = {field: item.get(field) for field in ITEM_FIELDS}
+    compact["owner"] = {"login": (item.get("owner") or {}).get("login")}
+    return compact
+
+
+def readme_summary(text, limit=CATALOG_SUMMARY_CHARS):
+    """The opening prose of a README (no headings, code, tables or HTML), up to `limit` characters"""
+    paragraphs = []
+    for paragraph in clean_readme(text).split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph or paragraph[0] in "#`<|>-*=" or paragraph.startswith("    "):
+            continue
+        paragraphs.append(" ".join(MARKDOWN_LINK.sub(r"\1", paragraph).split()))
+        if sum(len(p) for p in paragraphs) >= limit:
+            break
+    return " ".join(paragraphs)[:limit]
+
+
+def _fts_query(text):
+    # Every word must match, as a prefix so results appear while typing
+    return " ".join(f'"{word}"*' for word in WORD.findall(text.lower()))
+
+
+class RepoCatalog:
+    """Repository metadata and README extracts in one SQLite file, with an
+    FTS5 index kept in step on every write. Connections are pooled rather
+    than kept per thread: Streamlit runs every rerun on a new thread, so a
+    connection per thread would open one per rerun."""
+
+    def __init__(self, path=CATALOG_PATH, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self.last_error = None
+        self._idle = queue.SimpleQueue()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db, db:
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Borrow an idle connection, or open one if every connection is in use"""
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            db = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield db
+        finally:
+            self._idle.put(db)
+
+    def _meta(self, key, default=None):
+        with self._connection() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def count(self):
+        with self._connection() as db:
+            return db.execute("SELECT count(*) FROM repos").fetchone()[0]
+
+    def last_sync(self):
+        """When the last completed sync started (epoch seconds), or None"""
+        value = self._meta("last_sync")
+        return float(value) if value is not None else None
+
+    def upsert(self, items, synced):
+        """Store search results; returns the ids of repositories that are new or were pushed since stored"""
+        changed = []
+        with self._connection() as db, db:
+            for item in items:
+                item = compact_item(item)
+                updated = item["pushed_at"] or item["updated_at"] or ""
+                row = db.execute("SELECT updated, readme_summary FROM repos WHERE id = ?", (item["id"],)).fetchone()
+                summary = row[1] if row else ""
+                if row is None or row[0] != updated:
+                    changed.append(item["id"])
+                db.execute(
+                    "INSERT INTO repos (id, full_name, language, stars, forks, updated, readme_summary, item, synced) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET full_name = excluded.full_name, "
+                    "language = excluded.language, stars = excluded.stars, forks = excluded.forks, "
+                    "updated = excluded.updated, item = excluded.item, synced = excluded.synced",
+                    (item["id"], item["full_name"], item["language"], item["stargazers_count"] or 0,
+                     item["forks_count"] or 0, updated, summary, json.dumps(item), synced))
+                self._index(db, item, summary)
+        return changed
+
+    @staticmethod
+    def _index(db, item, summary):
+        db.execute("DELETE FROM repos_fts WHERE rowid = ?", (item["id"],))
+        db.execute("INSERT INTO repos_fts (rowid, full_name, description, topics, readme_summary) "
+                   "VALUES (?, ?, ?, ?, ?)",
+                   (item["id"], item["full_name"].replace("/", " ").replace("-", " ").replace("_", " "),
+                    item["description"] or "", " ".join(item["topics"] or []).replace("-", " "), summary))
+
+    def save_summary(self, repo_id, summary):
+        with self._connection() as db, db:
+            row = db.execute("SELECT item FROM repos WHERE id = ?", (repo_id,)).fetchone()
+            if row is None:
+                return
+            db.execute("UPDATE repos SET readme_summary = ? WHERE id = ?", (summary, repo_id))
+            self._index(db, json.loads(row[0]), summary)
+
+    def _filters(self, query, language, min_stars, updated_since):
+        joins, where, params = "", [], []
+        match = _fts_query(query or "")
+        if match:
+            joins = "JOIN repos_fts ON repos_fts.rowid = r.id"
+            where.append("repos_fts MATCH ?")
+            params.append(match)
+        if language:
+            where.append("r.language = ?")
+            params.append(language)
+        if min_stars:
+            where.append("r.stars >= ?")
+            params.append(min_stars)
+        if updated_since:
+            where.append("r.updated >= ?")
+            params.append(updated_since)
+        return joins, (" WHERE " + " AND ".join(where)) if where else "", params, bool(match)
+
+    def search(self, query="", language=None, min_stars=0, updated_since=None, sort="best match", limit=10,
+               offset=0):
+        """Repositories matching every word of `query` (as prefixes) and the
+        filters, as {"total_count", "items"} like a GitHub search. `updated_since`
+        is an ISO 8601 date; "best match" ranks by BM25, weighting names and
+        descriptions over README text, or by stars without a query."""
+        joins, where, params, matched = self._filters(query, language, min_stars, updated_since)
+        order = SORTS.get(sort) or ("bm25(repos_fts, 5.0, 3.0, 3.0, 1.0)" if matched else "r.stars DESC")
+        with self._connection() as db:
+            total = db.execute(f"SELECT count(*) FROM repos r {joins}{where}", params).fetchone()[0]
+            rows = db.execute(f"SELECT r.item, r.readme_summary FROM repos r {joins}{where} ORDER BY {order}, r.id "
+                              f"LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+        return {"total_count": total,
+                "items": [dict(json.loads(item), readme_summary=summary) for item, summary in rows]}
+
+    def facets(self, query="", min_stars=0, updated_since=None, limit=15):
+        """Languages of the repositories matching the query and filters, most common first, with counts"""
+        joins, where, params, _ = self._filters(query, None, min_stars, updated_since)
+        where += (" AND " if where else " WHERE ") + "r.language IS NOT NULL"
+        with self._connection() as db:
+            return db.execute(
+                f"SELECT r.language, count(*) FROM repos r {joins}{where} GROUP BY r.language "
+                f"ORDER BY count(*) DESC, r.language LIMIT ?", params + [limit]).fetchall()
+
+    def _search_page(self, query, page, headers):
+        params = {"q": query, "sort": "updated", "order": "desc", "per_page": PAGE_SIZE, "page": page}
+        for _ in range(2):
+            response = github_get("/search/repositories", headers=headers, params=params)
+            if response.status_code in (403, 429) and self._wait_for_quota(response):
+                continue
+            response.raise_for_status()
+            # Out of search quota: wait here rather than fail the next page
+            self._wait_for_quota(response)
+            return response.json()
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _wait_for_quota(response):
+        """Sleep until the search quota resets if it is spent; False if it isn't spent"""
+        if response.headers.get("X-RateLimit-Remaining") != "0":
+            return False
+        wait = float(response.headers.get("X-RateLimit-Reset", time.time())) - time.time() + 1
+        if wait > CATALOG_MAX_WAIT:
+            raise RuntimeError(f"GitHub search quota spent for another {wait:.0f}s; sync again later")
+        time.sleep(max(wait, 0))
+        return True
+
+    def _fetch_summary(self, repo_id, full_name, headers):
+        headers = dict(headers or {}, Accept="application/vnd.github.v3.raw")
+        response = github_get(f"/repos/{full_name}/readme", headers=headers)
+        if response.status_code == 404:
+            return repo_id, ""
+        response.raise_for_status()
+        return repo_id, readme_summary(response.text)
+
+    def sync(self, queries=None, headers=None, full=False, readmes=True, log=None):
+        """Harvest the seed searches into the catalogue; returns counts of what changed.
+
+        Without `full`, only repositories pushed since the last sync are
+        fetched. With `full`, everything is fetched and repositories no longer
+        found are dropped.
+        """
+        queries = CATALOG_QUERIES if queries is None else queries
+        started = time.time()
+        since = None if full else self.last_sync()
+        qualifier = ""
+        if since is not None:
+            day = datetime.fromtimestamp(since, timezone.utc) - timedelta(days=1)
+            qualifier = f" pushed:>={day.strftime('%Y-%m-%d')}"
+        stats = {"seen": 0, "changed": 0, "readmes": 0, "removed": 0}
+        changed = {}
+        for query in queries:
+            for page in range(1, MAX_PAGES + 1):
+                items = self._search_page(query + qualifier, page, headers).get("items", [])
+                stats["seen"] += len(items)
+                for repo_id in self.upsert(items, started):
+                    changed[repo_id] = next(item["full_name"] for item in items if item["id"] == repo_id)
+                if len(items) < PAGE_SIZE:
+                    break
+            if log:
+                log(f"{query!r}: {stats['seen']} seen, {len(changed)} new or pushed so far")
+        stats["changed"] = len(changed)
+
+        if readmes and changed:
+            with ThreadPoolExecutor(max_workers=CATALOG_README_WORKERS, thread_name_prefix="catalog-readme") as pool:
+                futures = [pool.submit(self._fetch_summary, repo_id, full_name, headers)
+                           for repo_id, full_name in changed.items()]
+                for future in futures:
+                    try:
+                        self.save_summary(*future.result())
+                        stats["readmes"] += 1
+                    except Exception as e:
+                        # A missing README extract only makes the repository harder to find
+                        if log:
+                            log(f"README skipped: {e}")
+
+        with self._connection() as db, db:
+            if full:
+                stale = [row[0] for row in db.execute("SELECT id FROM repos WHERE synced < ?", (started,))]
+                db.executemany("DELETE FROM repos_fts WHERE rowid = ?", [(repo_id,) for repo_id in stale])
+                db.executemany("DELETE FROM repos WHERE id = ?", [(repo_id,) for repo_id in stale])
+                stats["removed"] = len(stale)
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sync', ?)", (str(started),))
+        return stats
+
+    def refresh_in_background(self, headers=None):
+        """Start an incremental sync in a background thread if the catalogue is
+        stale; returns True if one was started"""
+        last = self.last_sync()
+        if not CATALOG_REFRESH_HOURS or last is None or time.time() - last < CATALOG_REFRESH_HOURS * 3600:
+            return False
+        with self._refresh_lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.sync(headers=headers)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="catalog-refresh", daemon=True).start()
+        return True
+
+    def summary(self):
+        """Size and freshness for display"""
+        return {"repositories": self.count(), "last_sync": self.last_sync(), "refreshing": self._refreshing,
+                "last_error": self.last_error}
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_repo_catalog():
+    """Get the process-wide repository catalogue"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = RepoCatalog()
+        return _catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and search the offline legal-tech repository catalogue")
+    parser.add_argument("--path", default=CATALOG_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser("sync", help="harvest repositories from GitHub (incremental after the first run)")
+    sync.add_argument("--full", action="store_true", help="refetch everything and drop repositories no longer found")
+    sync.add_argument("--no-readmes", action="store_true", help="skip README extracts")
+    sync.add_argument("--query", action="append", help="seed search (repeatable; default NYAYA_CATALOG_QUERIES)")
+
+    search = commands.add_parser("search", help="search the catalogue")
+    search.add_argument("text", nargs="?", default="")
+    search.add_argument("--language")
+    search.add_argument("--min-stars", type=int, default=0)
+    search.add_argument("--sort", choices=list(SORTS), default="best match")
+    search.add_argument("-n", type=int, default=10)
+
+    commands.add_parser("stats", help="catalogue size and last sync")
+
+    args = parser.parse_args(argv)
+    catalog = RepoCatalog(args.path)
+    if args.command == "sync":
+        token = os.getenv("GITHUB_TOKEN")
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if token:
+            headers["Authorization"] = f"token {token}"
+        started = time.perf_counter()
+        stats = catalog.sync(args.query, headers, full=args.full, readmes=not args.no_readmes,
+                             log=lambda message: print(message, file=sys.stderr))
+        print(json.dumps(dict(stats, repositories=catalog.count(),
+                              elapsed_s=round(time.perf_counter() - started, 1)), indent=2))
+    elif args.command == "search":
+        started = time.perf_counter()
+        results = catalog.search(args.text, args.language, args.min_stars, sort=args.sort, limit=args.n)
+        elapsed = (time.perf_counter() - started) * 1000
+        for item in results["items"]:
+            print(f"⭐ {item['stargazers_count']:>6}  {item['full_name']}  ({item['language'] or '-'})")
+        print(f"{results['total_count']} repositories in {elapsed:.1f} ms", file=sys.stderr)
+    elif args.command == "stats":
+        last = catalog.last_sync()
+        print(f"{catalog.count()} repositories, last sync "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(last)) if last else 'never'}")
+
+
+if __name__ == "__main__":
+    main()
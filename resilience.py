@@ -0,0 +1,383 @@
+"""Retries, deadlines, hedging and circuit breaking for upstream calls.
+
+Every call to OpenAI and the GitHub API goes through call() (or acall() from
+async code), which:
+
+- gives the whole call, retries included, a deadline; each attempt gets the
+  time left as its timeout, so a slow upstream can't hold a session forever.
+  Calls made inside turn_deadline() share one deadline, so a chat turn's
+  summarization and completion together can't take longer than a single call
+- retries timeouts, connection errors, 429s and 5xx responses with jittered
+  exponential backoff, waiting as long as a Retry-After header asks
+- optionally hedges: when an attempt is slower than the recent p95 latency of
+  calls like it (same upstream and latency key, e.g. operation and model), a
+  duplicate is sent and whichever answers first is used
+- keeps a circuit breaker per upstream: after consecutive failures, calls fail
+  at once with UpstreamUnavailable until a trial call succeeds, so the apps
+  can fall back to offline answers instead of waiting on an outage
+
+429s don't trip the breaker: they are about one key's quota, not the
+upstream's health.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from email.utils import parsedate_to_datetime
+
+from metrics import BREAKER_TRANSITIONS, HEDGES, METRICS_ENABLED, RETRIES
+
+# Resilience settings (override with environment variables)
+# Seconds an upstream call, or every call of a turn_deadline(), may take in total, retries included
+DEADLINE_SECONDS = float(os.getenv("NYAYA_DEADLINE", "90"))
+RETRY_ATTEMPTS = int(os.getenv("NYAYA_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("NYAYA_RETRY_BASE_DELAY", "0.5"))
+# A Retry-After longer than this is not waited for
+RETRY_MAX_DELAY = float(os.getenv("NYAYA_RETRY_MAX_DELAY", "20"))
+# Comma-separated upstreams ("openai", "github") whose calls are hedged
+HEDGE_UPSTREAMS = frozenset(name.strip() for name in os.getenv("NYAYA_HEDGE", "").split(",") if name.strip())
+# Seconds before a hedge is sent; 0 uses the upstream's observed p95 latency
+HEDGE_DELAY = float(os.getenv("NYAYA_HEDGE_DELAY", "0"))
+BREAKER_FAILURES = int(os.getenv("NYAYA_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("NYAYA_BREAKER_RESET_SECONDS", "30"))
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# Transport failures of openai, requests and the standard library, by class name
+# so neither SDK has to be imported to recognize them
+TRANSPORT_ERRORS = frozenset({"APIConnectionError", "ConnectionError", "Timeout", "TimeoutError"})
+# Latency samples kept per upstream and latency key, and needed before hedging on the p95
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+# When the calls of the current turn must be done by (time.monotonic()), or None
+_turn_expires = contextvars.ContextVar("nyaya_turn_expires", default=None)
+
+
+class UpstreamUnavailable(RuntimeError):
+    """An upstream's circuit breaker is open; `retry_in` is seconds until the next trial call"""
+
+    code = "upstream_unavailable"
+
+    def __init__(self, upstream, retry_in):
+        super().__init__(f"{upstream} is unavailable; trying again in {retry_in:.0f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+class RetryableResponse(Exception):
+    """Raised by an attempt to retry an HTTP response (e.g. a 503) that isn't an exception itself"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+def is_unavailable(error):
+    """True if an exception means the upstream is down (locally or as reported by the service)"""
+    return getattr(error, "code", None) == UpstreamUnavailable.code
+
+
+def _status(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_transport_error(error):
+    return any(cls.__name__ in TRANSPORT_ERRORS for cls in type(error).__mro__)
+
+
+def is_retryable(error):
+    return _is_transport_error(error) or _status(error) in RETRY_STATUSES
+
+
+def is_upstream_failure(error):
+    """Failures that count against the circuit breaker: the upstream is down or too slow"""
+    status = _status(error)
+    return _is_transport_error(error) or (status is not None and status >= 500)
+
+
+def retry_after(error):
+    """Seconds asked for by the Retry-After (or retry-after-ms) header of a failed response, or None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Closed until `failures` consecutive upstream failures, then open for
+    `reset_seconds`. After that one trial call is let through (half-open): its
+    success closes the breaker, its failure opens it again."""
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened = 0.0
+        # When the trial call of the half-open state started (a cancelled trial never reports back)
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if METRICS_ENABLED:
+                BREAKER_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def before_call(self):
+        """Raise UpstreamUnavailable unless a call may go through now"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened >= self.reset_seconds:
+                self._set_state("half_open")
+                self._trial = None
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if self.state == "half_open" and (self._trial is None or now - self._trial >= self.reset_seconds):
+                self._trial = now
+                return
+            retry_in = max(self._opened + self.reset_seconds - time.monotonic(), 0.0)
+        raise UpstreamUnavailable(self.name, retry_in)
+
+    def record(self, error=None):
+        """Record the outcome of a call let through by before_call()"""
+        with self._lock:
+            if error is None or not is_upstream_failure(error):
+                self._consecutive = 0
+                self._trial = None
+                self._set_state("closed")
+                return
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                self._opened = time.monotonic()
+                self._trial = None
+                self._set_state("open")
+
+
+class Upstream:
+    """Circuit breaker and recent latencies of one upstream. Latencies are kept
+    per key, so a short summary call doesn't set the p95 of long completions."""
+
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            window = self._latencies.get(key)
+            if window is None:
+                window = self._latencies[key] = deque(maxlen=LATENCY_WINDOW)
+            window.append(seconds)
+
+    def hedge_delay(self, key):
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        if HEDGE_DELAY:
+            return HEDGE_DELAY
+        with self._lock:
+            window = self._latencies.get(key)
+            if window is None or len(window) < LATENCY_MIN_SAMPLES:
+                return None
+            latencies = sorted(window)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+_hedge_pool = None
+
+
+def get_upstream(name):
+    """Get the process-wide state of an upstream ("openai", "github")"""
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            upstream = _upstreams[name] = Upstream(name)
+        return upstream
+
+
+@contextlib.contextmanager
+def turn_deadline(seconds=DEADLINE_SECONDS):
+    """Give every upstream call made inside the block one shared deadline
+    (a nested block can shorten it, never extend it)"""
+    outer = _turn_expires.get()
+    expires = time.monotonic() + seconds
+    _turn_expires.set(expires if outer is None else min(outer, expires))
+    try:
+        yield
+    finally:
+        # Not a token reset: a generator may be closed from another context
+        _turn_expires.set(outer)
+
+
+def _expires(name, deadline):
+    """When a call started now must be done by, bounded by the current turn's deadline"""
+    now = time.monotonic()
+    expires = now + (DEADLINE_SECONDS if deadline is None else deadline)
+    turn = _turn_expires.get()
+    if turn is not None:
+        if turn <= now:
+            raise TimeoutError(f"{name}: the deadline for this turn has passed")
+        expires = min(expires, turn)
+    return expires
+
+
+def _backoff(error, attempt, expires):
+    """Seconds to wait before the next attempt, or None to give up"""
+    if attempt >= RETRY_ATTEMPTS or not is_retryable(error):
+        return None
+    delay = retry_after(error)
+    if delay is None:
+        # Full jitter keeps sessions that failed together from retrying together
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    elif delay > RETRY_MAX_DELAY:
+        return None
+    if time.monotonic() + delay >= expires:
+        return None
+    return delay
+
+
+def _record_retry(upstream, error):
+    if METRICS_ENABLED:
+        reason = _status(error) or type(error).__name__
+        RETRIES.inc(upstream=upstream, reason=str(reason))
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _upstreams_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        return _hedge_pool
+
+
+def _hedged(name, attempt, timeout, delay):
+    pool = _get_hedge_pool()
+    first = pool.submit(contextvars.copy_context().run, attempt, timeout)
+    if wait([first], timeout=delay).done:
+        return first.result()
+    if METRICS_ENABLED:
+        HEDGES.inc(upstream=name)
+    # The slower attempt can't be cancelled; its result is dropped
+    second = pool.submit(contextvars.copy_context().run, attempt, max(timeout - delay, 0.001))
+    error = None
+    for future in as_completed([first, second]):
+        error = future.exception()
+        if error is None:
+            return future.result()
+    raise error
+
+
+async def _ahedged(name, attempt, timeout, delay):
+    first = asyncio.ensure_future(attempt(timeout))
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+        if METRICS_ENABLED:
+            HEDGES.inc(upstream=name)
+        pending.add(asyncio.ensure_future(attempt(max(timeout - delay, 0.001))))
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    return task.result()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def call(name, attempt, deadline=None, hedge=None, latency_key=""):
+    """Call an upstream with retries, a deadline, hedging and its circuit breaker.
+
+    `attempt(timeout)` makes one request, using `timeout` (the seconds left
+    before the deadline) as its timeout. `deadline` defaults to
+    DEADLINE_SECONDS, and is cut short by an enclosing turn_deadline().
+    `hedge` defaults to whether the upstream is listed in NYAYA_HEDGE; only
+    pass True for idempotent calls. Calls with the same `latency_key` share
+    the latency window hedging uses; None records nothing (e.g. for a
+    stream, which returns once it starts).
+    """
+    upstream = get_upstream(name)
+    hedge = name in HEDGE_UPSTREAMS and latency_key is not None if hedge is None else hedge
+    expires = _expires(name, deadline)
+    number = 0
+    while True:
+        number += 1
+        upstream.breaker.before_call()
+        started = time.monotonic()
+        timeout = expires - started
+        try:
+            delay = upstream.hedge_delay(latency_key) if hedge else None
+            result = _hedged(name, attempt, timeout, delay) if delay else attempt(timeout)
+        except Exception as e:
+            upstream.breaker.record(e)
+            wait_seconds = _backoff(e, number, expires)
+            if wait_seconds is None:
+                raise
+            _record_retry(name, e)
+            time.sleep(wait_seconds)
+            continue
+        upstream.breaker.record()
+        if latency_key is not None:
+            upstream.observe(latency_key, time.monotonic() - started)
+        return result
+
+
+async def acall(name, attempt, deadline=None, hedge=None, latency_key=""):
+    """call() for async code: `attempt(timeout)` returns an awaitable"""
+    upstream = get_upstream(name)
+    hedge = name in HEDGE_UPSTREAMS and latency_key is not None if hedge is None else hedge
+    expires = _expires(name, deadline)
+    number = 0
+    while True:
+        number += 1
+        upstream.breaker.before_call()
+        started = time.monotonic()
+        timeout = expires - started
+        try:
+            delay = upstream.hedge_delay(latency_key) if hedge else None
+            result = await (_ahedged(name, attempt, timeout, delay) if delay else attempt(timeout))
+        except Exception as e:
+            upstream.breaker.record(e)
+            wait_seconds = _backoff(e, number, expires)
+            if wait_seconds is None:
+                raise
+            _record_retry(name, e)
+            await asyncio.sleep(wait_seconds)
+            continue
+        upstream.breaker.record()
+        if latency_key is not None:
+            upstream.observe(latency_key, time.monotonic() - started)
+        return result
+
+
+def summary():
+    """Breaker state per upstream for display"""
+    with _upstreams_lock:
+        return {name: upstream.breaker.state for name, upstream in _upstreams.items()}
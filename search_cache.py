@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from github_cache import GITHUB_RATE_LIMIT_RESERVE, GitHubCache, cached_github_get
+from metrics import record_cache
+from single_flight import SingleFlight
+
+# Repository search cache settings (override with environment variables)
+SEARCH_CACHE_TTL = float(os.getenv("NYAYA_SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("NYAYA_SEARCH_CACHE_MAX_ENTRIES", "200"))
+# Results fetched per GitHub request, whatever the number shown at a time
+SEARCH_PAGE_SIZE = int(os.getenv("NYAYA_SEARCH_PAGE_SIZE", "30"))
+SEARCH_PREFETCH = os.getenv("NYAYA_SEARCH_PREFETCH", "1") != "0"
+
+# GitHub search only ever returns the first 1000 results of a query
+SEARCH_MAX_RESULTS = 1000
+
+# Fields the search sorts of the app can be reproduced from
+SORT_FIELDS = {"stars": "stargazers_count", "forks": "forks_count", "updated": "updated_at"}
+
+
+def fetch_search_page(query, sort, order, page, per_page, headers):
+    """One page of GitHub repository search; returns (results, remaining rate limit or None)"""
+    params = {"q": query, "sort": sort, "order": order, "per_page": per_page, "page": page}
+    response = cached_github_get("/search/repositories", headers=headers, params=params)
+    response.raise_for_status()
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    return response.json(), int(remaining) if remaining is not None else None
+
+
+class SearchCache:
+    """Cache of GitHub repository search results, keyed on (query, sort,
+    order, page) and kept for `ttl` seconds.
+
+    Pages are always fetched `page_size` results at a time, so the number of
+    results shown at once is a local slice. After a page is served, the next
+    one is fetched in the background. When every result of a query is cached
+    under one sort, other sorts are computed locally instead of searched.
+    """
+
+    def __init__(self, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES, page_size=SEARCH_PAGE_SIZE,
+                 prefetch=SEARCH_PREFETCH, fetch=fetch_search_page):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.fetch = fetch
+        self.stats = {"hits": 0, "resorted": 0, "prefetched": 0, "misses": 0}
+        self._lock = threading.Lock()
+        # (query, sort, order, page, credential) -> {"results": ..., "fetched": ...}
+        self._entries = OrderedDict()
+        self._flights = SingleFlight()
+        self._prefetcher = None
+        # Set while the search quota is down to GITHUB_RATE_LIMIT_RESERVE
+        self._quota_low = False
+
+    def _count(self, result):
+        self.stats[result] += 1
+        record_cache("search", result)
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry["fetched"] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, results, fetched):
+        self._entries[key] = {"results": results, "fetched": fetched}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _resorted(self, query, sort, order, page, credential, now):
+        """A page computed from another sort whose results are all cached, or None"""
+        if sort not in SORT_FIELDS:
+            return None
+        for other_sort in SORT_FIELDS:
+            for other_order in ("desc", "asc"):
+                first = self._get((query, other_sort, other_order, 1, credential), now)
+                if first is None or first["results"].get("incomplete_results"):
+                    continue
+                total = first["results"]["total_count"]
+                pages = [self._get((query, other_sort, other_order, n, credential), now)
+                         for n in range(1, -(-total // self.page_size) + 1)]
+                if total > SEARCH_MAX_RESULTS or any(entry is None for entry in pages):
+                    continue
+                items = [item for entry in pages for item in entry["results"]["items"]]
+                # Counts compare with counts and ISO dates with dates; items missing the field go last
+                field = SORT_FIELDS[sort]
+                items = (sorted((item for item in items if item.get(field) is not None),
+                                key=lambda item: item[field], reverse=order == "desc")
+                         + [item for item in items if item.get(field) is None])
+                start = (page - 1) * self.page_size
+                results = {"total_count": total, "incomplete_results": False,
+                           "items": items[start:start + self.page_size]}
+                return results, min(entry["fetched"] for entry in pages)
+        return None
+
+    def page(self, query, sort, order, page, headers=None, prefetched=False):
+        """One page of `page_size` results, from the cache when possible"""
+        headers = dict(headers or {})
+        credential = GitHubCache._credential(headers)
+        key = (query, sort, order, page, credential)
+        now = time.time()
+        with self._lock:
+            entry = self._get(key, now)
+            if entry is not None:
+                self._count("hits")
+                return entry["results"]
+            resorted = self._resorted(query, sort, order, page, credential, now)
+            if resorted is not None:
+                self._put(key, *resorted)
+                self._count("resorted")
+                return resorted[0]
+
+        def fetch():
+            results, remaining = self.fetch(query, sort, order, page, self.page_size, headers)
+            with self._lock:
+                self._put(key, results, time.time())
+                self._count("prefetched" if prefetched else "misses")
+            return results, remaining
+
+        # A page being prefetched is waited for, not fetched twice
+        results, remaining = self._flights.do(key, fetch)
+        if remaining is not None:
+            self._quota_low = remaining <= GITHUB_RATE_LIMIT_RESERVE
+        return results
+
+    def search(self, query, sort="stars", order="desc", start=0, count=10, headers=None):
+        """Results start..start+count-1 of a search, as {"total_count", "items"};
+        the page after the last one used is prefetched"""
+        first_page = start // self.page_size + 1
+        results = self.page(query, sort, order, first_page, headers)
+        total = min(results["total_count"], SEARCH_MAX_RESULTS)
+        last_page = max(first_page, min(start + count - 1, total - 1) // self.page_size + 1)
+        items = list(results["items"])
+        for page in range(first_page + 1, last_page + 1):
+            items.extend(self.page(query, sort, order, page, headers)["items"])
+        offset = start - (first_page - 1) * self.page_size
+        if self.prefetch and last_page * self.page_size < total:
+            self._prefetch(query, sort, order, last_page + 1, headers)
+        return {"total_count": results["total_count"], "items": items[offset:offset + count]}
+
+    def _prefetch(self, query, sort, order, page, headers):
+        key = (query, sort, order, page, GitHubCache._credential(dict(headers or {})))
+        with self._lock:
+            # Leave the remaining search quota to searches users are waiting for
+            if self._quota_low or self._get(key, time.time()) is not None:
+                return
+            if self._prefetcher is None:
+                self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-prefetch")
+        self._prefetcher.submit(self._prefetch_page, query, sort, order, page, headers)
+
+    def _prefetch_page(self, query, sort, order, page, headers):
+        try:
+            self.page(query, sort, order, page, headers, prefetched=True)
+        except Exception:
+            # A failed prefetch only means the page is fetched when it is opened
+            pass
+
+    def summary(self):
+        """Hit counts and hit rate for display"""
+        with self._lock:
+            hits = self.stats["hits"] + self.stats["resorted"]
+            total = hits + self.stats["misses"]
+            return dict(self.stats, entries=len(self._entries), hit_rate=hits / total if total else 0.0)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Get the process-wide repository search cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
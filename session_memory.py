@@ -0,0 +1,244 @@
+"""Compact chat messages and a per-process memory budget for chat sessions.
+
+Every session of app.py keeps its recent messages, and their rendered HTML,
+in server memory. To keep a worker's footprint bounded under load:
+
+- messages are Message records rather than dicts: slotted, with interned
+  roles, an epoch timestamp instead of a formatted string, and long contents
+  zlib-compressed. They read like the dicts they replace
+  (message["content"], message.get("timestamp")).
+- a process-wide SessionMemory accountant tracks the bytes each session
+  holds. Sessions idle for NYAYA_SESSION_IDLE_SECONDS, and the least recently
+  active ones whenever the total exceeds NYAYA_SESSION_MEMORY_MB, release
+  their messages. Every message is already on disk in the conversation store,
+  so a released session reloads its latest page from there when it returns.
+
+A session is never released while it is answering a question (inside
+busy()), however long the answer takes; the rest of a run is much shorter
+than NYAYA_SESSION_MIN_IDLE_SECONDS. Sessions
+with nothing in the conversation store (NYAYA_CONVERSATIONS=0) are counted
+but never released. Totals are exported as the nyaya_sessions,
+nyaya_session_memory_bytes and nyaya_session_spills_total metrics.
+"""
+import contextlib
+import os
+import sys
+import threading
+import time
+import weakref
+import zlib
+
+from metrics import METRICS_ENABLED, SESSION_MEMORY, SESSION_SPILLS, SESSIONS
+
+# Session memory settings (override with environment variables)
+SESSION_MEMORY_BUDGET = float(os.getenv("NYAYA_SESSION_MEMORY_MB", "256")) * 1024 * 1024
+SESSION_IDLE_SECONDS = float(os.getenv("NYAYA_SESSION_IDLE_SECONDS", "900"))
+# Never release a session active more recently than this (nor one answering a question)
+SESSION_MIN_IDLE_SECONDS = float(os.getenv("NYAYA_SESSION_MIN_IDLE_SECONDS", "120"))
+# Message contents at least this long are stored compressed
+MESSAGE_COMPRESS_CHARS = int(os.getenv("NYAYA_MESSAGE_COMPRESS_CHARS", "1024"))
+# Seconds between idle sweeps (a session over budget triggers one at once)
+SWEEP_INTERVAL = 10.0
+
+
+class Message:
+    """One chat message. Immutable; reads like {"role", "content", "timestamp"}."""
+
+    __slots__ = ("role", "created", "_content")
+
+    def __init__(self, role, content, created=None):
+        self.role = sys.intern(role)
+        self.created = time.time() if created is None else created
+        if len(content) >= MESSAGE_COMPRESS_CHARS:
+            packed = zlib.compress(content.encode("utf-8"))
+            # Kept only when it saves memory (a str of ASCII text is one byte per character)
+            if len(packed) < len(content):
+                content = packed
+        self._content = content
+
+    @classmethod
+    def from_dict(cls, message):
+        """A Message from a {"role", "content"[, "created"]} dict, such as a conversation store row"""
+        return cls(message["role"], message["content"], message.get("created"))
+
+    @property
+    def content(self):
+        content = self._content
+        return zlib.decompress(content).decode("utf-8") if isinstance(content, bytes) else content
+
+    @property
+    def timestamp(self):
+        return time.strftime("%H:%M", time.localtime(self.created))
+
+    def __getitem__(self, key):
+        if key not in ("role", "content", "timestamp"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def nbytes(self):
+        """Memory held by this message (the role is shared with every other message)"""
+        return sys.getsizeof(self) + sys.getsizeof(self.created) + sys.getsizeof(self._content)
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r}...)"
+
+
+def compact_messages(messages):
+    """Message records for a list of message dicts"""
+    return [Message.from_dict(message) for message in messages]
+
+
+class SessionRecord:
+    """What one session holds, as seen by the accountant. The session keeps
+    it in st.session_state, so it is forgotten when the session is."""
+
+    __slots__ = ("conversation_id", "messages", "rendered", "nbytes", "last_active", "spilled", "busy", "lock",
+                 "__weakref__")
+
+    def __init__(self):
+        self.conversation_id = None
+        self.messages = []
+        self.rendered = []
+        self.nbytes = 0
+        self.last_active = time.time()
+        self.spilled = False
+        self.busy = False
+        self.lock = threading.Lock()
+
+
+def _measure(messages, rendered):
+    total = sys.getsizeof(messages) + sys.getsizeof(rendered) + sum(sys.getsizeof(html) for html in rendered)
+    for message in messages:
+        total += message.nbytes() if isinstance(message, Message) else sys.getsizeof(message["content"])
+    return total
+
+
+class SessionMemory:
+    """Per-process accountant of chat session memory"""
+
+    def __init__(self, budget=SESSION_MEMORY_BUDGET, idle_seconds=SESSION_IDLE_SECONDS,
+                 min_idle_seconds=SESSION_MIN_IDLE_SECONDS):
+        self.budget = budget
+        self.idle_seconds = idle_seconds
+        self.min_idle_seconds = min_idle_seconds
+        self.stats = {"spilled_idle": 0, "spilled_budget": 0, "restored": 0}
+        self._records = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def register(self):
+        """A record for a new session"""
+        record = SessionRecord()
+        with self._lock:
+            self._records.add(record)
+        return record
+
+    def checkin(self, record):
+        """Mark a session active at the start of its run; True if its messages
+        were released and must be reloaded from the conversation store"""
+        with record.lock:
+            record.last_active = time.time()
+            spilled, record.spilled = record.spilled, False
+        if spilled:
+            with self._lock:
+                self.stats["restored"] += 1
+        return spilled
+
+    @contextlib.contextmanager
+    def busy(self, record):
+        """Keep a session resident for the duration of the block, which ends
+        however the run does (an error, or a rerun or stop that cuts it short)"""
+        with record.lock:
+            record.last_active = time.time()
+            record.busy = True
+        try:
+            yield
+        finally:
+            with record.lock:
+                record.last_active = time.time()
+                record.busy = False
+
+    def track(self, record, conversation_id, messages, rendered):
+        """Point the record at the session's current message and HTML lists and
+        measure them, then release other sessions if they are due"""
+        with record.lock:
+            record.conversation_id = conversation_id
+            record.messages = messages
+            record.rendered = rendered
+            record.nbytes = _measure(messages, rendered)
+            record.last_active = time.time()
+        self.sweep()
+
+    def sweep(self, force=False):
+        """Release idle sessions, then the least recently active ones while over budget"""
+        now = time.time()
+        with self._lock:
+            records = list(self._records)
+            total = sum(record.nbytes for record in records)
+            if not force and total <= self.budget and now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        for record in sorted(records, key=lambda record: record.last_active):
+            idle = now - record.last_active
+            if idle < self.min_idle_seconds or (idle < self.idle_seconds and total <= self.budget):
+                break
+            released = self._spill(record, now)
+            if released:
+                total -= released
+                reason = "idle" if idle >= self.idle_seconds else "budget"
+                with self._lock:
+                    self.stats[f"spilled_{reason}"] += 1
+                if METRICS_ENABLED:
+                    SESSION_SPILLS.inc(reason=reason)
+        self._publish()
+
+    def _spill(self, record, now):
+        with record.lock:
+            # The session may have started a run since the sweep began
+            if (record.busy or record.spilled or record.conversation_id is None
+                    or now - record.last_active < self.min_idle_seconds):
+                return 0
+            released = record.nbytes
+            record.messages.clear()
+            record.rendered.clear()
+            record.nbytes = 0
+            record.spilled = True
+        return released
+
+    def summary(self):
+        """Session counts and memory for display"""
+        with self._lock:
+            records = list(self._records)
+            stats = dict(self.stats)
+        sizes = [record.nbytes for record in records if not record.spilled]
+        return dict(stats, resident=len(sizes), spilled=len(records) - len(sizes), total_bytes=sum(sizes),
+                    max_bytes=max(sizes, default=0), mean_bytes=sum(sizes) // len(sizes) if sizes else 0,
+                    budget_bytes=int(self.budget))
+
+    def _publish(self):
+        if not METRICS_ENABLED:
+            return
+        stats = self.summary()
+        SESSIONS.set(stats["resident"], state="resident")
+        SESSIONS.set(stats["spilled"], state="spilled")
+        SESSION_MEMORY.set(stats["total_bytes"], stat="total")
+        SESSION_MEMORY.set(stats["max_bytes"], stat="max")
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_session_memory():
+    """Get the process-wide session memory accountant"""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = SessionMemory()
+        return _memory
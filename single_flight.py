@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import re
+import threading
+
+
+def flight_key(api_key, request):
+    """Key identifying an upstream request: the API key (hashed), model
+    parameters and the prompt with whitespace and case normalized"""
+    normalized = dict(request)
+    normalized["messages"] = [
+        {"role": msg["role"], "content": re.sub(r"\s+", " ", msg["content"]).strip().casefold()}
+        for msg in request["messages"]
+    ]
+    normalized["api_key"] = hashlib.sha256((api_key or "").encode()).hexdigest()
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.done = False
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls across threads (Streamlit sessions).
+
+    The first caller for a key runs the call; callers arriving while it is in
+    flight wait and share its result or exception. Streams are produced by a
+    background thread into a shared buffer, so every caller, including one
+    that joins half-way, replays the stream from the first chunk, and a
+    caller that stops reading early doesn't cut the stream short for others.
+    """
+
+    def __init__(self):
+        self.stats = {"calls": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time and share its result"""
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                with flight.cond:
+                    flight.done = True
+                    flight.cond.notify_all()
+        else:
+            with flight.cond:
+                flight.cond.wait_for(lambda: flight.done)
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, key, fn):
+        """Iterate fn() once per key at a time; every caller gets every chunk"""
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = self._streams[key] = _Flight()
+                # The producer runs in the caller's context so its trace spans land there
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._produce, key, flight, fn), daemon=True).start()
+            else:
+                self.stats["coalesced"] += 1
+        return self._consume(flight)
+
+    def _produce(self, key, flight, fn):
+        try:
+            for chunk in fn():
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    @staticmethod
+    def _consume(flight):
+        index = 0
+        while True:
+            with flight.cond:
+                flight.cond.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                chunks = flight.chunks[index:]
+                finished = flight.done and index + len(chunks) == len(flight.chunks)
+            index += len(chunks)
+            yield from chunks
+            if finished:
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+
+class _AsyncFlight:
+    def __init__(self):
+        self.chunks = []
+        self.error = None
+        self.done = False
+        self.changed = asyncio.Condition()
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of SingleFlight for the async service"""
+
+    def __init__(self):
+        self.stats = {"calls": 0, "coalesced": 0}
+        self._calls = {}
+        self._streams = {}
+
+    async def do(self, key, fn):
+        """Await fn() once per key at a time and share its result"""
+        self.stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # A cancelled caller must not cancel the shared call
+        return await asyncio.shield(task)
+
+    async def stream(self, key, fn):
+        """Iterate the async generator fn() once per key at a time"""
+        self.stats["calls"] += 1
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _AsyncFlight()
+            asyncio.ensure_future(self._produce(key, flight, fn))
+        else:
+            self.stats["coalesced"] += 1
+
+        index = 0
+        while True:
+            async with flight.changed:
+                await flight.changed.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                chunks = flight.chunks[index:]
+                finished = flight.done and index + len(chunks) == len(flight.chunks)
+            index += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if finished:
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    async def _produce(self, key, flight, fn):
+        try:
+            async for chunk in fn():
+                async with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._streams.pop(key, None)
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
@@ -0,0 +1,38 @@
+import functools
+import os
+import threading
+
+# One-time setup shared by the Streamlit apps. Streamlit re-executes an app
+# script on every interaction, but modules are imported once per process, so
+# work memoized here runs on the first page load only.
+
+_secrets = {}
+_secrets_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def load_env():
+    """Load .env into the environment once per process"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return False
+    return load_dotenv()
+
+
+def get_secret(name, default=None):
+    """A value from Streamlit secrets, falling back to the environment.
+
+    Looked up once per process; restart the app after editing secrets.toml.
+    """
+    with _secrets_lock:
+        if name not in _secrets:
+            import streamlit as st
+
+            try:
+                value = st.secrets.get(name)
+            except Exception:
+                # No secrets.toml (e.g. local development with a .env file)
+                value = None
+            _secrets[name] = value if value is not None else os.getenv(name, default)
+        return _secrets[name]
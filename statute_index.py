@@ -0,0 +1,404 @@
+"""Local BM25 index over bare-act text for grounding answers in real statutes.
+
+Build the index from the JSONL corpus in data/statutes (see its README):
+
+    python statute_index.py build data/statutes -o data/statutes.idx
+    python statute_index.py search "police refused to register FIR"
+    python statute_index.py bench --docs 50000
+
+The index is a single binary file read through mmap, so opening it is cheap
+and only the pages touched by a query are loaded:
+
+    header | term table | term strings | postings | doc lengths | doc table | doc JSON
+
+Term table records are (string offset, string length, postings offset, df),
+sorted by term so lookups are a binary search over the mapped file. Postings
+are (doc id, term frequency) pairs of little-endian uint32s, stored in
+descending order of BM25 impact so long lists can be cut short at query time.
+"""
+import argparse
+import functools
+import glob
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+# Index settings (override with environment variables)
+STATUTE_CORPUS_DIR = os.getenv("NYAYA_STATUTE_CORPUS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "statutes"))
+STATUTE_INDEX_PATH = os.getenv("NYAYA_STATUTE_INDEX", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "statutes.idx"))
+STATUTE_TOP_K = int(os.getenv("NYAYA_STATUTE_TOP_K", "3"))
+STATUTE_MIN_SCORE = float(os.getenv("NYAYA_STATUTE_MIN_SCORE", "2.0"))
+STATUTE_RELATIVE_SCORE = 0.4
+
+MAGIC = b"NYAYAIX1"
+HEADER = struct.Struct("<8sIIIIIIIId")
+TERM_RECORD = struct.Struct("<IIII")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Terms in more than this share of documents are skipped when the query has
+# rarer terms; they barely change the ranking but have the longest postings
+COMMON_TERM_RATIO = 0.25
+
+# Postings are stored highest-impact first, so scoring can stop after this many
+# per term with little effect on the top results
+MAX_POSTINGS_PER_TERM = 2000
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "to", "of", "in",
+    "on", "for", "and", "or", "not", "no", "do", "does", "did", "i", "my", "me",
+    "we", "our", "you", "your", "can", "could", "should", "would", "shall", "may",
+    "what", "how", "when", "who", "which", "it", "its", "this", "that", "with",
+    "by", "as", "at", "from", "under", "any", "such", "section", "article", "act",
+    "india", "indian", "if", "there", "their", "them", "they", "he", "she", "his",
+    "her", "him", "has", "have", "had", "so", "than", "into", "upon", "about",
+}
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SUFFIX = re.compile(r"(ing|ed|es|s)$")
+
+
+@functools.lru_cache(maxsize=65536)
+def _normalize_word(word):
+    if word in STOPWORDS:
+        return None
+    if len(word) > 4 and not word[0].isdigit():
+        return _SUFFIX.sub("", word)
+    return word
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and plurals/-ing/-ed stripped"""
+    return [t for t in map(_normalize_word, _WORD.findall(text.lower())) if t is not None]
+
+
+def section_label(doc):
+    """Human-readable reference such as 'Section 154, CrPC'"""
+    return f"{doc.get('unit', 'Section')} {doc['section']}, {doc['short']}"
+
+
+def load_corpus(paths):
+    """Yield section records from JSONL files or directories of them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl"))))
+        else:
+            files.append(path)
+    for file_path in files:
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _doc_tokens(doc):
+    # Titles are short and precise, so count them twice
+    fields = [doc["act"], doc.get("short", ""), doc.get("unit", "Section"), doc["section"],
+              doc["title"], doc["title"], doc.get("text", "")]
+    return tokenize(" ".join(fields))
+
+
+def _uint32_bytes(values):
+    data = array("I", values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _pad(blob):
+    return blob + b"\0" * (-len(blob) % 4)
+
+
+def build_index(docs, output_path):
+    """Build the index file from an iterable of section records"""
+    postings = {}
+    doc_lengths = []
+    doc_blobs = []
+    for doc_id, doc in enumerate(docs):
+        counts = {}
+        tokens = _doc_tokens(doc)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            postings.setdefault(token, []).extend((doc_id, tf))
+        doc_lengths.append(len(tokens))
+        doc_blobs.append(json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    n_docs = len(doc_lengths)
+    avgdl = sum(doc_lengths) / n_docs if n_docs else 0.0
+
+    terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+    term_strings = bytearray()
+    posting_values = []
+    term_table = bytearray()
+    for term in terms:
+        encoded = term.encode("utf-8")
+        values = postings[term]
+        # Order postings by their BM25 term-frequency component, highest first
+        pairs = sorted(zip(values[::2], values[1::2]),
+                       key=lambda p: -p[1] / (p[1] + K1 * (1 - B + B * doc_lengths[p[0]] / avgdl)))
+        values = [v for pair in pairs for v in pair]
+        term_table += TERM_RECORD.pack(len(term_strings), len(encoded), len(posting_values) // 2, len(values) // 2)
+        term_strings += encoded
+        posting_values.extend(values)
+
+    doc_table = bytearray()
+    doc_data = bytearray()
+    for blob in doc_blobs:
+        doc_table += struct.pack("<II", len(doc_data), len(blob))
+        doc_data += blob
+
+    sections = [bytes(term_table), _pad(bytes(term_strings)), _uint32_bytes(posting_values),
+                _uint32_bytes(doc_lengths), bytes(doc_table), bytes(doc_data)]
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+
+    directory = os.path.dirname(output_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A temporary file of this process's own, swapped in, so processes building
+    # the index at the same time never write to the same file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(output_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, n_docs, len(terms), *offsets, avgdl))
+            for section in sections:
+                f.write(section)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return {"docs": n_docs, "terms": len(terms), "tokens": sum(doc_lengths), "bytes": position}
+
+
+class StatuteIndex:
+    """Read-only BM25 index over a memory-mapped index file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.n_docs, self.n_terms, self._terms_off, self._strings_off, self._postings_off,
+         doclen_off, self._doctable_off, self._docdata_off, self.avgdl) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a statute index")
+        view = memoryview(self._mm)
+        self._postings = view[self._postings_off:doclen_off].cast("I")
+        self._doc_lengths = view[doclen_off:self._doctable_off].cast("I")
+        if sys.byteorder == "big":
+            self._postings = array("I", self._postings)
+            self._postings.byteswap()
+            self._doc_lengths = array("I", self._doc_lengths)
+            self._doc_lengths.byteswap()
+
+    def close(self):
+        self._postings = self._doc_lengths = None
+        self._mm.close()
+
+    def _lookup(self, term):
+        """Binary search the term table; returns (postings offset, df) or None"""
+        target = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            str_off, str_len, post_off, df = TERM_RECORD.unpack_from(self._mm, self._terms_off + mid * TERM_RECORD.size)
+            start = self._strings_off + str_off
+            candidate = self._mm[start:start + str_len]
+            if candidate < target:
+                lo = mid + 1
+            elif candidate > target:
+                hi = mid
+            else:
+                return post_off, df
+        return None
+
+    def document(self, doc_id):
+        """Load one section record from the mapped file"""
+        offset, length = struct.unpack_from("<II", self._mm, self._doctable_off + doc_id * 8)
+        start = self._docdata_off + offset
+        return json.loads(self._mm[start:start + length].decode("utf-8"))
+
+    def search(self, query, k=STATUTE_TOP_K):
+        """Return the top-k (score, doc_id) pairs for a query"""
+        terms = {}
+        for token in tokenize(query):
+            entry = self._lookup(token)
+            if entry is not None:
+                terms[token] = entry
+        if not terms:
+            return []
+
+        # Skip near-stopwords when the query has anything more specific
+        rare = {t: e for t, e in terms.items() if e[1] <= self.n_docs * COMMON_TERM_RATIO}
+        if rare:
+            terms = rare
+
+        scores = {}
+        postings = self._postings
+        doc_lengths = self._doc_lengths
+        norm = K1 / self.avgdl if self.avgdl else 0.0
+        for post_off, df in terms.values():
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            end = (post_off + min(df, MAX_POSTINGS_PER_TERM)) * 2
+            for i in range(post_off * 2, end, 2):
+                doc_id = postings[i]
+                tf = postings[i + 1]
+                denom = tf + K1 * (1 - B) + norm * B * doc_lengths[doc_id]
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / denom
+        return heapq.nlargest(k, ((score, doc_id) for doc_id, score in scores.items()))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _corpus_mtime(corpus_dir):
+    """When the corpus last changed: its newest file, or the directory itself
+    (which changes when a file is added or removed)"""
+    paths = [corpus_dir] + glob.glob(os.path.join(corpus_dir, "*.jsonl"))
+    return max(os.path.getmtime(path) for path in paths)
+
+
+def get_statute_index():
+    """Get the process-wide statute index, building it from the corpus on first
+    use, or rebuilding it if the corpus changed since it was built. Returns None
+    when neither an index nor a corpus is available."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if os.path.isdir(STATUTE_CORPUS_DIR):
+                if (not os.path.exists(STATUTE_INDEX_PATH)
+                        or _corpus_mtime(STATUTE_CORPUS_DIR) > os.path.getmtime(STATUTE_INDEX_PATH)):
+                    build_index(load_corpus([STATUTE_CORPUS_DIR]), STATUTE_INDEX_PATH)
+            elif not os.path.exists(STATUTE_INDEX_PATH):
+                return None
+            _index = StatuteIndex(STATUTE_INDEX_PATH)
+        return _index
+
+
+def retrieve_sections(query, k=STATUTE_TOP_K, min_score=STATUTE_MIN_SCORE):
+    """Top-k section records relevant to a query; empty when nothing scores well"""
+    try:
+        index = get_statute_index()
+    except (OSError, ValueError):
+        return []
+    if index is None:
+        return []
+    results = []
+    for score, doc_id in index.search(query, k):
+        # Drop weak matches and ones far below the best match
+        if score < min_score or (results and score < results[0]["score"] * STATUTE_RELATIVE_SCORE):
+            break
+        doc = index.document(doc_id)
+        doc["score"] = score
+        results.append(doc)
+    return results
+
+
+def format_sections(sections):
+    """Format retrieved sections as grounding context for the model"""
+    if not sections:
+        return ""
+    lines = ["Relevant statutory provisions from the local statute index. Prefer citing these where they apply:"]
+    for doc in sections:
+        lines.append(f"- {section_label(doc)} ({doc['act']}) – {doc['title']}: {doc.get('text', '')}")
+    return "\n".join(lines)
+
+
+def _synthetic_corpus(n_docs, words_per_doc, vocabulary_size, seed):
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}x" for i in range(vocabulary_size)]
+    # Zipf-like word frequencies, as in natural text
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+    for doc_id in range(n_docs):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=words_per_doc)
+        yield {"act": "Synthetic Act", "short": "SA", "section": str(doc_id),
+               "title": " ".join(words[:6]), "text": " ".join(words[6:])}
+
+
+def run_benchmark(n_docs, words_per_doc, vocabulary_size, queries, seed=7):
+    """Build a synthetic index and time lookups; returns a stats dict"""
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}x" for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.idx")
+        started = time.perf_counter()
+        info = build_index(_synthetic_corpus(n_docs, words_per_doc, vocabulary_size, seed), path)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = StatuteIndex(path)
+        open_ms = (time.perf_counter() - started) * 1000
+
+        timings = []
+        for _ in range(queries):
+            query = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 5)))
+            started = time.perf_counter()
+            for _, doc_id in index.search(query):
+                index.document(doc_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        index.close()
+
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(p / 100 * len(timings)))]
+
+    return dict(info, build_seconds=round(build_seconds, 2), open_ms=round(open_ms, 3),
+                queries=queries, p50_ms=round(percentile(50), 3), p95_ms=round(percentile(95), 3),
+                p99_ms=round(percentile(99), 3), max_ms=round(timings[-1], 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build, query and benchmark the local statute index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build the index from JSONL files or directories")
+    build.add_argument("paths", nargs="*", default=[STATUTE_CORPUS_DIR])
+    build.add_argument("-o", "--output", default=STATUTE_INDEX_PATH)
+
+    search = commands.add_parser("search", help="query the index")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=STATUTE_TOP_K)
+    search.add_argument("--index", default=STATUTE_INDEX_PATH)
+
+    bench = commands.add_parser("bench", help="time lookups over a synthetic corpus")
+    bench.add_argument("--docs", type=int, default=50000)
+    bench.add_argument("--words", type=int, default=60, help="tokens per document")
+    bench.add_argument("--vocabulary", type=int, default=50000)
+    bench.add_argument("--queries", type=int, default=1000)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        info = build_index(load_corpus(args.paths), args.output)
+        print(f"Indexed {info['docs']} sections, {info['terms']} terms, {info['tokens']} tokens "
+              f"into {args.output} ({info['bytes']} bytes)")
+    elif args.command == "search":
+        index = StatuteIndex(args.index)
+        for score, doc_id in index.search(args.query, args.k):
+            doc = index.document(doc_id)
+            print(f"{score:6.2f}  {section_label(doc)} – {doc['title']}")
+    elif args.command == "bench":
+        print(json.dumps(run_benchmark(args.docs, args.words, args.vocabulary, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()